@@ -0,0 +1,288 @@
+# Import necessary libraries and packages
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+import multiprocessing
+import numpy as np
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import cv2
+
+ROOT= os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from synthetic import exposure_bracket, moving_objects, noisy_image, stereo_pair, write_bracket
+from BackgroundSubtraction import BackgroundSubtraction
+from CamShift import CamShift
+from ColorQuantization import ColorQuantization
+from DenseOpticalFlow import DenseOpticalFlow
+from DepthMapforStereo import DepthMapStereo
+from EpipolarGeometry import EpipolarGeometry
+from FrameContext import FrameContext
+from HDRImages import HDRImaging
+from ImageDenoising import ImageDenoising
+from LucasKanadeOpticalFlow import LucasKanadeOpticalFlow
+from MeanShift import MeanShift
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak memory is then not reported
+    resource= None
+
+# Video analyzers, benchmarked per frame through process(), created from the box of the colored object
+VIDEO_CLASSES= {
+    'BackgroundSubtraction': lambda target: BackgroundSubtraction(),
+    'DenseOpticalFlow': lambda target: DenseOpticalFlow(),
+    'LucasKanadeOpticalFlow': lambda target: LucasKanadeOpticalFlow(),
+    'CamShift': lambda target: CamShift(track_window= target),
+    'MeanShift': lambda target: MeanShift(track_window= target)
+}
+
+# Still-image classes, benchmarked per call of their public method
+IMAGE_CLASSES= ('ColorQuantization', 'ImageDenoising', 'DepthMapStereo', 'EpipolarGeometry', 'HDRImaging')
+
+CLASSES= tuple(VIDEO_CLASSES) + IMAGE_CLASSES
+
+DEFAULT_RESOLUTIONS= ('320x240', '640x480', '1280x720')
+
+def parse_resolution(text):
+    '''Parse a WIDTHxHEIGHT string into (width, height)'''
+    try:
+        width, height= (int(v) for v in text.lower().split('x'))
+    except ValueError:
+        raise ValueError(f'Invalid resolution {text!r}, expected WIDTHxHEIGHT.')
+    if width < 64 or height < 64:
+        raise ValueError(f'Resolution {text!r} is too small, the minimum is 64x64.')
+    return width, height
+
+def peak_rss():
+    '''Return the peak resident memory of this process in MB, or None if unknown'''
+    if resource is None:
+        return None
+    peak= resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / (1 << 10)
+
+def summarize(latencies, elapsed):
+    '''Return the call count, calls per second and latency statistics in ms of timed calls'''
+    latencies= np.array(latencies) * 1000
+    return {
+        'calls': len(latencies),
+        'fps': len(latencies) / elapsed if elapsed > 0 else None,
+        'latency_ms': {
+            'mean': float(latencies.mean()),
+            'p50': float(np.percentile(latencies, 50)),
+            'p90': float(np.percentile(latencies, 90)),
+            'p99': float(np.percentile(latencies, 99)),
+            'max': float(latencies.max())
+        }
+    }
+
+def bench_video(name, width, height, frames, seed):
+    '''Time process() of a video analyzer on every frame of a synthetic video, after the first'''
+    analyzer= None
+    latencies= []
+    elapsed= 0.0
+    for index, (frame, boxes) in enumerate(moving_objects(width, height, frames, seed= seed)):
+        ctx= FrameContext(frame, index)
+        if analyzer is None:
+            # The first frame starts the sequence, e.g. the previous frame or the target histogram
+            analyzer= VIDEO_CLASSES[name](boxes[0])
+            analyzer.process(ctx)
+            continue
+        start= time.perf_counter()
+        analyzer.process(ctx)
+        latency= time.perf_counter() - start
+        latencies.append(latency)
+        elapsed += latency
+    return summarize(latencies, elapsed), {}
+
+def _stereo_quality(left, right, truth):
+    '''Return the fraction of valid pixels and of valid pixels more than 1 px off the truth'''
+    disparity= DepthMapStereo(None, None).engine.compute(left, right)
+    valid= disparity >= 0
+    bad= valid & (np.abs(disparity - truth) > 1)
+    return {'valid_fraction': float(valid.mean()), 'bad_pixel_fraction': float(bad.sum() / max(valid.sum(), 1))}
+
+def bench_image(name, width, height, repeat, seed, work_dir):
+    '''Time the public method of a still-image class on synthetic inputs written to work_dir'''
+    quality= {}
+    if name in ('ColorQuantization', 'ImageDenoising'):
+        image_path= os.path.join(work_dir, 'image.png')
+        cv2.imwrite(image_path, noisy_image(width, height, seed= seed))
+        instance= ColorQuantization(image_path) if name == 'ColorQuantization' else ImageDenoising(image_path)
+        call= instance.quantize if name == 'ColorQuantization' else instance.denoise
+    elif name in ('DepthMapStereo', 'EpipolarGeometry'):
+        left, right, truth= stereo_pair(width, height, seed= seed)
+        left_path, right_path= os.path.join(work_dir, 'left.png'), os.path.join(work_dir, 'right.png')
+        cv2.imwrite(left_path, left)
+        cv2.imwrite(right_path, right)
+        if name == 'DepthMapStereo':
+            call= DepthMapStereo(left_path, right_path).compute_depth_map
+            quality= _stereo_quality(left, right, truth)
+        else:
+            call= EpipolarGeometry(left_path, right_path).detect
+    else:
+        images, exposure_times, shifts= exposure_bracket(width, height, seed= seed)
+        call= HDRImaging(write_bracket(os.path.join(work_dir, 'bracket'), images, exposure_times)).create_hdr_image
+
+    # Without sinks the classes neither display nor write anything
+    latencies= []
+
+    # One untimed call, so lazy initialization inside OpenCV is not measured
+    result= call()
+    for _ in range(repeat):
+        start= time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+
+    if name == 'EpipolarGeometry' and result is not None:
+        quality= {'inliers': int(len(result.points_left))}
+
+    # Mean time per call of every stage recorded by the class, e.g. decode, compute and encode
+    stats= summarize(latencies, sum(latencies))
+    histograms= call.__self__.metrics.histograms
+    stats['stages_ms']= {stage: histogram.sum / (repeat + 1) * 1000 for stage, histogram in histograms.items()}
+    return stats, quality
+
+def run_case(name, resolution, frames, repeat, seed):
+    '''Benchmark one class at one resolution, meant to run in a fresh process so peak memory is its own'''
+    width, height= parse_resolution(resolution)
+    baseline_rss= peak_rss()
+    previous_dir= os.getcwd()
+    with tempfile.TemporaryDirectory(prefix= 'benchmark_') as work_dir:
+        # Keep anything written under output/ out of the repository
+        os.chdir(work_dir)
+        try:
+            if name in VIDEO_CLASSES:
+                stats, quality= bench_video(name, width, height, frames, seed)
+            else:
+                stats, quality= bench_image(name, width, height, repeat, seed, work_dir)
+        finally:
+            os.chdir(previous_dir)
+
+    return {
+        'class': name,
+        'resolution': resolution,
+        **stats,
+        'baseline_rss_mb': baseline_rss,
+        'peak_rss_mb': peak_rss(),
+        'quality': quality
+    }
+
+def environment():
+    '''Return the versions and machine details recorded with the results'''
+    try:
+        commit= subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd= ROOT, capture_output= True,
+                               text= True, check= True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit= None
+    return {
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'opencv_threads': cv2.getNumThreads()
+    }
+
+def run_benchmarks(classes= CLASSES, resolutions= DEFAULT_RESOLUTIONS, frames= 60, repeat= 3, seed= 0, isolate= True):
+    '''Benchmark the classes at every resolution and return the results as a dictionary
+
+    With isolate, every case runs in a fresh process, so its peak memory is not
+    hidden by an earlier, larger case.
+    '''
+    for name in classes:
+        if name not in CLASSES:
+            raise ValueError(f'Unknown class {name!r}, expected one of {CLASSES}.')
+    for resolution in resolutions:
+        parse_resolution(resolution)
+
+    results= []
+    for name in classes:
+        for resolution in resolutions:
+            if isolate:
+                with ProcessPoolExecutor(max_workers= 1, mp_context= multiprocessing.get_context('spawn')) as pool:
+                    result= pool.submit(run_case, name, resolution, frames, repeat, seed).result()
+            else:
+                result= run_case(name, resolution, frames, repeat, seed)
+            results.append(result)
+            print(f'{name:24} {resolution:>10} {result["fps"]:9.1f} calls/s  p50 {result["latency_ms"]["p50"]:8.2f} ms'
+                  f'  p99 {result["latency_ms"]["p99"]:8.2f} ms')
+
+    return {
+        'environment': environment(),
+        'settings': {'frames': frames, 'repeat': repeat, 'seed': seed, 'isolate': isolate},
+        'results': results
+    }
+
+def compare_results(baseline, current, threshold= 0.1):
+    '''Return (class, resolution, baseline p50, current p50, change) for the cases of both runs
+
+    change is the relative change of the median latency, positive when slower. Only
+    changes larger than threshold are returned.
+    '''
+    baseline_cases= {(r['class'], r['resolution']): r for r in baseline['results']}
+    changes= []
+    for result in current['results']:
+        before= baseline_cases.get((result['class'], result['resolution']))
+        if before is None:
+            continue
+        old, new= before['latency_ms']['p50'], result['latency_ms']['p50']
+        change= (new - old) / old if old > 0 else 0.0
+        if abs(change) > threshold:
+            changes.append((result['class'], result['resolution'], old, new, change))
+    return changes
+
+def main(argv= None):
+    parser= argparse.ArgumentParser(description= 'Benchmark the algorithm classes on deterministic synthetic inputs.')
+    parser.add_argument('--classes', nargs= '+', choices= CLASSES, default= list(CLASSES), help= 'classes to benchmark (default: all)')
+    parser.add_argument('--resolutions', nargs= '+', default= list(DEFAULT_RESOLUTIONS), help= 'WIDTHxHEIGHT sizes (default: %(default)s)')
+    parser.add_argument('--frames', type= int, default= 60, help= 'frames of the synthetic video (default: 60)')
+    parser.add_argument('--repeat', type= int, default= 3, help= 'timed calls per still-image case (default: 3)')
+    parser.add_argument('--seed', type= int, default= 0, help= 'seed of the synthetic inputs (default: 0)')
+    parser.add_argument('--output', default= None, help= 'JSON results file (default: output/benchmarks/<commit>.json)')
+    parser.add_argument('--compare', default= None, help= 'earlier JSON results to compare the median latencies with')
+    parser.add_argument('--threshold', type= float, default= 0.1, help= 'relative latency change reported by --compare (default: 0.1)')
+    parser.add_argument('--no-isolate', action= 'store_true', help= 'run every case in this process, peak memory is then cumulative')
+    args= parser.parse_args(argv)
+
+    if args.frames < 2 or args.repeat < 1:
+        parser.error('--frames must be at least 2 and --repeat at least 1.')
+    try:
+        for resolution in args.resolutions:
+            parse_resolution(resolution)
+    except ValueError as error:
+        parser.error(str(error))
+
+    report= run_benchmarks(args.classes, args.resolutions, args.frames, args.repeat, args.seed, not args.no_isolate)
+
+    output_path= args.output or os.path.join(ROOT, 'output', 'benchmarks', f'{report["environment"]["commit"] or "results"}.json')
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok= True)
+    with open(output_path, 'w') as file:
+        json.dump(report, file, indent= 2)
+    print(f'Results saved at {output_path}')
+
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline= json.load(file)
+        changes= compare_results(baseline, report, args.threshold)
+        for name, resolution, old, new, change in changes:
+            print(f'{name:24} {resolution:>10} p50 {old:8.2f} ms -> {new:8.2f} ms ({change:+.0%})')
+        if not changes:
+            print(f'No median latency changed by more than {args.threshold:.0%}')
+    return 0
+
+# Running the benchmarks from the repository root, e.g.
+# python benchmarks/run_benchmarks.py --resolutions 640x480 --compare output/benchmarks/abc1234.json
+if __name__ == '__main__':
+    raise SystemExit(main())
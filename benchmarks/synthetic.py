@@ -0,0 +1,149 @@
+# Import necessary libraries and packages
+import numpy as np
+import os
+import cv2
+
+def texture(height, width, rng, scale= 4.0, channels= 3):
+    '''Return a uint8 random texture with features about scale pixels wide'''
+    noise= rng.random((height, width, channels), dtype= np.float32)
+    if scale > 1:
+        noise= cv2.GaussianBlur(noise, (0, 0), scale / 2)
+
+    # Stretch the blurred noise back to the full range
+    low, high= noise.min(), noise.max()
+    return np.uint8(np.clip((noise - low) / max(high - low, 1e-6) * 255, 0, 255)).reshape(height, width, channels)
+
+def moving_objects(width, height, frames, objects= 3, seed= 0):
+    '''Yield (frame, boxes) for a video of textured rectangles moving over a textured background
+
+    The first object has a saturated hue the background does not contain, so the
+    hue trackers can follow it, and the others are gray. Objects move on straight
+    lines and bounce off the borders. boxes holds the (x, y, w, h) of every object
+    in the frame. The same arguments always give the same frames.
+    '''
+    rng= np.random.default_rng(seed)
+
+    # Desaturated background, so hue histograms pick out the first object
+    background= cv2.addWeighted(texture(height, width, rng, scale= 16), 0.5, np.full((height, width, 3), 64, np.uint8), 0.5, 0)
+    background= cv2.cvtColor(cv2.cvtColor(background, cv2.COLOR_BGR2GRAY), cv2.COLOR_GRAY2BGR)
+
+    sprites= []
+    for index in range(objects):
+        w, h= int(width * rng.uniform(0.1, 0.2)), int(height * rng.uniform(0.1, 0.2))
+        sprite= texture(h, w, rng, scale= 3)
+        if index == 0:
+            # Saturated orange, with the texture in its value channel
+            hsv= np.dstack([np.full((h, w), 15, np.uint8), np.full((h, w), 230, np.uint8),
+                            np.uint8(128 + sprite[:, :, 0] // 2)])
+            sprite= cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+        else:
+            sprite= cv2.cvtColor(cv2.cvtColor(sprite, cv2.COLOR_BGR2GRAY), cv2.COLOR_GRAY2BGR)
+
+        position= np.array([rng.uniform(0, width - w), rng.uniform(0, height - h)])
+        velocity= rng.uniform(-1, 1, 2) * max(width, height) / 200
+        sprites.append([sprite, position, velocity])
+
+    for _ in range(frames):
+        frame= background.copy()
+        boxes= []
+        for sprite, position, velocity in sprites:
+            h, w= sprite.shape[:2]
+            x, y= int(position[0]), int(position[1])
+            frame[y:y + h, x:x + w]= sprite
+            boxes.append((x, y, w, h))
+
+            # Move, bouncing off the borders
+            position += velocity
+            for axis, limit in ((0, width - w), (1, height - h)):
+                if not 0 <= position[axis] <= limit:
+                    velocity[axis]= -velocity[axis]
+                    position[axis]= min(max(position[axis], 0), limit)
+        yield frame, boxes
+
+def write_video(path, frames, fps= 30.0):
+    '''Write frames, or the (frame, boxes) of moving_objects, to an MJPG video and return the path'''
+    writer= None
+    for frame in frames:
+        if isinstance(frame, tuple):
+            frame= frame[0]
+        if writer is None:
+            height, width= frame.shape[:2]
+            writer= cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+        writer.write(frame)
+    if writer is not None:
+        writer.release()
+    return path
+
+def stereo_pair(width, height, min_disparity= 2, max_disparity= 14, seed= 0):
+    '''Return (left, right, disparity) of a rectified grayscale stereo pair with known disparity
+
+    The scene is a textured background plane whose disparity grows linearly from
+    min_disparity at the top row to the middle of the range at the bottom, like a
+    ground plane, and a textured fronto-parallel rectangle in front of it at
+    max_disparity. disparity is the float32 ground truth of the left view, where the
+    point at column x appears at column x - disparity of the right view.
+    '''
+    rng= np.random.default_rng(seed)
+    back= texture(height, width, rng, scale= 2, channels= 1).reshape(height, width)
+    front= texture(height, width, rng, scale= 2, channels= 1).reshape(height, width)
+
+    rows= np.linspace(min_disparity, (min_disparity + max_disparity) / 2, height, dtype= np.float32)
+    disparity= np.repeat(rows[:, None], width, axis= 1)
+    x0, x1, y0, y1= width * 3 // 8, width * 5 // 8, height // 3, height * 2 // 3
+    disparity[y0:y1, x0:x1]= max_disparity
+
+    # Left view: the rectangle pasted over the background
+    left= back.copy()
+    left[y0:y1, x0:x1]= front[y0:y1, x0:x1]
+
+    # Right view: every layer sampled at x + disparity, the rectangle shifted left over the background
+    xs, ys= np.meshgrid(np.arange(width, dtype= np.float32), np.arange(height, dtype= np.float32))
+    right= cv2.remap(back, xs + rows[:, None], ys, cv2.INTER_LINEAR, borderMode= cv2.BORDER_REFLECT)
+    front_right= cv2.remap(front, xs + max_disparity, ys, cv2.INTER_LINEAR, borderMode= cv2.BORDER_REFLECT)
+    x0r, x1r= max(x0 - max_disparity, 0), x1 - max_disparity
+    right[y0:y1, x0r:x1r]= front_right[y0:y1, x0r:x1r]
+    return left, right, disparity
+
+def exposure_bracket(width, height, exposure_times= (1 / 30, 1 / 8, 1 / 2, 2.0), gamma= 2.2, max_shift= 2, seed= 0):
+    '''Return (images, exposure_times, shifts) of a synthetic exposure bracket
+
+    A smooth radiance map spanning about ten stops, with a few bright highlights,
+    is scaled by every exposure time, gamma encoded and clipped to 8 bits. Every
+    exposure but the first is shifted by a known (dx, dy) of up to max_shift
+    pixels, as with a handheld camera.
+    '''
+    rng= np.random.default_rng(seed)
+    log_radiance= texture(height, width, rng, scale= max(width, height) / 16).astype(np.float32) / 255 * 10 - 7
+
+    # A few small highlights several stops above the rest
+    for _ in range(4):
+        center= (int(rng.uniform(0, width)), int(rng.uniform(0, height)))
+        cv2.circle(log_radiance, center, max(2, min(width, height) // 30), (4, 4, 4), -1)
+    radiance= np.exp2(log_radiance)
+
+    images, shifts= [], []
+    for index, exposure_time in enumerate(exposure_times):
+        image= np.uint8(np.clip(np.power(np.clip(radiance * exposure_time, 0, 1), 1 / gamma) * 255, 0, 255))
+        shift= (0, 0) if index == 0 else tuple(int(v) for v in rng.integers(-max_shift, max_shift + 1, 2))
+        if shift != (0, 0):
+            image= np.roll(image, shift[::-1], axis= (0, 1))
+        images.append(image)
+        shifts.append(shift)
+    return images, np.array(exposure_times, dtype= np.float32), shifts
+
+def write_bracket(directory, images, exposure_times, listing= 'exposure_times.txt'):
+    '''Write a bracket as PNG files with the exposure listing read by read_bracket and return the directory'''
+    os.makedirs(directory, exist_ok= True)
+    with open(os.path.join(directory, listing), 'w') as file:
+        for index, (image, exposure_time) in enumerate(zip(images, exposure_times)):
+            name= f'exposure_{index}.png'
+            cv2.imwrite(os.path.join(directory, name), image)
+            file.write(f'{name} {float(exposure_time)!r}\n')
+    return directory
+
+def noisy_image(width, height, sigma= 15, seed= 0):
+    '''Return a textured color image with Gaussian noise of standard deviation sigma added'''
+    rng= np.random.default_rng(seed)
+    image= texture(height, width, rng, scale= 12)
+    noise= rng.normal(0, sigma, image.shape)
+    return np.uint8(np.clip(image + noise, 0, 255))
@@ -1,58 +1,297 @@
 # Import necessary libraries and packages
+import json
+import numpy as np
 import os
+import time
 import cv2
+from Metrics import Metrics
+from OutputSinks import DisplaySink, ImageSequenceSink, RecordSink, VideoWriterSink
+from VideoPipeline import stream_video, video_fps
+
+# One connected foreground component of a frame, in full-resolution pixels
+BLOB_DTYPE= np.dtype([
+    ('frame', np.int32),
+    ('x', np.int32),
+    ('y', np.int32),
+    ('width', np.int32),
+    ('height', np.int32),
+    ('area', np.int32),
+    ('cx', np.float32),
+    ('cy', np.float32)
+])
+
+# Background subtractors available to BackgroundSubtraction
+SUBTRACTORS= {
+    'mog2': cv2.createBackgroundSubtractorMOG2,
+    'knn': cv2.createBackgroundSubtractorKNN
+}
+
+def sample_frames(video_path, count= 5, span= 500):
+    '''Return count frames sampled evenly from the first span frames of a video'''
+    cap= cv2.VideoCapture(video_path)
+    frames= []
+    try:
+        total= int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        span= min(span, total) if total > 0 else span
+        for index in np.linspace(0, max(span - 1, 0), count).astype(int):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(index))
+            ret, frame= cap.read()
+            if ret:
+                frames.append(frame)
+    finally:
+        cap.release()
+    return frames
+
+def extract_blobs(mask, frame_index= 0, min_area= 0, scale= 1.0):
+    '''Return the connected foreground components of a mask as a BLOB_DTYPE record array
+
+    Shadow pixels (127) are ignored. For a mask computed at a processing scale, the
+    boxes, areas and centroids are converted back to full-resolution pixels, and
+    min_area is given in full-resolution pixels.
+    '''
+    _, foreground= cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY)
+    count, labels, stats, centroids= cv2.connectedComponentsWithStats(foreground, connectivity= 8)
+
+    # Label 0 is the background
+    stats, centroids= stats[1:], centroids[1:]
+    inverse= 1 / scale
+    areas= stats[:, cv2.CC_STAT_AREA] * inverse * inverse
+    keep= areas >= min_area
+
+    blobs= np.empty(int(keep.sum()), dtype= BLOB_DTYPE)
+    blobs['frame']= frame_index
+    blobs['x']= np.round(stats[keep, cv2.CC_STAT_LEFT] * inverse)
+    blobs['y']= np.round(stats[keep, cv2.CC_STAT_TOP] * inverse)
+    blobs['width']= np.round(stats[keep, cv2.CC_STAT_WIDTH] * inverse)
+    blobs['height']= np.round(stats[keep, cv2.CC_STAT_HEIGHT] * inverse)
+    blobs['area']= np.round(areas[keep])
+    blobs['cx']= (centroids[keep, 0] + 0.5) * inverse - 0.5
+    blobs['cy']= (centroids[keep, 1] + 0.5) * inverse - 0.5
+    return blobs
 
 class BackgroundSubtraction:
-    def __init__(self, video_path):
+    # Frames the model learns from before a chunk of ChunkedExecutor. Learning them at
+    # the normal rate tracks a model that has seen the whole video more closely than
+    # warm_start(), whose median leaves ghosts of slow objects.
+    warmup_frames= 25
+
+    def __init__(self, video_path= None, method= 'mog2', scale= 1.0, upsample= True, min_area= 50, metrics= None):
+        if method not in SUBTRACTORS:
+            raise ValueError(f'Unknown background subtractor {method!r}, expected one of {tuple(SUBTRACTORS)}.')
+
         self.video_path= video_path
+        self.method= method
+        self.fgbg= None
+
+        # The model runs on frames downscaled by scale, and its mask is upsampled back
+        # to the frame size unless upsample is False
+        self.scale= scale
+        self.upsample= upsample
+
+        # Smallest blob, in full-resolution pixels, reported by blobs()
+        self.min_area= min_area
+
+        # Learning rate passed to apply(), -1 lets the model choose it. A warm-started
+        # model uses its steady-state rate instead of relearning at the high initial rate.
+        self.learning_rate= -1
+        self.frames_processed= 0
+
+        # Size of the last processed frame, converting blobs of downscaled masks and
+        # recorded in checkpoints
+        self.frame_width= None
+        self.frame_height= None
+
+        # Stage timings and frame counters of background_subtract()
+        self.metrics= metrics or Metrics('background_subtraction')
+
+    def reset(self):
+        '''Create a fresh background subtractor'''
+        self.fgbg= SUBTRACTORS[self.method]()
+        self.learning_rate= -1
+        self.frames_processed= 0
+
+        # Processing size of the image learned by warm_start(), checked on the next frame
+        self.warm_size= None
+
+    def _prepare(self, frame):
+        '''Downscale a frame to the processing scale'''
+        if self.scale == 1.0:
+            return frame
+        return cv2.resize(frame, None, fx= self.scale, fy= self.scale, interpolation= cv2.INTER_AREA)
+
+    def process(self, ctx):
+        '''Apply the background subtractor to one frame and return the foreground mask'''
+        if self.fgbg is None:
+            self.reset()
+        self.frames_processed += 1
+        self.frame_height, self.frame_width= ctx.frame.shape[:2]
+        frame= self._prepare(ctx.frame)
+        if self.warm_size is not None:
+            # The subtractors start over on a frame of another size, losing the warm start
+            if frame.shape[:2] != self.warm_size:
+                print(f'Error: The warm-start background is {self.warm_size[1]}x{self.warm_size[0]} but frames are '
+                      f'processed at {frame.shape[1]}x{frame.shape[0]}, the model starts over.')
+            self.warm_size= None
 
-    def background_subtract(self, frame_interval= 500):
-        '''Perform Background Subtraction on a video and save frames at intervals'''
+        mask= self.fgbg.apply(frame, learningRate= self.learning_rate)
+        if self.scale == 1.0 or not self.upsample:
+            return mask
+        height, width= ctx.frame.shape[:2]
+        return cv2.resize(mask, (width, height), interpolation= cv2.INTER_NEAREST)
 
-        # Read the video
-        cap= cv2.VideoCapture(self.video_path)
-        if not cap.isOpened():
-            print('Error: Could  not open video.')
+    def blobs(self, mask, frame_index, frame_width):
+        '''Return the blobs of a mask from process() in full-resolution pixels, see extract_blobs'''
+        return extract_blobs(mask, frame_index, self.min_area, mask.shape[1] / frame_width)
+
+    def warm_start(self, background= None, frames= (), bootstrap_rate= 0.2):
+        '''Create a background subtractor initialized from a background image
+
+        The model learns the background image (e.g. from load_checkpoint) with a
+        learning rate of 1, then adapts to a few sampled frames of the current
+        recording with bootstrap_rate. Without a background image, the per-pixel
+        median of the frames is used, which removes objects moving through them.
+        The model then keeps its steady-state learning rate, 1 / history.
+
+        The background image is resized to the processing size of the frames, so a
+        model of another size does not start over on the first frame. Without frames,
+        it must already be at the processing size, as load_checkpoint returns it
+        when given the scale.
+        '''
+        self.reset()
+        frames= [self._prepare(frame) for frame in frames]
+        if background is not None and frames:
+            height, width= frames[0].shape[:2]
+            aspect= background.shape[1] / background.shape[0]
+            if background.shape[2:] != frames[0].shape[2:] or abs(aspect - width / height) > 0.01:
+                print(f'Error: The background image of size {background.shape[1]}x{background.shape[0]} '
+                      f'does not match the frames of size {width}x{height}, it is not used.')
+                background= None
+            elif background.shape != frames[0].shape:
+                background= cv2.resize(background, (width, height), interpolation= cv2.INTER_AREA)
+        if background is None and frames:
+            background= np.median(np.stack(frames), axis= 0).astype(np.uint8)
+        if background is None:
             return
-        
-        # Create the background subtractor
-        fgbg= cv2.createBackgroundSubtractorMOG2()
-        
-        # Define the output directory for saving frames
-        output_dir= 'output/background_subtraction'
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-            
-        frame_count= 0
-        saved_frame_count= 0
-        
-        while True:
-            ret, frame= cap.read()
-            if not ret:
-                break
-            
-            # Apply the background subtractor
-            fgmask= fgbg.apply(frame)
-            
-            # Save the frame at specified intervals
-            if frame_count % frame_interval == 0:
 
-                # Display the result
-                cv2.imshow('Frame', fgmask)
+        self.warm_size= background.shape[:2]
+        self.fgbg.apply(background, learningRate= 1)
+        for frame in frames:
+            self.fgbg.apply(frame, learningRate= bootstrap_rate)
+        self.learning_rate= 1 / self.fgbg.getHistory()
+
+    def save_checkpoint(self, camera_id, checkpoint_dir= 'output/background_models'):
+        '''Save the background image of the model and its metadata for a camera
 
-                # Save the frame to the output directory
-                output_file= os.path.join(output_dir, f'frame_{saved_frame_count:04d}.png')
-                cv2.imwrite(output_file, fgmask)
-                saved_frame_count += 1
+        OpenCV cannot serialize the per-pixel mixture models, so the checkpoint is
+        the background image, at the processing scale, from which warm_start rebuilds
+        a model. The metadata records the processing scale and size and the size of
+        the frames, so the image can be resized for another scale.
+        '''
+        background= self.fgbg.getBackgroundImage() if self.fgbg is not None else None
+        if background is None:
+            print('Error: The background model has no background image yet.')
+            return
 
-                # Press 'q' to exit the video display
-                if cv2.waitKey(30) & 0xFF == ord('q'):
-                    break
+        os.makedirs(checkpoint_dir, exist_ok= True)
+        cv2.imwrite(os.path.join(checkpoint_dir, f'{camera_id}.png'), background)
+        metadata= {
+            'camera_id': camera_id,
+            'method': self.method,
+            'scale': self.scale,
+            'history': self.fgbg.getHistory(),
+            'height': background.shape[0],
+            'width': background.shape[1],
+            'frame_height': self.frame_height,
+            'frame_width': self.frame_width,
+            'frames_processed': self.frames_processed,
+            'saved_at': time.time()
+        }
+        with open(os.path.join(checkpoint_dir, f'{camera_id}.json'), 'w') as file:
+            json.dump(metadata, file, indent= 2)
 
-            frame_count += 1
+    @staticmethod
+    def load_checkpoint(camera_id, checkpoint_dir= 'output/background_models', scale= None):
+        '''Return the background image and metadata saved for a camera, or (None, None)
 
-        cap.release()
-        cv2.destroyAllWindows()
+        With scale, the image is resized from the processing size it was saved at to
+        the processing size of the camera's frames at that scale.
+        '''
+        image_path= os.path.join(checkpoint_dir, f'{camera_id}.png')
+        metadata_path= os.path.join(checkpoint_dir, f'{camera_id}.json')
+        if not os.path.exists(image_path) or not os.path.exists(metadata_path):
+            return None, None
+        with open(metadata_path, 'r') as file:
+            metadata= json.load(file)
+        background= cv2.imread(image_path)
+        if background is None:
+            print(f'Error: Could not read the background image {image_path}.')
+            return None, None
+
+        if scale is not None:
+            # Checkpoints without the frame size were saved at their own scale
+            frame_width= metadata.get('frame_width') or metadata['width'] / metadata['scale']
+            frame_height= metadata.get('frame_height') or metadata['height'] / metadata['scale']
+            size= (max(1, int(round(frame_width * scale))), max(1, int(round(frame_height * scale))))
+            if size != (background.shape[1], background.shape[0]):
+                background= cv2.resize(background, size, interpolation= cv2.INTER_AREA)
+        return background, metadata
+
+    def stream(self, sinks= (), reset= True):
+        '''Yield (index, mask) for every frame of the video, writing the masks to the sinks that want them
+
+        With reset False the current model is kept, e.g. after warm_start(). See
+        stream_video.
+        '''
+        return stream_video(self, self.video_path, sinks, reset)
+
+    def background_subtract(self, frame_interval= 500, events_path= None, camera_id= None,
+                            checkpoint_dir= 'output/background_models', bootstrap_frames= 5, display= True,
+                            output_video= None):
+        '''Perform Background Subtraction on a video and save frames at intervals
+
+        With events_path (.jsonl or .npy), the blobs of every frame are written there
+        as motion events. With a camera_id, the model is warm-started from the
+        camera's checkpoint and bootstrap_frames sampled frames, and the checkpoint is
+        updated at the end. With output_video, every mask is also encoded into that
+        video file.
+        '''
+
+        # Create the background subtractor, warm-started for a known camera
+        if camera_id is not None:
+            background, _= self.load_checkpoint(camera_id, checkpoint_dir, self.scale)
+            frames= sample_frames(self.video_path, bootstrap_frames) if bootstrap_frames else []
+            self.warm_start(background, frames)
+
+        # Display and save the masks at specified intervals
+        sinks= [ImageSequenceSink('output/background_subtraction', every= frame_interval, workers= 2)]
+        if display:
+            sinks.append(DisplaySink('Frame', delay= 30, every= frame_interval))
+        if output_video is not None:
+            sinks.append(VideoWriterSink(output_video, fps= video_fps(self.video_path)))
+
+        # Open the motion event stream
+        events= RecordSink(events_path, BLOB_DTYPE) if events_path is not None else None
+
+        try:
+            for frame_count, fgmask in self.stream(sinks, reset= camera_id is None):
+                # Record the blobs of the frame
+                if events is not None:
+                    with self.metrics.stage('events'):
+                        events.write(self.blobs(fgmask, frame_count, self.frame_width))
+        except OSError as error:
+            print(f'Error: {error}')
+            return
+        finally:
+            for sink in sinks:
+                sink.close()
+            if events is not None:
+                events.close()
+
+        if camera_id is not None:
+            self.save_checkpoint(camera_id, checkpoint_dir)
+
+        if events is not None:
+            print(f'{events.records_written} motion events saved at {events_path}')
 
 # Testing the BackgroundSubtraction class
 if __name__ == '__main__':
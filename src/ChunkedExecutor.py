@@ -0,0 +1,134 @@
+# Import necessary libraries and packages
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import math
+import os
+import cv2
+from FrameContext import FrameContext
+from FrameSource import FrameSource
+from Metrics import Metrics
+from OutputSinks import emit
+
+def _run_chunk(video_path, factory, chunk_index, start, stop, state, map_result, buffer_size):
+    '''Worker task: run a fresh analyzer over the frames [start, stop), returning [(index, result)]'''
+    analyzer= factory()
+    if hasattr(analyzer, 'reset'):
+        analyzer.reset()
+
+    warmup= 0
+    if chunk_index > 0:
+        # Pick up the state handed over from the start of the video, then warm up on
+        # the frames just before the chunk
+        if hasattr(analyzer, 'resume'):
+            analyzer.resume(state, chunk_index)
+        warmup= min(getattr(analyzer, 'warmup_frames', 0), start)
+
+    first= start - warmup
+    results= []
+    with FrameSource(video_path, buffer_size, start= first, stop= stop) as source:
+        for index, frame in enumerate(source, first):
+            result= analyzer.process(FrameContext(frame, index))
+            if index < start:
+                continue
+            results.append((index, map_result(index, result) if map_result is not None else result))
+    return results
+
+class ChunkedExecutor:
+    '''Run an analyzer over one long video in parallel chunks on a process pool
+
+    The video is split into frame ranges, and every worker seeks to its range and
+    runs a fresh analyzer from factory, a picklable callable such as the analyzer
+    class or a functools.partial of it. Analyzers that carry state from frame to
+    frame continue across chunk boundaries through optional hooks:
+
+    - warmup_frames: number of frames before the chunk processed, with their results
+      dropped, to rebuild the state, e.g. the previous frame for optical flow or a
+      learning prefix for a background model.
+    - handoff(): called in the parent on an analyzer that processed the first frame
+      of the video, returning picklable state, e.g. a target histogram.
+    - resume(state, chunk_index): called in a worker before the chunk, with the
+      handed-off state.
+
+    Results are yielded in frame order. map_result(index, result), a picklable
+    function, is applied in the workers to shrink what is sent back, e.g. to keep
+    the blob records of a mask instead of the mask. Frame indices rely on exact
+    seeking with CAP_PROP_POS_FRAMES.
+    '''
+
+    def __init__(self, video_path, factory, workers= None, chunk_size= None, map_result= None, buffer_size= 8,
+                 metrics= None):
+        self.video_path= video_path
+        self.factory= factory
+        self.workers= workers or os.cpu_count() or 1
+        self.chunk_size= chunk_size
+        self.map_result= map_result
+        self.buffer_size= buffer_size
+
+        # Stage timings and frame counters of stream()
+        self.metrics= metrics or Metrics('chunked_executor')
+
+    def chunks(self):
+        '''Return the (start, stop) frame ranges of the chunks, the last one open ended'''
+        cap= cv2.VideoCapture(self.video_path)
+        frame_count= int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+        cap.release()
+        if frame_count <= 0:
+            return [(0, None)]
+
+        # Several chunks per worker balance the load when some chunks run slower
+        chunk_size= self.chunk_size or max(1, math.ceil(frame_count / (4 * self.workers)))
+        starts= list(range(0, frame_count, chunk_size))
+        return [(start, stop) for start, stop in zip(starts, starts[1:] + [None])]
+
+    def _handoff(self):
+        '''Return the state handed to every chunk, from an analyzer run on the first frame'''
+        analyzer= self.factory()
+        if not hasattr(analyzer, 'handoff'):
+            return None
+        if hasattr(analyzer, 'reset'):
+            analyzer.reset()
+        with FrameSource(self.video_path, self.buffer_size, stop= 1) as source:
+            for frame in source:
+                analyzer.process(FrameContext(frame, 0))
+        return analyzer.handoff()
+
+    def run(self):
+        '''Yield (index, result) for every frame of the video, in order'''
+        chunks= self.chunks()
+        state= self._handoff()
+
+        with ProcessPoolExecutor(max_workers= self.workers) as pool:
+            # Keep at most two chunks per worker in flight, collecting them in order
+            pending= deque()
+            for chunk_index, (start, stop) in enumerate(chunks):
+                pending.append(pool.submit(_run_chunk, self.video_path, self.factory, chunk_index, start, stop,
+                                           state, self.map_result, self.buffer_size))
+                if len(pending) >= 2 * self.workers:
+                    yield from pending.popleft().result()
+
+            while pending:
+                yield from pending.popleft().result()
+
+    def stream(self, sinks= ()):
+        '''Yield (index, result) for every frame with a result, in order, writing the results to the sinks that want them
+
+        This is stream_video over the chunks: frames for which process() returns
+        None are skipped, and the stream ends early when a sink asks to stop. The
+        sinks receive the results as map_result returns them, so image sinks need a
+        map_result returning images. The sinks are left open for the caller to close.
+        '''
+        metrics= self.metrics
+        results= self.run()
+        try:
+            with metrics.run():
+                for index, result in results:
+                    metrics.count('frames_processed')
+                    if result is None:
+                        continue
+                    running= not sinks or emit(sinks, index, lambda: result, metrics)
+                    yield index, result
+                    if not running:
+                        break
+                    metrics.tick()
+        finally:
+            results.close()
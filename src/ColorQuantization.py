@@ -1,51 +1,179 @@
 # Import necessary libraries and packages
 import numpy as np
-import os
 import cv2
+from Metrics import Metrics
+from OutputSinks import DisplaySink, ImageSequenceSink, emit
+
+# Number of pixels handled per step when assigning pixels to palette colors
+ASSIGN_CHUNK= 1 << 20
+
+def sample_pixels(image, sample_size, sampling= 'random', rng= None):
+    '''Return up to sample_size pixels of the image as an (N, 3) array
+
+    'random' draws pixels uniformly, 'stratified' splits the image into sample_size
+    equal runs of pixels and draws one pixel from each, so every area is represented.
+    A sample is float32. Without sampling, the uint8 pixels of the image are
+    returned as they are, so fit_palette only converts what it reads.
+    '''
+    pixels= image.reshape((-1,3))
+    count= len(pixels)
+    if sample_size is None or sample_size >= count:
+        return pixels
+
+    rng= np.random.default_rng(rng)
+    if sampling == 'random':
+        index= rng.choice(count, size= sample_size, replace= False)
+    elif sampling == 'stratified':
+        step= count / sample_size
+        index= (np.arange(sample_size) * step + rng.random(sample_size) * step).astype(np.intp)
+    else:
+        raise ValueError(f'Unknown sampling {sampling!r}, expected random or stratified.')
+    return np.float32(pixels[index])
+
+def _nearest_center(pixels, centers):
+    '''Return the index of the nearest center for every row of pixels'''
+    pixels= np.float32(pixels)
+
+    # |p - c|^2 = |p|^2 - 2 p.c + |c|^2, and |p|^2 does not change the argmin
+    distances= pixels @ (-2 * centers.T)
+    distances += (centers * centers).sum(axis= 1)
+    return distances.argmin(axis= 1)
+
+def _kmeans_plus_plus(pixels, k, rng):
+    '''Pick k initial centers with k-means++ seeding'''
+    centers= np.empty((k, 3), dtype= np.float32)
+    centers[0]= pixels[rng.integers(len(pixels))]
+    distances= ((pixels - centers[0]) ** 2).sum(axis= 1)
+    for i in range(1, k):
+        total= distances.sum()
+        index= rng.choice(len(pixels), p= distances / total) if total > 0 else rng.integers(len(pixels))
+        centers[i]= pixels[index]
+        distances= np.minimum(distances, ((pixels - centers[i]) ** 2).sum(axis= 1))
+    return centers
+
+def _minibatch_kmeans(pixels, k, rng, batch_size= 4096, iterations= 100):
+    '''Fit k centers with mini-batch K-means, seeded with k-means++
+
+    Only the seeding sample and the batches are converted to float32, so the pixels
+    may be the uint8 pixels of a whole image.
+    '''
+    seed_pixels= np.float32(pixels[rng.choice(len(pixels), size= min(len(pixels), 10 * batch_size), replace= False)])
+    centers= _kmeans_plus_plus(seed_pixels, k, rng)
+    counts= np.zeros(k, dtype= np.float64)
+
+    for _ in range(iterations):
+        batch= np.float32(pixels[rng.integers(len(pixels), size= batch_size)])
+        labels= _nearest_center(batch, centers)
+
+        # Move every center towards the mean of its batch members with a per-center
+        # learning rate of 1 / (number of pixels it has seen)
+        batch_counts= np.bincount(labels, minlength= k)
+        sums= np.zeros((k, 3), dtype= np.float64)
+        np.add.at(sums, labels, batch)
+        counts += batch_counts
+        seen= batch_counts > 0
+        centers[seen] += ((sums[seen] - batch_counts[seen, None] * centers[seen]) / counts[seen, None]).astype(np.float32)
+    return centers
+
+def fit_palette(pixels, k= 8, method= 'kmeans', rng= None):
+    '''Fit a palette of k colors to an (N, 3) uint8 or float32 pixel array
+
+    'kmeans' runs cv2.kmeans with k-means++ seeding, 'minibatch' runs mini-batch
+    K-means, which only looks at a few thousand pixels per iteration. k is clamped
+    to the number of pixels, so tiny images get a smaller palette.
+    '''
+    rng= np.random.default_rng(rng)
+    k= max(1, min(k, len(pixels)))
+    if method == 'kmeans':
+        criteria= (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
+        ret, label, center= cv2.kmeans(np.float32(pixels), k, None, criteria, 3, cv2.KMEANS_PP_CENTERS)
+        return center
+    if method == 'minibatch':
+        return _minibatch_kmeans(pixels, k, rng)
+    raise ValueError(f'Unknown fitting method {method!r}, expected kmeans or minibatch.')
+
+def apply_palette(image, centers, assign= 'nearest'):
+    '''Replace every pixel of the image with its nearest palette color
+
+    'nearest' compares each pixel with every center, 'lut' precomputes the nearest
+    center for each color quantized to 5 bits per channel and looks pixels up in it.
+    '''
+    palette= np.uint8(np.clip(np.rint(centers), 0, 255))
+    centers= np.float32(centers)
+    pixels= image.reshape((-1,3))
+    quantized= np.empty_like(pixels)
+
+    if assign == 'lut':
+        # Nearest center of the middle of every 8x8x8 cell of the RGB cube
+        levels= np.arange(4, 256, 8, dtype= np.float32)
+        grid= np.stack(np.meshgrid(levels, levels, levels, indexing= 'ij'), axis= -1).reshape((-1,3))
+        lut= palette[_nearest_center(grid, centers)]
+    elif assign != 'nearest':
+        raise ValueError(f'Unknown assignment {assign!r}, expected nearest or lut.')
+
+    # Work in chunks so the temporaries stay small on very large images
+    for start in range(0, len(pixels), ASSIGN_CHUNK):
+        chunk= pixels[start:start + ASSIGN_CHUNK]
+        if assign == 'lut':
+            cells= chunk >> 3
+            index= (cells[:, 0].astype(np.intp) << 10) | (cells[:, 1].astype(np.intp) << 5) | cells[:, 2]
+            quantized[start:start + ASSIGN_CHUNK]= lut[index]
+        else:
+            quantized[start:start + ASSIGN_CHUNK]= palette[_nearest_center(chunk, centers)]
+
+    return quantized.reshape(image.shape)
 
 class ColorQuantization:
-    def __init__(self, image_path):
+    def __init__(self, image_path, metrics= None):
         self.image_path= image_path
 
-    def quantize(self, k= 8):
-        '''Perform Color Quantization on an image using K-Means Clustering'''
+        # Stage timings and image counters of quantize()
+        self.metrics= metrics or Metrics('color_quantization')
 
-        # Read the image
-        image= cv2.imread(self.image_path)
-        if image is None:
-            print('Error: Image not found.')
-            return None
-        
-        # Convert the image to a 2D array of pixels
-        Z= image.reshape((-1,3))
-        Z= np.float32(Z)
+    def quantize(self, k= 8, sample_size= None, sampling= 'random', method= 'kmeans', assign= 'lut', sinks= ()):
+        '''Perform Color Quantization on an image using K-Means Clustering and return the quantized image
 
-        # Define criteria and apply K-Means
-        criteria= (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
-        ret, label, center= cv2.kmeans(Z, k, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
+        With sample_size set, the palette is fitted on that many sampled pixels
+        (see sample_pixels and fit_palette) and then every pixel is assigned to
+        its nearest palette color (see apply_palette). The quantized image is also
+        written to the sinks, e.g. a DisplaySink or an ImageSequenceSink.
+        '''
+        metrics= self.metrics
+
+        with metrics.run():
+            # Read the image
+            with metrics.stage('decode'):
+                image= cv2.imread(self.image_path)
+            if image is None:
+                print('Error: Image not found.')
+                return None
 
-        # Convert the center values back to 8-bit values
-        center= np.uint8(center)
+            with metrics.stage('compute'):
+                if sample_size is None and method == 'kmeans':
+                    # Convert the image to a 2D array of pixels
+                    Z= image.reshape((-1,3))
+                    Z= np.float32(Z)
 
-        # Map the labels to the center values
-        res= center[label.flatten()]
-        quantized_image= res.reshape((image.shape))
+                    # Define criteria and apply K-Means
+                    criteria= (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
+                    ret, label, center= cv2.kmeans(Z, k, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
 
-        # Display the original and quantized image
-        cv2.imshow('Original Image', image)
-        cv2.imshow('Quantized Image', quantized_image)
+                    # Convert the center values back to 8-bit values
+                    center= np.uint8(center)
 
-        # Save the quantized image to the output directory
-        output_dir= 'output/color_quantization'
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+                    # Map the labels to the center values
+                    res= center[label.flatten()]
+                    quantized_image= res.reshape((image.shape))
+                else:
+                    # Fit the palette on a subsample, then assign all pixels to it
+                    pixels= sample_pixels(image, sample_size, sampling)
+                    centers= fit_palette(pixels, k, method)
+                    quantized_image= apply_palette(image, centers, assign)
+            metrics.count('frames_processed')
 
-        output_file= os.path.join(output_dir, 'quantized_image.png')
-        cv2.imwrite(output_file, quantized_image)
-        print(f'Quantized image saved at {output_file}')
+            emit(sinks, 0, lambda: quantized_image, metrics)
 
-        cv2.waitKey(0)
-        cv2.destroyAllWindows()
+        return quantized_image
 
 # Testing the ColorQuantization class
 if __name__ == '__main__':
@@ -54,8 +182,12 @@ if __name__ == '__main__':
     # Path to the image
     image_path= 'data/download.jpeg'
 
-    # Create an object of ColorQuantization
+    # Create an object of ColorQuantization, then display and save the quantized image
     color_quantization= ColorQuantization(image_path)
-    color_quantization.quantize(k= 8)
+    with DisplaySink('Quantized Image', delay= 0) as display, \
+         ImageSequenceSink('output/color_quantization', pattern= 'quantized_image.png') as saved:
+        color_quantization.quantize(k= 8, sinks= [display, saved])
+    if saved.last_path:
+        print(f'Quantized image saved at {saved.last_path}')
 
     print('Color quantization completed.')
\ No newline at end of file
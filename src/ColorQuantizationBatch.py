@@ -0,0 +1,131 @@
+# Import necessary libraries and packages
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import argparse
+import numpy as np
+import os
+import cv2
+from ColorQuantization import apply_palette, fit_palette, sample_pixels
+from ImageFiles import find_images
+
+def quantize_file(input_path, output_path, k= 8, sample_size= 20000, method= 'kmeans', assign= 'lut', centers= None):
+    '''Quantize one image file and write the result, fitting a palette unless centers are given
+
+    Returns the input path and None on success or an error message, so one bad
+    image does not abort the batch.
+    '''
+    try:
+        image= cv2.imread(input_path)
+        if image is None:
+            return input_path, 'Image not found or not readable.'
+
+        if centers is None:
+            centers= fit_palette(sample_pixels(image, sample_size), k, method)
+        quantized_image= apply_palette(image, centers, assign)
+
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok= True)
+        if not cv2.imwrite(output_path, quantized_image):
+            return input_path, 'Could not write the output image.'
+    except (cv2.error, ValueError, OSError) as error:
+        return input_path, str(error).strip()
+    return input_path, None
+
+def fit_shared_palette(paths, k= 8, sample_size= 20000, method= 'kmeans', rng= None):
+    '''Fit one palette on pixels sampled evenly from the given image files'''
+    rng= np.random.default_rng(rng)
+    per_image= max(1, sample_size // max(1, len(paths)))
+    samples= []
+    for path in paths:
+        image= cv2.imread(path)
+        if image is not None:
+            samples.append(sample_pixels(image, per_image, rng= rng))
+    if not samples:
+        return None
+    return fit_palette(np.concatenate(samples), k, method, rng)
+
+def quantize_directory(input_dir, output_dir, k= 8, workers= None, sample_size= 20000, method= 'kmeans',
+                       assign= 'lut', shared_palette= False, palette_images= 32, output_ext= '.png', rng= None):
+    '''Quantize every image below input_dir into output_dir on a process pool
+
+    Only a few tasks per worker are in flight at a time, so the number of images held
+    in memory stays bounded however large the directory is. With shared_palette, one
+    palette is fitted on a sample of palette_images images and every image is only
+    assigned to it. Returns the number of images written and a list of (path, error).
+    '''
+    workers= workers or os.cpu_count() or 1
+    paths= find_images(input_dir)
+
+    centers= None
+    if shared_palette:
+        # Fit the palette on a random sample of the batch, which needs the full listing
+        paths= list(paths)
+        rng= np.random.default_rng(rng)
+        sample= rng.choice(len(paths), size= min(palette_images, len(paths)), replace= False) if paths else []
+        centers= fit_shared_palette([os.path.join(input_dir, paths[i]) for i in sample], k, sample_size, method, rng)
+        if centers is None:
+            print('Error: Could not read any image to fit the shared palette.')
+            return 0, []
+
+    written= 0
+    errors= []
+    with ProcessPoolExecutor(max_workers= workers) as pool:
+        pending= set()
+        for relative_path in paths:
+            output_path= os.path.join(output_dir, os.path.splitext(relative_path)[0] + output_ext)
+            pending.add(pool.submit(quantize_file, os.path.join(input_dir, relative_path), output_path,
+                                    k, sample_size, method, assign, centers))
+
+            # Keep at most two tasks per worker queued
+            if len(pending) >= 2 * workers:
+                done, pending= wait(pending, return_when= FIRST_COMPLETED)
+                for future in done:
+                    path, error= future.result()
+                    if error is None:
+                        written += 1
+                    else:
+                        errors.append((path, error))
+
+        for future in pending:
+            path, error= future.result()
+            if error is None:
+                written += 1
+            else:
+                errors.append((path, error))
+
+    return written, errors
+
+def main(argv= None):
+    parser= argparse.ArgumentParser(description= 'Quantize the colors of every image in a directory.')
+    parser.add_argument('input_dir', help= 'directory scanned recursively for images')
+    parser.add_argument('output_dir', help= 'directory receiving the quantized images, mirroring input_dir')
+    parser.add_argument('-k', type= int, default= 8, help= 'number of palette colors (default: 8)')
+    parser.add_argument('--workers', type= int, default= None, help= 'number of worker processes (default: CPU count)')
+    parser.add_argument('--sample-size', type= int, default= 20000, help= 'pixels sampled to fit a palette (default: 20000)')
+    parser.add_argument('--method', choices= ('kmeans', 'minibatch'), default= 'kmeans', help= 'palette fitting method')
+    parser.add_argument('--assign', choices= ('nearest', 'lut'), default= 'lut', help= 'pixel assignment method')
+    parser.add_argument('--shared-palette', action= 'store_true', help= 'fit one palette for the whole batch')
+    parser.add_argument('--palette-images', type= int, default= 32, help= 'images sampled to fit the shared palette')
+    parser.add_argument('--ext', default= '.png', help= 'output file extension (default: .png)')
+    args= parser.parse_args(argv)
+
+    written, errors= quantize_directory(
+        args.input_dir,
+        args.output_dir,
+        k= args.k,
+        workers= args.workers,
+        sample_size= args.sample_size,
+        method= args.method,
+        assign= args.assign,
+        shared_palette= args.shared_palette,
+        palette_images= args.palette_images,
+        output_ext= args.ext
+    )
+
+    for path, error in errors:
+        print(f'Error: {path}: {error}')
+    print(f'Quantized {written} images into {args.output_dir}')
+    return 1 if errors else 0
+
+# Running batch color quantization from the command line, e.g.
+# python src/ColorQuantizationBatch.py data output/color_quantization_batch --shared-palette
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,77 +1,136 @@
 # Import necessary libraries and packages
 import numpy as np
-import os
 import cv2
+from Metrics import Metrics
+from OpticalFlowEngine import OpticalFlowEngine
+from OutputSinks import DisplaySink, ImageSequenceSink, VideoWriterSink
+from VideoPipeline import stream_video, video_fps
+
+# BGRA color of every quantized flow vector as a 32-bit word, built on first use
+_FLOW_COLOR_TABLE= None
+
+def _flow_color_table():
+    '''Return the 65536 entry table of the colors of the quantized flow vectors
+
+    Entry qy * 256 + qx stands for the vector (qx - 128, qy - 128). Its hue is the
+    direction and its brightness the length over 127 levels, the length of the
+    largest vector of a frame. The words are little-endian whatever the host, so
+    their bytes are B, G, R and padding.
+    '''
+    global _FLOW_COLOR_TABLE
+    if _FLOW_COLOR_TABLE is None:
+        levels= np.arange(256, dtype= np.float32) - 128
+        dx, dy= np.meshgrid(levels, levels)
+        hsv= np.empty((65536, 1, 3), dtype= np.uint8)
+        hsv[:, 0, 0]= ((np.degrees(np.arctan2(dy, dx)) % 360 * 0.5).astype(np.uint8) % 180).ravel()
+        hsv[:, 0, 1]= 255
+        hsv[:, 0, 2]= np.clip(np.sqrt(dx * dx + dy * dy) * (255 / 127), 0, 255).ravel()
+        table= np.zeros((65536, 4), dtype= np.uint8)
+        table[:, :3]= cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)[:, 0]
+        _FLOW_COLOR_TABLE= table.view('<u4').ravel()
+    return _FLOW_COLOR_TABLE
+
+def flow_to_color(flow):
+    '''Map a flow field to a BGR image: direction as hue, magnitude over the largest one as brightness
+
+    Instead of converting every pixel to polar form and then from HSV, the flow is
+    quantized to 8 bits per component, the largest vector spanning 127 levels, and
+    colored with one lookup into a table built once. Brightness is scaled by the
+    largest magnitude only, where the HSV path also subtracted the smallest one,
+    which is close to 0 in flow fields.
+    '''
+    mag= cv2.magnitude(flow[..., 0], flow[..., 1])
+    _, mag_max, _, _= cv2.minMaxLoc(mag)
+    if mag_max <= 0:
+        return np.zeros(flow.shape[:2] + (3,), dtype= np.uint8)
+
+    # Quantize both components so the largest vector spans 127 levels
+    quantized= cv2.addWeighted(flow, 127 / mag_max, flow, 0, 128, dtype= cv2.CV_8U)
+
+    # Gather one 32-bit BGRA word per pixel and drop the padding channel
+    index= (quantized[..., 1].astype(np.uint16) << 8) | quantized[..., 0]
+    bgra= np.take(_flow_color_table(), index)
+    return cv2.cvtColor(bgra.view(np.uint8).reshape(index.shape + (4,)), cv2.COLOR_BGRA2BGR)
 
 class DenseOpticalFlow:
-    def __init__(self, video_path):
+    # Frames replayed before a chunk by ChunkedExecutor: the previous frame of the flow
+    warmup_frames= 1
+
+    def __init__(self, video_path= None, lazy= True, engine= None, metrics= None):
         self.video_path= video_path
 
-    def dense_optical_flow(self, frame_interval= 500):
-        '''Perform Dense Optical Flow on a video and save frames at intervals'''
-
-        # Read the video
-        cap= cv2.VideoCapture(self.video_path)
-        if not cap.isOpened():
-            print('Error: Could not open video.')
-            return
-        
-        # Read the first frame
-        ret, frame1= cap.read()
-        if not ret:
-            print('Error: Could not read the first frame.')
-            return
-        
-        # Convert the frame to grayscale
-        prvs= cv2.cvtColor(frame1, cv2.COLOR_BGR2GRAY)
-
-        # Define the output directory for saving frames
-        output_dir= 'output/dense_optical_flow'
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        frame_count= 0
-        saved_frame_count= 0
-
-        while True:
-            ret, frame2= cap.read()
-            if not ret:
-                break
-
-            # Conver the frame to grayscale
-            next= cv2.cvtColor(frame2, cv2.COLOR_BGR2GRAY)
-
-            # Calculate Dense Optical Flow using the Farneback method
-            flow= cv2.calcOpticalFlowFarneback(prvs, next, None, 0.5, 3, 15, 3, 5, 1.2, 0)
-
-            # Convert flow to RGB image
-            hsv= cv2.cvtColor(frame1, cv2.COLOR_BGR2HSV)
-            mag, ang= cv2.cartToPolar(flow[..., 0], flow[..., 1])
-            hsv[..., 0]= ang * 180 / np.pi / 2
-            hsv[..., 1]= 255
-            hsv[..., 2]= cv2.normalize(mag, None, 0, 255, cv2.NORM_MINMAX)
-            dense_flow_img= cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
-
-            # Save the frame at specified intervals
-            if frame_count % frame_interval == 0:
-
-                # Display the result
-                cv2.imshow('Dense Optical Flow', dense_flow_img)
-
-                # Save the frame to the output directory
-                output_file= os.path.join(output_dir, f'frame_{saved_frame_count:04d}.png')
-                cv2.imwrite(output_file, dense_flow_img)
-                saved_frame_count += 1
-
-                # Press 'q' to exit the video display
-                if cv2.waitKey(30) & 0xFF == ord('q'):
-                    break
-
-            frame_count += 1
-            prvs= next
-
-        cap.release()
-        cv2.destroyAllWindows()
+        # Farneback at full resolution unless another engine is given,
+        # e.g. OpticalFlowEngine('dis', preset= 'ultrafast', scale= 0.5)
+        self.engine= engine if engine is not None else OpticalFlowEngine('farneback')
+
+        # In lazy mode process() returns the flow field and the visualization
+        # is only built by render() for the frames that are actually emitted
+        self.lazy= lazy
+
+        # Stage timings and frame counters of dense_optical_flow()
+        self.metrics= metrics or Metrics('dense_optical_flow')
+        self.reset()
+
+    def reset(self):
+        '''Forget the previous frame so the next processed frame starts a new sequence'''
+        self.prvs= None
+        self.engine.reset()
+
+    def process(self, ctx):
+        '''Compute the dense flow from the previous frame
+
+        Returns the flow field in lazy mode and its visualization otherwise, or None
+        for the first frame of a sequence, which has no predecessor.
+        '''
+        if self.prvs is None:
+            self.prvs= ctx.gray
+            return None
+
+        next= ctx.gray
+
+        # Calculate Dense Optical Flow, warm-started from the previous pair
+        flow= self.engine.compute(self.prvs, next)
+
+        self.prvs= next
+        if self.lazy:
+            return flow
+        return flow_to_color(flow)
+
+    def render(self, result, frame= None):
+        '''Return the visualization of a result returned by process(), the frame is not needed'''
+        if self.lazy:
+            return flow_to_color(result)
+        return result
+
+    def stream(self, sinks= ()):
+        '''Yield (index, flow) for every frame after the first, writing the visualizations to the sinks that want them
+
+        The result is the flow field in lazy mode and its visualization otherwise.
+        See stream_video.
+        '''
+        return stream_video(self, self.video_path, sinks)
+
+    def dense_optical_flow(self, frame_interval= 500, display= True, output_video= None):
+        '''Perform Dense Optical Flow on a video and save frames at intervals
+
+        With output_video, every frame is also drawn and encoded into that video file.
+        '''
+
+        # Display and save the flow visualization at specified intervals
+        sinks= [ImageSequenceSink('output/dense_optical_flow', every= frame_interval, workers= 2)]
+        if display:
+            sinks.append(DisplaySink('Dense Optical Flow', delay= 30, every= frame_interval))
+        if output_video is not None:
+            sinks.append(VideoWriterSink(output_video, fps= video_fps(self.video_path)))
+
+        try:
+            for _ in self.stream(sinks):
+                pass
+        except OSError as error:
+            print(f'Error: {error}')
+        finally:
+            for sink in sinks:
+                sink.close()
 
 # Testing the DenseOpticalFlow class
 if __name__ == '__main__':
@@ -1,46 +1,48 @@
 # Import necessary libraries and packages
 import numpy as np
-import os
 import cv2
+from Metrics import Metrics
+from OutputSinks import DisplaySink, ImageSequenceSink, emit
+from StereoEngine import StereoEngine
 
 class DepthMapStereo:
-    def __init__(self, left_image_path, right_image_path):
+    def __init__(self, left_image_path, right_image_path, engine= None, metrics= None):
         self.left_image_path= left_image_path
         self.right_image_path= right_image_path
 
-    def compute_depth_map(self):
-        '''Compute the depth map using stereo images'''
+        # Stereo Block Matching (BM) unless another engine is given
+        self.engine= engine if engine is not None else StereoEngine('bm', num_disparities= 16, block_size= 15)
 
-        # Read the stereo images
-        img_left= cv2.imread(self.left_image_path, cv2.IMREAD_GRAYSCALE)
-        img_right= cv2.imread(self.right_image_path, cv2.IMREAD_GRAYSCALE)
+        # Stage timings and image counters of compute_depth_map()
+        self.metrics= metrics or Metrics('depth_map_stereo')
 
-        if img_left is None or img_right is None:
-            print('Error: One or both images not found.')
-            return 
-        
-        # Stereo Block Matching (BM) algorithm
-        stereo= cv2.StereoBM_create(numDisparities= 16, blockSize= 15)
-        disparity= stereo.compute(img_left, img_right)
+    def compute_depth_map(self, sinks= ()):
+        '''Compute the depth map using stereo images and return the float32 disparity in pixels
 
-        # Normalize the disparity for visualization
-        disp= cv2.normalize(disparity, disparity, alpha= 0, beta= 255, norm_type= cv2.NORM_MINMAX)
-        disp= np.uint8(disp)
+        The sinks receive the disparity normalized to an 8-bit image for visualization.
+        '''
+        metrics= self.metrics
 
-        # Display the depth map
-        cv2.imshow('Depth Map', disp)
+        with metrics.run():
+            # Read the stereo images
+            with metrics.stage('decode'):
+                img_left= cv2.imread(self.left_image_path, cv2.IMREAD_GRAYSCALE)
+                img_right= cv2.imread(self.right_image_path, cv2.IMREAD_GRAYSCALE)
 
-        # Save the depth map to the output directory
-        output_dir= 'output/depth_map_stereo'
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+            if img_left is None or img_right is None:
+                print('Error: One or both images not found.')
+                return None
 
-        output_file= os.path.join(output_dir, 'depth_map.png')
-        cv2.imwrite(output_file, disp)
-        print(f'Depth map saved at {output_file}')
+            # Compute the disparity in pixels with the reusable stereo engine
+            with metrics.stage('compute'):
+                disparity= self.engine.compute(img_left, img_right)
+            metrics.count('frames_processed')
 
-        cv2.waitKey(0)
-        cv2.destroyAllWindows()
+            # Normalize the disparity for visualization, leaving the returned disparity untouched
+            emit(sinks, 0, lambda: np.uint8(cv2.normalize(disparity, None, alpha= 0, beta= 255, norm_type= cv2.NORM_MINMAX)),
+                 metrics)
+
+        return disparity
 
 # Testing the DepthMapStereo class
 if __name__ == '__main__':
@@ -50,8 +52,12 @@ if __name__ == '__main__':
     left_image_path= 'data/view0.png'
     right_image_path= 'data/view2.png'
 
-    # Create an object of DepthMapStereo
+    # Create an object of DepthMapStereo, then display and save the depth map
     depth_map_stereo= DepthMapStereo(left_image_path, right_image_path)
-    depth_map_stereo.compute_depth_map()
+    with DisplaySink('Depth Map', delay= 0) as display, \
+         ImageSequenceSink('output/depth_map_stereo', pattern= 'depth_map.png') as saved:
+        depth_map_stereo.compute_depth_map(sinks= [display, saved])
+    if saved.last_path:
+        print(f'Depth map saved at {saved.last_path}')
 
     print('Depth map comptuation completed.')
\ No newline at end of file
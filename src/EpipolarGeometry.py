@@ -1,65 +1,84 @@
 # Import necessary libraries and packages
 import numpy as np
-import os
 import cv2
+from FeatureMatcher import FeatureMatcher, top_k
+from FeatureStore import array_to_keypoints
+from Metrics import Metrics
+from OutputSinks import DisplaySink, ImageSequenceSink, emit
 
 class EpipolarGeometry():
-    def __init__(self, left_image_path, right_image_path):
+    def __init__(self, left_image_path, right_image_path, matcher= None, store= None, metrics= None):
         self.left_image_path= left_image_path
         self.right_image_path= right_image_path
 
-    def detect(self):
-        '''Compute Epipolar Geometry using stereo images'''
-
-        # Read the stereo images
-        img_left= cv2.imread(self.left_image_path)
-        img_right= cv2.imread(self.right_image_path)
-
-        if img_left is None or img_right is None:
-            print('Error: One or both images not found.')
-            return
-        
-        # Convert images to grayscale for SIFT
-        img_left_gray= cv2.cvtColor(img_left, cv2.COLOR_BGR2GRAY)
-        img_right_gray= cv2.cvtColor(img_right, cv2.COLOR_BGR2GRAY)
-        
-        # Initialize the SIFT detector
-        sift= cv2.SIFT_create()
-
-        # Find keypoints and descriptors with SIFT
-        keypoints_left, descriptors_left= sift.detectAndCompute(img_left_gray, None)
-        keypoints_right, descriptors_right= sift.detectAndCompute(img_right_gray, None)
-
-        # Feature matching
-        bf= cv2.BFMatcher(cv2.NORM_L2, crossCheck= True)
-        matches= bf.match(descriptors_left, descriptors_right)
-        matches= sorted(matches, key= lambda x: x.distance)
-
-        # Draw the first 10 matches
-        img_matches= cv2.drawMatches(
-            img_left, 
-            keypoints_left,
-            img_right, 
-            keypoints_right,
-            matches[:10],
-            None,
-            flags= cv2.DrawMatchesFlags_NOT_DRAW_SINGLE_POINTS
-        )
-
-        # Display the matches
-        cv2.imshow('Epipolar Geometry - Matches', img_matches)
-
-        # Save the matches image to the output directory
-        output_dir= 'output/epipolar_geometry'
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        output_file= os.path.join(output_dir, 'epipolar_matches.png')
-        cv2.imwrite(output_file, img_matches)
-        print(f'Matches image saved at {output_file}')
-
-        cv2.waitKey(0)
-        cv2.destroyAllWindows()
+        # FLANN matching with a ratio test and a robust fundamental matrix
+        self.matcher= matcher or FeatureMatcher()
+
+        # Optional FeatureStore, which reuses the features of images seen before
+        self.store= store
+
+        # Stage timings and image counters of detect()
+        self.metrics= metrics or Metrics('epipolar_geometry')
+
+    def detect(self, sinks= ()):
+        '''Compute Epipolar Geometry using stereo images and return the matches of FeatureMatcher.match_pair
+
+        The sinks receive the images side by side with the 10 best inlier matches drawn.
+        '''
+        metrics= self.metrics
+
+        with metrics.run():
+            # Read the stereo images
+            with metrics.stage('decode'):
+                img_left= cv2.imread(self.left_image_path)
+                img_right= cv2.imread(self.right_image_path)
+
+            if img_left is None or img_right is None:
+                print('Error: One or both images not found.')
+                return None
+
+            with metrics.stage('compute'):
+                if self.store is not None:
+                    # Load the cached features, or compute and cache them. The keys hash the
+                    # files as in match_pairs, and a miss reuses the decoded images.
+                    store= self.store
+                    keypoints_left, descriptors_left= store.features(img_left, store.key(self.left_image_path))
+                    keypoints_right, descriptors_right= store.features(img_right, store.key(self.right_image_path))
+                    keypoints_left, keypoints_right= array_to_keypoints(keypoints_left), array_to_keypoints(keypoints_right)
+                else:
+                    # Convert images to grayscale for SIFT
+                    with metrics.stage('convert'):
+                        img_left_gray= cv2.cvtColor(img_left, cv2.COLOR_BGR2GRAY)
+                        img_right_gray= cv2.cvtColor(img_right, cv2.COLOR_BGR2GRAY)
+
+                    # Initialize the SIFT detector
+                    sift= cv2.SIFT_create()
+
+                    # Find keypoints and descriptors with SIFT
+                    keypoints_left, descriptors_left= sift.detectAndCompute(img_left_gray, None)
+                    keypoints_right, descriptors_right= sift.detectAndCompute(img_right_gray, None)
+
+                # Feature matching, keeping the inliers of the fundamental matrix
+                result= self.matcher.match_pair(keypoints_left, descriptors_left, keypoints_right, descriptors_right)
+            metrics.count('frames_processed')
+
+            def draw_matches():
+                # Draw the 10 best inlier matches
+                matches= [cv2.DMatch(int(result.query_idx[i]), int(result.train_idx[i]), float(result.distances[i]))
+                          for i in top_k(result.distances, 10)]
+                return cv2.drawMatches(
+                    img_left, 
+                    keypoints_left,
+                    img_right, 
+                    keypoints_right,
+                    matches,
+                    None,
+                    flags= cv2.DrawMatchesFlags_NOT_DRAW_SINGLE_POINTS
+                )
+
+            emit(sinks, 0, draw_matches, metrics)
+
+        return result
 
 # Testing the EpipolarGeometry class
 if __name__ == '__main__':
@@ -69,8 +88,12 @@ if __name__ == '__main__':
     left_image_path= 'data/view0.png'
     right_image_path= 'data/view2.png'
 
-    # Create an object of EpipolarGeometry
+    # Create an object of EpipolarGeometry, then display and save the matches
     epipolar_geometry= EpipolarGeometry(left_image_path, right_image_path)
-    epipolar_geometry.detect()
+    with DisplaySink('Epipolar Geometry - Matches', delay= 0) as display, \
+         ImageSequenceSink('output/epipolar_geometry', pattern= 'epipolar_matches.png') as saved:
+        epipolar_geometry.detect(sinks= [display, saved])
+    if saved.last_path:
+        print(f'Matches image saved at {saved.last_path}')
 
     print('Epipolar geometry computation completed.')
\ No newline at end of file
@@ -0,0 +1,117 @@
+# Import necessary libraries and packages
+from collections import namedtuple
+import numpy as np
+import cv2
+
+# Inlier correspondences of an image pair with their epipolar geometry. points_* are
+# (N, 2) float32 arrays, *_idx index the keypoints of each image, distances are the
+# descriptor distances, F is the fundamental matrix (None if it could not be
+# estimated) and lines_* are the (N, 3) epipolar lines a*x + b*y + c = 0 of the
+# points of the other image.
+EpipolarMatches= namedtuple('EpipolarMatches', ['points_left', 'points_right', 'query_idx', 'train_idx',
+                                                'distances', 'F', 'lines_left', 'lines_right'])
+
+# FLANN index ids, not exported by the Python bindings
+FLANN_INDEX_KDTREE= 1
+FLANN_INDEX_LSH= 6
+
+def keypoints_to_points(keypoints):
+    '''Return the (N, 2) float32 positions of a list of cv2.KeyPoint or of a keypoint array'''
+    if isinstance(keypoints, np.ndarray):
+        return np.ascontiguousarray(keypoints[:, :2], dtype= np.float32)
+    return cv2.KeyPoint_convert(keypoints).reshape(-1, 2)
+
+def top_k(distances, k):
+    '''Return the indices of the k smallest distances in increasing order, without a full sort'''
+    if k >= len(distances):
+        return np.argsort(distances, kind= 'stable')
+    nearest= np.argpartition(distances, k)[:k]
+    return nearest[np.argsort(distances[nearest], kind= 'stable')]
+
+class FeatureMatcher:
+    '''Approximate nearest neighbor descriptor matching with robust epipolar geometry
+
+    Descriptors are matched with FLANN, a KD-tree forest for float descriptors
+    (SIFT) or LSH for binary ones (ORB), and filtered with Lowe's ratio test. This
+    replaces the quadratic brute-force cross-check. The fundamental matrix is
+    estimated with USAC (MAGSAC++) when available, or RANSAC, and only its inliers
+    are kept.
+    '''
+
+    METHODS= ('usac', 'ransac')
+
+    def __init__(self, ratio= 0.75, method= 'usac', threshold= 1.0, confidence= 0.999, trees= 5, checks= 50):
+        if method not in self.METHODS:
+            raise ValueError(f'Unknown fundamental matrix method {method!r}, expected one of {self.METHODS}.')
+
+        self.ratio= ratio
+        self.threshold= threshold
+        self.confidence= confidence
+        self.trees= trees
+        self.checks= checks
+
+        # USAC needs OpenCV 4.5 or later, fall back to RANSAC before that
+        self.method= getattr(cv2, 'USAC_MAGSAC', cv2.FM_RANSAC) if method == 'usac' else cv2.FM_RANSAC
+
+    def _flann(self, binary):
+        if binary:
+            index_params= dict(algorithm= FLANN_INDEX_LSH, table_number= 6, key_size= 12, multi_probe_level= 1)
+        else:
+            index_params= dict(algorithm= FLANN_INDEX_KDTREE, trees= self.trees)
+        return cv2.FlannBasedMatcher(index_params, dict(checks= self.checks))
+
+    def match(self, descriptors_left, descriptors_right):
+        '''Return (query_idx, train_idx, distances) arrays of the matches passing the ratio test'''
+        empty= (np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0, np.float32))
+        if descriptors_left is None or descriptors_right is None or len(descriptors_left) == 0 or len(descriptors_right) < 2:
+            return empty
+
+        binary= descriptors_left.dtype == np.uint8
+        if not binary:
+            descriptors_left= np.asarray(descriptors_left, dtype= np.float32)
+            descriptors_right= np.asarray(descriptors_right, dtype= np.float32)
+        knn_matches= self._flann(binary).knnMatch(descriptors_left, descriptors_right, k= 2)
+
+        # Lowe's ratio test, LSH may return fewer than two neighbors
+        good= [m[0] for m in knn_matches if len(m) == 2 and m[0].distance < self.ratio * m[1].distance]
+        if not good:
+            return empty
+        return (np.fromiter((m.queryIdx for m in good), np.int32, len(good)),
+                np.fromiter((m.trainIdx for m in good), np.int32, len(good)),
+                np.fromiter((m.distance for m in good), np.float32, len(good)))
+
+    def fundamental(self, points_left, points_right):
+        '''Return the fundamental matrix and the boolean inlier mask of point correspondences'''
+        if len(points_left) < 8:
+            return None, np.zeros(len(points_left), dtype= bool)
+
+        F, mask= cv2.findFundamentalMat(points_left, points_right, self.method, self.threshold, self.confidence)
+        if F is None or F.shape != (3, 3):
+            # Degenerate configurations may give no or several solutions
+            return None, np.zeros(len(points_left), dtype= bool)
+        return F, mask.ravel().astype(bool)
+
+    @staticmethod
+    def epilines(points, image, F):
+        '''Return the (N, 3) epipolar lines in the other image of points of image 1 or 2'''
+        if len(points) == 0:
+            return np.empty((0, 3), dtype= np.float32)
+        return cv2.computeCorrespondEpilines(points.reshape(-1, 1, 2), image, F).reshape(-1, 3)
+
+    def match_pair(self, keypoints_left, descriptors_left, keypoints_right, descriptors_right):
+        '''Match two images and return their inlier correspondences as EpipolarMatches'''
+        query_idx, train_idx, distances= self.match(descriptors_left, descriptors_right)
+        points_left= keypoints_to_points(keypoints_left)[query_idx]
+        points_right= keypoints_to_points(keypoints_right)[train_idx]
+
+        F, inliers= self.fundamental(points_left, points_right)
+        points_left, points_right= points_left[inliers], points_right[inliers]
+        if F is None:
+            lines_left= lines_right= np.empty((0, 3), dtype= np.float32)
+        else:
+            # Lines in the left image come from the right points and vice versa
+            lines_left= self.epilines(points_right, 2, F)
+            lines_right= self.epilines(points_left, 1, F)
+
+        return EpipolarMatches(points_left, points_right, query_idx[inliers], train_idx[inliers],
+                               distances[inliers], F, lines_left, lines_right)
@@ -0,0 +1,172 @@
+# Import necessary libraries and packages
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import hashlib
+import itertools
+import json
+import numpy as np
+import os
+import cv2
+from FeatureMatcher import FeatureMatcher
+from ImageFiles import find_images
+
+# Feature detectors available to the store
+DETECTORS= {
+    'sift': cv2.SIFT_create,
+    'orb': cv2.ORB_create,
+    'akaze': cv2.AKAZE_create
+}
+
+def keypoints_to_array(keypoints):
+    '''Pack cv2.KeyPoint objects into an (N, 7) float32 array
+
+    The columns are x, y, size, angle, response, octave and class_id.
+    '''
+    return np.array([(k.pt[0], k.pt[1], k.size, k.angle, k.response, k.octave, k.class_id) for k in keypoints],
+                    dtype= np.float32).reshape(-1, 7)
+
+def array_to_keypoints(array):
+    '''Unpack an (N, 7) keypoint array into cv2.KeyPoint objects, e.g. for cv2.drawMatches'''
+    return [cv2.KeyPoint(float(x), float(y), float(size), float(angle), float(response), int(octave), int(class_id))
+            for x, y, size, angle, response, octave, class_id in array]
+
+class FeatureStore:
+    '''Persistent cache of keypoints and descriptors, shared by processes and runs
+
+    Features are keyed by a hash of the image content and of the detector and its
+    parameters, so an image is only processed once however many pairs it appears in,
+    and the cache stays valid when files move. Keypoints are stored as (N, 7) arrays
+    and descriptors as .npy files that are opened memory-mapped, so only the rows a
+    matcher touches are read from disk.
+    '''
+
+    def __init__(self, root= 'output/feature_store', detector= 'sift', **detector_params):
+        if detector not in DETECTORS:
+            raise ValueError(f'Unknown detector {detector!r}, expected one of {tuple(DETECTORS)}.')
+
+        self.root= root
+        self.detector_name= detector
+        self.detector_params= detector_params
+        self._detector= None
+
+        # Part of every key, so changing the detector or its parameters never reuses stale features
+        self._params_key= json.dumps({'detector': detector, **detector_params}, sort_keys= True).encode()
+
+    def __getstate__(self):
+        # OpenCV detectors cannot be pickled, worker processes create their own
+        state= self.__dict__.copy()
+        state['_detector']= None
+        return state
+
+    @property
+    def detector(self):
+        if self._detector is None:
+            self._detector= DETECTORS[self.detector_name](**self.detector_params)
+        return self._detector
+
+    def key(self, image):
+        '''Return the cache key of an image file path or an image array'''
+        digest= hashlib.sha1(self._params_key)
+        if isinstance(image, np.ndarray):
+            digest.update(str(image.shape).encode())
+            digest.update(np.ascontiguousarray(image).data)
+        else:
+            with open(image, 'rb') as file:
+                for block in iter(lambda: file.read(1 << 20), b''):
+                    digest.update(block)
+        return digest.hexdigest()
+
+    def _paths(self, key):
+        directory= os.path.join(self.root, key[:2])
+        return os.path.join(directory, key + '.kp.npy'), os.path.join(directory, key + '.desc.npy')
+
+    def load(self, key):
+        '''Return (keypoints, descriptors) of a key, or None if they are not cached'''
+        keypoints_path, descriptors_path= self._paths(key)
+        if not os.path.exists(descriptors_path):
+            return None
+        return np.load(keypoints_path), np.load(descriptors_path, mmap_mode= 'r')
+
+    def _save(self, key, keypoints, descriptors):
+        keypoints_path, descriptors_path= self._paths(key)
+        os.makedirs(os.path.dirname(keypoints_path), exist_ok= True)
+
+        # Write to temporary files and rename them, so concurrent readers never see partial
+        # files. The descriptors are written last as load() checks for them.
+        for path, array in ((keypoints_path, keypoints), (descriptors_path, descriptors)):
+            temporary_path= f'{path}.{os.getpid()}.tmp'
+            with open(temporary_path, 'wb') as file:
+                np.save(file, array)
+            os.replace(temporary_path, path)
+
+    def features(self, image, key= None):
+        '''Return (keypoints, descriptors) of an image path or array, computing them on a cache miss
+
+        keypoints is an (N, 7) array (see keypoints_to_array) and descriptors a
+        read-only memory-mapped (N, D) array. key saves hashing the image again.
+        '''
+        key= key or self.key(image)
+        cached= self.load(key)
+        if cached is not None:
+            return cached
+
+        if not isinstance(image, np.ndarray):
+            path, image= image, cv2.imread(image, cv2.IMREAD_GRAYSCALE)
+            if image is None:
+                raise FileNotFoundError(f'Image not found or not readable: {path}')
+        elif image.ndim == 3:
+            image= cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        keypoints, descriptors= self.detector.detectAndCompute(image, None)
+        if descriptors is None:
+            # Same dtype as found descriptors, uint8 for binary ones such as ORB, so cache hits match
+            dtype= np.uint8 if self.detector.descriptorType() == cv2.CV_8U else np.float32
+            descriptors= np.zeros((0, self.detector.descriptorSize()), dtype= dtype)
+        self._save(key, keypoints_to_array(keypoints), descriptors)
+        return self.load(key)
+
+    def match_pairs(self, paths, pairs= None, matcher= None, workers= None):
+        '''Match image files pairwise on a process pool, yielding (path_a, path_b, EpipolarMatches)
+
+        pairs is a list of (i, j) indices into paths and defaults to all pairs. The
+        features of every image are extracted once, then each pair is matched from the
+        memory-mapped cache. Results are yielded as they complete, not in pair order,
+        and only a few tasks per worker are in flight at a time.
+        '''
+        paths= list(paths)
+        pairs= itertools.combinations(range(len(paths)), 2) if pairs is None else pairs
+        matcher= matcher or FeatureMatcher()
+        workers= workers or os.cpu_count() or 1
+
+        with ProcessPoolExecutor(max_workers= workers) as pool:
+            # Fill the cache first, so no two pair tasks extract the same image
+            keys= list(pool.map(_extract, itertools.repeat(self), paths, chunksize= 4))
+
+            pending= {}
+            for i, j in pairs:
+                pending[pool.submit(_match, self, matcher, keys[i], keys[j])]= (paths[i], paths[j])
+
+                # Keep at most two tasks per worker queued
+                if len(pending) >= 2 * workers:
+                    done, _= wait(pending, return_when= FIRST_COMPLETED)
+                    for future in done:
+                        yield (*pending.pop(future), future.result())
+
+            for future, pair in pending.items():
+                yield (*pair, future.result())
+
+    def match_directory(self, input_dir, pairs= None, matcher= None, workers= None):
+        '''Match the images below input_dir, see match_pairs; pairs index the sorted image list'''
+        paths= [os.path.join(input_dir, path) for path in find_images(input_dir)]
+        yield from self.match_pairs(paths, pairs, matcher, workers)
+
+def _extract(store, path):
+    '''Worker task: make sure the features of an image file are cached and return its key'''
+    key= store.key(path)
+    store.features(path, key)
+    return key
+
+def _match(store, matcher, key_a, key_b):
+    '''Worker task: match two cached images'''
+    keypoints_a, descriptors_a= store.load(key_a)
+    keypoints_b, descriptors_b= store.load(key_b)
+    return matcher.match_pair(keypoints_a, descriptors_a, keypoints_b, descriptors_b)
@@ -0,0 +1,57 @@
+# Import necessary libraries and packages
+import cv2
+
+class FrameContext:
+    '''A decoded frame together with the intermediate results shared by the analyzers
+
+    The grayscale, HSV and hue conversions are computed on first use and cached, so
+    several analyzers looking at the same frame only pay for them once. Analyzers
+    must treat the frame and the cached planes as read-only. With a Metrics object,
+    the conversions are timed as its convert stage.
+    '''
+
+    def __init__(self, frame, index, metrics= None):
+        self.frame= frame
+        self.index= index
+        self.metrics= metrics
+        self._gray= None
+        self._hsv= None
+        self._hue= None
+
+    def _convert(self, image, code):
+        '''Convert the color space of an image, timing it when metrics are attached'''
+        if self.metrics is None:
+            return cv2.cvtColor(image, code)
+        with self.metrics.stage('convert'):
+            return cv2.cvtColor(image, code)
+
+    @property
+    def gray(self):
+        '''Return the grayscale version of the frame'''
+        if self._gray is None:
+            self._gray= self._convert(self.frame, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    @property
+    def hsv(self):
+        '''Return the HSV version of the frame'''
+        if self._hsv is None:
+            self._hsv= self._convert(self.frame, cv2.COLOR_BGR2HSV)
+        return self._hsv
+
+    @property
+    def hue(self):
+        '''Return the hue channel of the HSV frame as a contiguous plane'''
+        if self._hue is None:
+            self._hue= cv2.extractChannel(self.hsv, 0)
+        return self._hue
+
+    def hsv_region(self, x0, y0, x1, y1):
+        '''Return the HSV version of a region of the frame
+
+        Slices the cached full-frame conversion if an analyzer already needed it,
+        otherwise converts only the region.
+        '''
+        if self._hsv is not None:
+            return self._hsv[y0:y1, x0:x1]
+        return self._convert(self.frame[y0:y1, x0:x1], cv2.COLOR_BGR2HSV)
@@ -0,0 +1,144 @@
+# Import necessary libraries and packages
+import numpy as np
+import queue
+import threading
+import cv2
+
+# Sentinel placed on the ready queue once the decoder reaches the end of the video
+_END_OF_STREAM= object()
+
+class FrameSource:
+    '''Decode a video on a background thread into a bounded ring of preallocated frame buffers
+
+    The object mirrors the parts of cv2.VideoCapture used by the analyzers (isOpened, read,
+    get, release), so it can replace the capture in an existing loop. A frame returned by
+    read() lives in one of the ring buffers and stays valid until the next call to read();
+    copy it if it has to outlive the current iteration. start and stop restrict decoding
+    to the frame range [start, stop), seeking to start with CAP_PROP_POS_FRAMES.
+    '''
+
+    def __init__(self, video_path, buffer_size= 8, start= 0, stop= None):
+        self.video_path= video_path
+        self.buffer_size= max(2, int(buffer_size))
+        self.start= start
+        self.stop= stop
+
+        self._cap= cv2.VideoCapture(video_path)
+        if start and self._cap.isOpened():
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        self._buffers= []
+        self._free= queue.Queue()
+        self._ready= queue.Queue()
+        self._stop= threading.Event()
+        self._held= None
+        self._finished= False
+        self._thread= None
+
+        if self._cap.isOpened():
+            self._thread= threading.Thread(target= self._decode, name= 'FrameSource', daemon= True)
+            self._thread.start()
+
+    def isOpened(self):
+        '''Return True if the underlying capture was opened successfully'''
+        return self._thread is not None
+
+    def get(self, prop_id):
+        '''Return a capture property, as cv2.VideoCapture.get does'''
+        return self._cap.get(prop_id)
+
+    def _put_free(self, slot):
+        '''Hand a ring slot back to the decoder'''
+        self._free.put(slot)
+
+    def _take_free(self):
+        '''Wait for a free ring slot, giving up when the source is being released'''
+        while not self._stop.is_set():
+            try:
+                return self._free.get(timeout= 0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    def _decode(self):
+        '''Decoder thread: fill free ring slots and publish them on the ready queue'''
+        try:
+            # Number of frames left to decode in the requested range
+            remaining= None if self.stop is None else self.stop - self.start
+            if remaining is not None and remaining <= 0:
+                return
+
+            # Size the ring from the first frame so every later read decodes in place
+            ret, frame= self._cap.read()
+            if not ret:
+                return
+            self._buffers= [frame] + [np.empty_like(frame) for _ in range(self.buffer_size - 1)]
+            for slot in range(1, self.buffer_size):
+                self._free.put(slot)
+            self._ready.put(0)
+
+            while not self._stop.is_set():
+                if remaining is not None:
+                    remaining -= 1
+                    if remaining <= 0:
+                        break
+
+                # Block while the consumer holds every buffer (backpressure)
+                slot= self._take_free()
+                if slot is None:
+                    break
+
+                ret, frame= self._cap.read(self._buffers[slot])
+                if not ret:
+                    break
+
+                # The capture allocates a new array when the frame size changes mid-stream
+                if frame is not self._buffers[slot]:
+                    self._buffers[slot]= frame
+                self._ready.put(slot)
+        except Exception as error:
+            self._ready.put(error)
+        finally:
+            self._ready.put(_END_OF_STREAM)
+
+    def read(self):
+        '''Return the next decoded frame as (ret, frame), like cv2.VideoCapture.read'''
+        if self._thread is None or self._finished:
+            return False, None
+
+        # The previously returned buffer is no longer used by the caller
+        if self._held is not None:
+            self._put_free(self._held)
+            self._held= None
+
+        item= self._ready.get()
+        if item is _END_OF_STREAM:
+            self._finished= True
+            return False, None
+        if isinstance(item, Exception):
+            self._finished= True
+            raise RuntimeError(f'Error: Could not decode frame from {self.video_path}.') from item
+
+        self._held= item
+        return True, self._buffers[item]
+
+    def __iter__(self):
+        while True:
+            ret, frame= self.read()
+            if not ret:
+                return
+            yield frame
+
+    def release(self):
+        '''Stop the decoder thread and release the capture'''
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread= None
+        self._finished= True
+        self._cap.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
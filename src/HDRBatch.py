@@ -0,0 +1,223 @@
+# Import necessary libraries and packages
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import argparse
+import numpy as np
+import os
+import tempfile
+import cv2
+from HDRPipeline import HDRPipeline, read_bracket, shift_image
+
+def find_brackets(root, listing= 'exposure_times.txt'):
+    '''Yield the bracket directories below root, those holding an exposure listing, in sorted order'''
+    for directory, dirs, files in os.walk(root):
+        dirs.sort()
+        if listing in files:
+            yield directory
+
+def _calibration_image(image, max_size= 1024):
+    '''Downscale an exposure for CalibrateDebevec, which only samples a few pixels'''
+    scale= min(1.0, max_size / max(image.shape[:2]))
+    return cv2.resize(np.asarray(image), None, fx= scale, fy= scale, interpolation= cv2.INTER_NEAREST)
+
+def merge_tiled(image_files, exposure_times, pipeline= None, tile_rows= 256, scratch_dir= None):
+    '''Merge a bracket with MergeDebevec in horizontal tiles and tonemap it, out of core
+
+    The exposures are decoded one at a time into a memory-mapped scratch file, then
+    merged tile by tile into a memory-mapped float32 radiance map. The tonemap needs
+    the global range of the radiance, so it runs in a second pass over the tiles with
+    the same normalization and gamma as cv2.Tonemap. Peak memory is one decoded
+    exposure, or the tiles of all exposures, plus the 8-bit result, instead of every
+    exposure and several float32 copies of the image. Returns the 8-bit image.
+    '''
+    pipeline= pipeline or HDRPipeline()
+    if pipeline.mode != 'debevec':
+        raise ValueError('Tiled merging only supports the debevec mode.')
+    if not image_files:
+        raise ValueError('The bracket has no exposures.')
+    exposure_times= np.asarray(exposure_times, dtype= np.float32)
+
+    with tempfile.TemporaryDirectory(dir= scratch_dir) as scratch:
+        exposures= gray= radiance= None
+        for index, image_file in enumerate(image_files):
+            image= cv2.imread(image_file)
+            if image is None:
+                raise FileNotFoundError(f'Image not found or not readable: {image_file}')
+            if exposures is None:
+                height, width= image.shape[:2]
+                shape= (len(image_files), height, width)
+                exposures= np.lib.format.open_memmap(os.path.join(scratch, 'exposures.npy'), 'w+', np.uint8, shape + (3,))
+                gray= np.lib.format.open_memmap(os.path.join(scratch, 'gray.npy'), 'w+', np.uint8, shape)
+            elif image.shape[:2] != (height, width):
+                raise ValueError(f'Exposure {image_file} does not match the size of the bracket.')
+            exposures[index]= image
+            gray[index]= cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        del image
+
+        # Estimate the shifts on the grayscale exposures, then shift one exposure at a time
+        if pipeline.align_enabled and len(image_files) > 1:
+            for index, shift in enumerate(pipeline.estimate_shifts(gray)):
+                if shift != (0, 0):
+                    exposures[index]= shift_image(np.asarray(exposures[index]), shift)
+        del gray
+
+        response= None
+        if pipeline.camera_profile is not None:
+            response= pipeline.response([_calibration_image(exposure) for exposure in exposures], exposure_times)
+
+        # First pass: merge every tile and track the range of the radiance
+        merge_debevec= cv2.createMergeDebevec()
+        radiance= np.lib.format.open_memmap(os.path.join(scratch, 'radiance.npy'), 'w+', np.float32, (height, width, 3))
+        low, high= np.inf, -np.inf
+        for top in range(0, height, tile_rows):
+            tile= [np.ascontiguousarray(exposure[top:top + tile_rows]) for exposure in exposures]
+            if response is None:
+                merged= merge_debevec.process(tile, times= exposure_times.copy())
+            else:
+                merged= merge_debevec.process(tile, times= exposure_times.copy(), response= response)
+            radiance[top:top + tile_rows]= merged
+            low, high= min(low, float(np.nanmin(merged))), max(high, float(np.nanmax(merged)))
+
+        # Second pass: normalize to [0, 1] and apply the gamma, as cv2.Tonemap does
+        ldr_8bit= np.empty((height, width, 3), dtype= np.uint8)
+        for top in range(0, height, tile_rows):
+            tile= np.array(radiance[top:top + tile_rows])
+            if high - low > np.finfo(np.float64).eps:
+                tile= (tile - low) / (high - low)
+            tile= cv2.pow(tile, 1.0 / pipeline.gamma)
+            ldr_8bit[top:top + tile_rows]= np.clip(tile * 255, 0, 255).astype('uint8')
+
+        # Release the memory maps before the scratch directory is removed
+        del exposures, radiance, tile
+        return ldr_8bit
+
+def process_bracket(directory, output_path, pipeline_params= None, tiled= False, tile_rows= 256, scratch_dir= None):
+    '''Merge one bracket directory and write the 8-bit result
+
+    Returns the directory and None on success or an error message.
+    '''
+    pipeline= HDRPipeline(**(pipeline_params or {}))
+    try:
+        if tiled:
+            image_files, exposure_times= read_bracket(directory)
+            ldr_8bit= merge_tiled(image_files, exposure_times, pipeline, tile_rows, scratch_dir)
+        else:
+            ldr_8bit= pipeline.process_directory(directory)
+    except (OSError, ValueError, cv2.error) as error:
+        return directory, str(error)
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok= True)
+    if not cv2.imwrite(output_path, ldr_8bit):
+        return directory, 'Could not write the output image.'
+    return directory, None
+
+def estimate_bracket_memory(directory, tiled= False, tile_rows= 256):
+    '''Estimate the peak memory in bytes of merging a bracket, from its first exposure'''
+    image_files, exposure_times= read_bracket(directory)
+    image= cv2.imread(image_files[0]) if image_files else None
+    if image is None:
+        return 0
+    height, width= image.shape[:2]
+    if tiled:
+        # One exposure, the tiles of all exposures and their radiance, and the 8-bit result
+        rows= min(tile_rows, height)
+        return height * width * 3 * 2 + len(image_files) * rows * width * 3 + rows * width * 3 * 4 * 4
+    # Every exposure with its grayscale copy, and a few float32 copies of the radiance map
+    return len(image_files) * height * width * 4 + height * width * 3 * 4 * 4
+
+def process_brackets(root, output_dir, workers= None, max_memory= None, tiled= False, tile_rows= 256,
+                     scratch_dir= None, output_ext= '.png', **pipeline_params):
+    '''Merge every bracket directory below root on a process pool, writing one image per bracket
+
+    With max_memory (bytes), the number of workers is reduced so that the estimated
+    peak memory of the brackets merged at once stays below it. With a camera
+    profile in pipeline_params, the response is calibrated once before the pool
+    starts and every worker loads it from the cache. Returns the number of images
+    written and a list of (directory, error).
+    '''
+    workers= workers or os.cpu_count() or 1
+    directories= list(find_brackets(root))
+    if not directories:
+        return 0, []
+
+    if max_memory is not None:
+        per_bracket= estimate_bracket_memory(directories[0], tiled, tile_rows)
+        workers= max(1, min(workers, max_memory // max(1, per_bracket)))
+
+    pipeline= HDRPipeline(**pipeline_params)
+    if pipeline.camera_profile is not None and not os.path.exists(pipeline.response_path()):
+        # Calibrate once here rather than in every worker at the same time
+        image_files, exposure_times= read_bracket(directories[0])
+        images= [cv2.imread(image_file) for image_file in image_files]
+        if images and all(image is not None for image in images):
+            pipeline.response([_calibration_image(image) for image in images], exposure_times)
+
+    written= 0
+    errors= []
+    with ProcessPoolExecutor(max_workers= workers) as pool:
+        pending= set()
+        for directory in directories:
+            relative_path= os.path.relpath(directory, root)
+            name= os.path.basename(os.path.abspath(root)) if relative_path == '.' else relative_path
+            output_path= os.path.join(output_dir, name + output_ext)
+            pending.add(pool.submit(process_bracket, directory, output_path, pipeline_params, tiled, tile_rows, scratch_dir))
+
+            # Keep at most two tasks per worker queued
+            if len(pending) >= 2 * workers:
+                done, pending= wait(pending, return_when= FIRST_COMPLETED)
+                for future in done:
+                    directory, error= future.result()
+                    if error is None:
+                        written += 1
+                    else:
+                        errors.append((directory, error))
+
+        for future in pending:
+            directory, error= future.result()
+            if error is None:
+                written += 1
+            else:
+                errors.append((directory, error))
+
+    return written, errors
+
+def main(argv= None):
+    parser= argparse.ArgumentParser(description= 'Merge every exposure bracket below a directory into an HDR image.')
+    parser.add_argument('root', help= 'directory scanned recursively for folders with an exposure_times.txt')
+    parser.add_argument('output_dir', help= 'directory receiving one tonemapped image per bracket')
+    parser.add_argument('--workers', type= int, default= None, help= 'number of worker processes (default: CPU count)')
+    parser.add_argument('--max-memory', type= float, default= None, help= 'memory budget of the workers in GB')
+    parser.add_argument('--mode', choices= HDRPipeline.MODES, default= 'debevec', help= 'merging method')
+    parser.add_argument('--camera-profile', default= None, help= 'name under which the camera response is cached')
+    parser.add_argument('--tiled', action= 'store_true', help= 'merge out of core in tiles (debevec only)')
+    parser.add_argument('--tile-rows', type= int, default= 256, help= 'rows per tile with --tiled (default: 256)')
+    parser.add_argument('--scratch-dir', default= None, help= 'directory for the memory-mapped buffers of --tiled')
+    parser.add_argument('--no-align', action= 'store_true', help= 'skip the exposure alignment')
+    parser.add_argument('--ext', default= '.png', help= 'output file extension (default: .png)')
+    args= parser.parse_args(argv)
+
+    if args.tiled and args.mode != 'debevec':
+        parser.error('--tiled only supports the debevec mode.')
+
+    written, errors= process_brackets(
+        args.root,
+        args.output_dir,
+        workers= args.workers,
+        max_memory= int(args.max_memory * (1 << 30)) if args.max_memory else None,
+        tiled= args.tiled,
+        tile_rows= args.tile_rows,
+        scratch_dir= args.scratch_dir,
+        output_ext= args.ext,
+        mode= args.mode,
+        align= not args.no_align,
+        camera_profile= args.camera_profile
+    )
+
+    for directory, error in errors:
+        print(f'Error: {directory}: {error}')
+    print(f'Merged {written} brackets into {args.output_dir}')
+    return 1 if errors else 0
+
+# Running batch HDR merging from the command line, e.g.
+# python src/HDRBatch.py data output/hdr_batch --tiled --max-memory 4
+if __name__ == '__main__':
+    raise SystemExit(main())
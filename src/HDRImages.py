@@ -1,62 +1,45 @@
 # Import necessary libraries and packages
 import numpy as np
-import os
 import cv2
+from HDRPipeline import HDRPipeline, read_bracket
+from Metrics import Metrics
+from OutputSinks import DisplaySink, ImageSequenceSink, emit
 
 class HDRImaging:
-    def __init__(self, hdr_images_dir):
+    def __init__(self, hdr_images_dir, pipeline= None, metrics= None):
         self.hdr_images_dir= hdr_images_dir
 
-    def create_hdr_image(self):
-        '''Create HDR Image from a set of images'''
+        # Alignment, merging and tonemapping, reusable across bracket sets
+        self.pipeline= pipeline or HDRPipeline()
 
-        # Collect all images from the directory and their exposure times
-        image_files= []
-        exposure_times= []
+        # Stage timings and image counters of create_hdr_image()
+        self.metrics= metrics or Metrics('hdr_imaging')
 
-        with open(os.path.join(self.hdr_images_dir, 'exposure_times.txt'), 'r') as file:
-            for line in file:
-                img_name, exposure_time= line.strip().split()
-                image_files.append(os.path.join(self.hdr_images_dir, img_name))
-                exposure_times.append(float(exposure_time))
+    def create_hdr_image(self, sinks= ()):
+        '''Create HDR Image from a set of images and return the tonemapped 8-bit image
 
-        images= [cv2.imread(img_file) for img_file in image_files]
+        The image is also written to the sinks, e.g. a DisplaySink or an ImageSequenceSink.
+        '''
+        metrics= self.metrics
 
-        if not images:
-            print('Error: No images found in the specified directory.')
-            return
-        
-        exposure_times= np.array(exposure_times, dtype= np.float32)
+        with metrics.run():
+            # Collect all images from the directory and their exposure times
+            with metrics.stage('decode'):
+                image_files, exposure_times= read_bracket(self.hdr_images_dir)
+                images= [cv2.imread(img_file) for img_file in image_files]
 
-        # Use AlignMTB algorithm to align images
-        alignMTB= cv2.createAlignMTB()
-        alignMTB.process(images, images)
+            if not images or any(image is None for image in images):
+                print('Error: No images found in the specified directory.')
+                return None
 
-        # Merge to HDR using exposure times
-        merge_debevec= cv2.createMergeDebevec()
-        hdr= merge_debevec.process(images, times= exposure_times.copy())
+            # Align the images on a downscaled pyramid, merge them and tonemap the result to 8 bits
+            with metrics.stage('compute'):
+                ldr_8bit= self.pipeline.process(images, exposure_times)
+            metrics.count('frames_processed')
 
-        # Tonemap the HDR image to convert it to an 8-bit image
-        tonemap= cv2.createTonemap(gamma= 2.2)
-        ldr= tonemap.process(hdr)
+            emit(sinks, 0, lambda: ldr_8bit, metrics)
 
-        # Normalize to the range 0-255 for display
-        ldr_8bit= np.clip(ldr * 255, 0, 255).astype('uint8')
-
-        # Display the result
-        cv2.imshow('HDR Image', ldr_8bit)
-
-        # Save the HDR image to the output directory
-        output_dir= 'output/hdr_imaging'
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        output_file= os.path.join(output_dir, 'hdr_image.png')
-        cv2.imwrite(output_file, ldr_8bit)
-        print(f'HDR image saved at {output_file}')
-
-        cv2.waitKey(0)
-        cv2.destroyAllWindows()
+        return ldr_8bit
 
 # Test the HDRImaging class
 if __name__ == '__main__':
@@ -65,8 +48,12 @@ if __name__ == '__main__':
     # Path to the HDR image directory
     hdr_images_dir= 'data/HDRImagesInput'
 
-    # Create an object of HDRImaging
+    # Create an object of HDRImaging, then display and save the HDR image
     hdr_imaging= HDRImaging(hdr_images_dir)
-    hdr_imaging.create_hdr_image()
+    with DisplaySink('HDR Image', delay= 0) as display, \
+         ImageSequenceSink('output/hdr_imaging', pattern= 'hdr_image.png') as saved:
+        hdr_imaging.create_hdr_image(sinks= [display, saved])
+    if saved.last_path:
+        print(f'HDR image saved at {saved.last_path}')
 
     print('HDR imaging completed.')
\ No newline at end of file
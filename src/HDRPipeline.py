@@ -0,0 +1,182 @@
+# Import necessary libraries and packages
+import math
+import numpy as np
+import os
+import cv2
+
+def read_bracket(directory, listing= 'exposure_times.txt'):
+    '''Return the image paths and float32 exposure times listed in a bracket directory
+
+    Every line of the listing holds an image file name and its exposure time in seconds.
+    '''
+    image_files= []
+    exposure_times= []
+    with open(os.path.join(directory, listing), 'r') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            img_name, exposure_time= line.strip().split()
+            image_files.append(os.path.join(directory, img_name))
+            exposure_times.append(float(exposure_time))
+    return image_files, np.array(exposure_times, dtype= np.float32)
+
+def shift_image(image, shift):
+    '''Shift an image by (dx, dy) pixels, filling the uncovered border with zeros'''
+    return cv2.createAlignMTB().shiftMat(image, tuple(int(v) for v in shift))
+
+class HDRPipeline:
+    '''Alignment, merging and tonemapping of exposure brackets with reusable state
+
+    Alignment shifts are estimated with AlignMTB on images downscaled by
+    align_scale, scaled up and refined on the last pyramid levels at full
+    resolution, falling back to full-resolution MTB when the refinement reaches
+    the edge of its range, then applied with shiftMat. When a camera_profile is
+    named, the camera response is calibrated with CalibrateDebevec the first time
+    and cached on disk in response_dir for every later bracket of that camera.
+    Without a profile the merge assumes a linear response, as MergeDebevec does by default.
+    mode='mertens' fuses the exposures directly with MergeMertens, which needs no
+    exposure times and skips the radiance map when only a display image is wanted.
+    '''
+
+    MODES= ('debevec', 'mertens')
+
+    def __init__(self, mode= 'debevec', align= True, align_scale= 0.25, max_bits= 6, camera_profile= None,
+                 response_dir= 'output/hdr_responses', samples= 70, gamma= 2.2):
+        if mode not in self.MODES:
+            raise ValueError(f'Unknown HDR mode {mode!r}, expected one of {self.MODES}.')
+
+        self.mode= mode
+        self.align_enabled= align
+        self.align_scale= align_scale
+        self.max_bits= max_bits
+        self.camera_profile= camera_profile
+        self.response_dir= response_dir
+        self.samples= samples
+        self.gamma= gamma
+
+        # Camera response of the profile, loaded or calibrated on first use
+        self._response= None
+
+    def estimate_shifts(self, gray, min_usable= 0.1):
+        '''Return the (dx, dy) shift aligning each grayscale exposure
+
+        MTB compares bitmaps thresholded at the median, ignoring pixels close to it,
+        and returns arbitrary shifts for images where almost every pixel is ignored,
+        such as the darkest or brightest exposures. The reference is therefore the
+        image with the most usable pixels, and images with fewer than min_usable of
+        them are left in place. The images may be memory-mapped, as only their
+        downscaled copies and the windows compared at full resolution are read.
+        '''
+        scale= self.align_scale
+
+        # The downscaled image stands for the top pyramid levels, and the last levels at
+        # full resolution refine the scaled shift. One level more than the scale covers
+        # a coarse estimate that is off by a downscaled pixel, not just its rounding error
+        scale_bits= max(1, int(math.ceil(math.log2(1 / scale)))) if scale < 1 else 0
+        refine_bits= scale_bits + 1 if scale_bits else 0
+        mtb= cv2.createAlignMTB(max_bits= max(1, self.max_bits - scale_bits))
+        refine_mtb= cv2.createAlignMTB(max_bits= refine_bits) if refine_bits else None
+        full_mtb= cv2.createAlignMTB(max_bits= self.max_bits)
+
+        small= [cv2.resize(image, None, fx= scale, fy= scale, interpolation= cv2.INTER_AREA) for image in gray] if scale < 1 else gray
+
+        # Fraction of pixels outside the exclusion range around the median
+        exclude_range= mtb.getExcludeRange()
+        usable= [np.mean(np.abs(image.astype(np.int16) - np.median(image)) > exclude_range) for image in small]
+        reference= int(np.argmax(usable))
+        height, width= gray[reference].shape
+
+        shifts= []
+        for index in range(len(gray)):
+            if index == reference or usable[index] < min_usable:
+                shifts.append((0, 0))
+                continue
+
+            dx, dy= mtb.calculateShift(small[reference], small[index])
+            shift= (round(dx / scale), round(dy / scale))
+            if refine_mtb is None:
+                shifts.append(shift)
+                continue
+
+            # Refine around the scaled shift at full resolution, on the windows of the two
+            # images that overlap at that shift. Shifting the image with shiftMat instead
+            # would add a zero-filled border, which MTB locks onto.
+            limit= (1 << refine_bits) - 1
+            margin= max(abs(shift[0]), abs(shift[1])) + limit + 1
+            if 2 * margin < min(height, width):
+                reference_window= gray[reference][margin:height - margin, margin:width - margin]
+                window= gray[index][margin - shift[1]:height - margin - shift[1], margin - shift[0]:width - margin - shift[0]]
+                dx, dy= refine_mtb.calculateShift(np.ascontiguousarray(reference_window), np.ascontiguousarray(window))
+                if max(abs(dx), abs(dy)) < limit:
+                    shifts.append((shift[0] + dx, shift[1] + dy))
+                    continue
+
+            # The coarse estimate is further off than the refinement reaches: align at full resolution
+            shifts.append(tuple(int(v) for v in full_mtb.calculateShift(np.ascontiguousarray(gray[reference]),
+                                                                       np.ascontiguousarray(gray[index]))))
+        return shifts
+
+    def align(self, images, min_usable= 0.1):
+        '''Align the images in place, returning their (dx, dy) shifts, see estimate_shifts'''
+        shifts= self.estimate_shifts([cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) for image in images], min_usable)
+        for index, shift in enumerate(shifts):
+            if shift != (0, 0):
+                images[index]= shift_image(images[index], shift)
+        return shifts
+
+    def response_path(self):
+        '''Return the cache file of the camera response of the profile'''
+        return os.path.join(self.response_dir, f'{self.camera_profile}_debevec_{self.samples}.npy')
+
+    def response(self, images, exposure_times):
+        '''Return the camera response of the profile, calibrating and caching it on first use'''
+        if self._response is None:
+            path= self.response_path()
+            if os.path.exists(path):
+                self._response= np.load(path)
+            else:
+                calibrate= cv2.createCalibrateDebevec(samples= self.samples)
+                self._response= calibrate.process(images, exposure_times.copy())
+                os.makedirs(self.response_dir, exist_ok= True)
+
+                # Write and rename, so concurrent workers never load a partial file
+                temporary_path= f'{path}.{os.getpid()}.tmp'
+                with open(temporary_path, 'wb') as file:
+                    np.save(file, self._response)
+                os.replace(temporary_path, path)
+        return self._response
+
+    def merge(self, images, exposure_times):
+        '''Merge aligned images into a float32 radiance map with MergeDebevec'''
+        merge_debevec= cv2.createMergeDebevec()
+        if self.camera_profile is None:
+            return merge_debevec.process(images, times= exposure_times.copy())
+        return merge_debevec.process(images, times= exposure_times.copy(), response= self.response(images, exposure_times))
+
+    def tonemap(self, hdr):
+        '''Tonemap a radiance map to an 8-bit image'''
+        ldr= cv2.createTonemap(gamma= self.gamma).process(hdr)
+        return np.clip(ldr * 255, 0, 255).astype('uint8')
+
+    def fuse(self, images):
+        '''Fuse the exposures into an 8-bit image with MergeMertens'''
+        fused= cv2.createMergeMertens().process(images)
+        return np.clip(fused * 255, 0, 255).astype('uint8')
+
+    def process(self, images, exposure_times= None):
+        '''Return the 8-bit HDR image of a bracket, aligning the images in place first'''
+        if self.align_enabled and len(images) > 1:
+            self.align(images)
+        if self.mode == 'mertens':
+            return self.fuse(images)
+        if exposure_times is None:
+            raise ValueError('The debevec mode needs the exposure times.')
+        return self.tonemap(self.merge(images, np.asarray(exposure_times, dtype= np.float32)))
+
+    def process_directory(self, directory):
+        '''Return the 8-bit HDR image of a bracket directory with an exposure_times.txt'''
+        image_files, exposure_times= read_bracket(directory)
+        images= [cv2.imread(image_file) for image_file in image_files]
+        if not images or any(image is None for image in images):
+            raise FileNotFoundError(f'Missing or unreadable bracket images in {directory}')
+        return self.process(images, exposure_times)
@@ -1,51 +1,70 @@
 # Import necessary libraries and packages
 import numpy as np
-import os
 import cv2
+from Metrics import Metrics
+from OutputSinks import DisplaySink, ImageSequenceSink, emit
+from TiledDenoiser import TiledDenoiser
 
 class ImageDenoising:
-    def __init__(self, image_path):
+    def __init__(self, image_path, metrics= None):
         self.image_path= image_path
 
-    def denoise(self):
-        '''Apply different denoising techniques to the image'''
+        # Stage timings and image counters of denoise()
+        self.metrics= metrics or Metrics('image_denoising')
 
-        # Read the image
-        image= cv2.imread(self.image_path)
-        if image is None:
-            print('Error: Image not found.')
-            return
-        
-        # Apply FastNlMeansDenoisingColored
-        denoised_image_colored= cv2.fastNlMeansDenoisingColored(image, None, 10, 10, 7, 21)
+    def denoise(self, mode= 'both', tile_size= None, workers= None, sinks= ()):
+        '''Apply different denoising techniques to the image and return the denoised images
 
-        # Convert image to grayscale
-        grayscale_image= cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        mode selects the 'color' path, the 'gray' path or 'both', which return the
+        colored image, the grayscale image or both of them as a (colored, gray)
+        tuple. With tile_size set, the image is denoised in overlapping tiles on a
+        pool of workers. The denoised images are also written to the sinks with the
+        index 'colored' or 'gray'.
+        '''
+        if mode not in ('color', 'gray', 'both'):
+            raise ValueError(f'Unknown denoising mode {mode!r}, expected color, gray or both.')
+        metrics= self.metrics
+        denoised_image_colored, denoised_image_gray= None, None
 
-        # Apply FastNlMeansDenoising on grayscale image
-        denoised_image_gray= cv2.fastNlMeansDenoising(grayscale_image, None, 10, 7, 21)
+        with metrics.run():
+            # Read the image
+            with metrics.stage('decode'):
+                image= cv2.imread(self.image_path)
+            if image is None:
+                print('Error: Image not found.')
+                return None
 
-        # Display the original and denoised image
-        cv2.imshow('Original Image', image)
-        cv2.imshow('Denoised Image- Colored', denoised_image_colored)
-        cv2.imshow('Denoised Image- Grayscale', denoised_image_gray)
+            # Use the tiled engine for large images, it gives the same result
+            denoiser= TiledDenoiser(10, 10, 7, 21, tile_size= tile_size, workers= workers) if tile_size else None
 
-        # Save the denoised images to the output directory
-        output_dir= 'output/image_denoising'
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+            if mode in ('color', 'both'):
+                # Apply FastNlMeansDenoisingColored
+                with metrics.stage('compute'):
+                    if denoiser is None:
+                        denoised_image_colored= cv2.fastNlMeansDenoisingColored(image, None, 10, 10, 7, 21)
+                    else:
+                        denoised_image_colored= denoiser.denoise_colored(image)
+                emit(sinks, 'colored', lambda: denoised_image_colored, metrics)
 
-        # Save the images
-        output_file_colored= os.path.join(output_dir, 'denoised_colored.png')
-        cv2.imwrite(output_file_colored, denoised_image_colored)
-        print(f'Denoised colored image saved at {output_file_colored}')
+            if mode in ('gray', 'both'):
+                # Convert image to grayscale
+                with metrics.stage('convert'):
+                    grayscale_image= cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
 
-        output_file_gray= os.path.join(output_dir, 'denoised_gray.png')
-        cv2.imwrite(output_file_gray, denoised_image_gray)
-        print(f'Denoised grayscale imaged saved at {output_file_gray}')
+                # Apply FastNlMeansDenoising on grayscale image
+                with metrics.stage('compute'):
+                    if denoiser is None:
+                        denoised_image_gray= cv2.fastNlMeansDenoising(grayscale_image, None, 10, 7, 21)
+                    else:
+                        denoised_image_gray= denoiser.denoise_gray(grayscale_image)
+                emit(sinks, 'gray', lambda: denoised_image_gray, metrics)
+            metrics.count('frames_processed')
 
-        cv2.waitKey(0)
-        cv2.destroyAllWindows()
+        if mode == 'color':
+            return denoised_image_colored
+        if mode == 'gray':
+            return denoised_image_gray
+        return denoised_image_colored, denoised_image_gray
 
 # Testing the ImageDenoising class
 if __name__ == '__main__':
@@ -54,8 +73,12 @@ if __name__ == '__main__':
     # Path to the image
     image_path= 'data/view0.png'
 
-    # Create an object of ImageDenoising
+    # Create an object of ImageDenoising, then display and save both denoised images
     image_denoising= ImageDenoising(image_path)
-    image_denoising.denoise()
+    with DisplaySink('Denoised Image - {index}', delay= 0) as display, \
+         ImageSequenceSink('output/image_denoising', pattern= 'denoised_{index}.png') as saved:
+        image_denoising.denoise(sinks= [display, saved])
+    if saved.last_path:
+        print(f'Denoised images saved in {saved.output_dir}')
 
     print('Image denoising completed.')
\ No newline at end of file
@@ -0,0 +1,13 @@
+# Import necessary libraries and packages
+import os
+
+# Image file extensions picked up when scanning a directory
+IMAGE_EXTENSIONS= ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.webp')
+
+def find_images(input_dir):
+    '''Yield the relative paths of the images below input_dir, in sorted order'''
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.relpath(os.path.join(root, name), input_dir)
@@ -1,107 +1,163 @@
 # Import necessary libraries and packages
+from collections import namedtuple
 import numpy as np
-import os
 import cv2
+from Metrics import Metrics
+from OutputSinks import DisplaySink, ImageSequenceSink, VideoWriterSink
+from TrackStore import TrackStore
+from VideoPipeline import stream_video, video_fps
+
+# Per-frame result: ids (N,) and points (N, 2) of the active tracks, and segments, the
+# (M, 2, 2) consecutive positions of their histories, see TrackStore.segments
+TrackResult= namedtuple('TrackResult', ['ids', 'points', 'segments'])
 
 class LucasKanadeOpticalFlow:
-    def __init__(self, video_path):
-        self.video_path= video_path
+    # Frames replayed before a chunk by ChunkedExecutor: the frame seeding the tracks
+    warmup_frames= 1
 
-    def detect(self, frame_interval= 500):
-        '''Perform Lucas Kanade Optical Flow on a video and save frames at an interval'''
+    def __init__(self, video_path= None, max_corners= 100, redetect_interval= 10, fb_threshold= 1.0, history= 32, metrics= None):
+        self.video_path= video_path
 
-        # Read the video
-        cap= cv2.VideoCapture(self.video_path)
-        if not cap.isOpened():
-            print('Error: Could not open video.')
-            return
-        
         # Define parameters for ShiTomasi corner detection
-        feature_params= dict(
-            maxCorners=100,
+        self.feature_params= dict(
+            maxCorners= max_corners,
             qualityLevel= 0.3,
-            minDistance= 7, 
+            minDistance= 7,
             blockSize= 7
         )
-        
+
         # Define parameters for Lucas-Kanade Optical Flow
-        lk_params= dict(
+        self.lk_params= dict(
             winSize= (15,15),
             maxLevel= 2,
             criteria= (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)
         )
 
-        # Take the first frame and find corners in it
-        ret, old_frame= cap.read()
-        if not ret:
-            print('Error: Could not read the first frame.')
-            return
-        
-        old_gray= cv2.cvtColor(old_frame, cv2.COLOR_BGR2GRAY)
-        p0= cv2.goodFeaturesToTrack(old_gray, mask= None, **feature_params)
-
-        # Create a mask image for drawing purposes
-        mask= np.zeros_like(old_frame)
-
-        # Define the output directory for saving frames
-        output_dir= 'output/lucas_kanade_optical_flow'
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        frame_count= 0
-        saved_frame_count= 0
-
-        while True:
-            ret, frame= cap.read()
-            if not ret:
-                break
+        # Re-detect corners every redetect_interval frames, or as soon as fewer than
+        # reseed_below * max_corners points are left, to keep the count near max_corners
+        self.redetect_interval= redetect_interval
+        self.reseed_below= 0.8
 
-            frame_gray= cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        # Maximum distance in pixels between a point and its forward-backward track
+        self.fb_threshold= fb_threshold
 
-            # Calculate the optical flow
-            p1, st, err= cv2.calcOpticalFlowPyrLK(old_gray, frame_gray, p0, None, **lk_params)
+        # Number of positions kept and drawn per track
+        self.history= history
 
-            # Check if p1 is None
-            if p1 is None:
-                print('Warning: No optical flow found in this frame.')
-                break
+        # Stage timings and frame counters of detect()
+        self.metrics= metrics or Metrics('lucas_kanade_optical_flow')
 
-            # Select good points
-            good_new= p1[st == 1]
-            good_old= p0[st == 1]
+        self.reset()
 
-            # Draw the tracks
-            for i, (new,old) in enumerate(zip(good_new, good_old)):
-                a, b= new.ravel()
-                c, d= old.ravel()
-                mask= cv2.line(mask, (int(a), int(b)), (int(c), int(d)), (0,255,0), 2)
-                frame= cv2.circle(frame, (int(a), int(b)), 5, (0, 0, 255), -1)
+    def reset(self):
+        '''Forget the tracked points so the next processed frame starts a new sequence'''
+        self.old_gray= None
+        self.tracks= TrackStore(capacity= self.feature_params['maxCorners'], history= self.history)
+        self.frames_since_detect= 0
 
-            img= cv2.add(frame, mask)
+    def resume(self, state, chunk_index):
+        '''Start a chunk of ChunkedExecutor, giving its tracks ids no other chunk uses'''
+        self.tracks.next_id= chunk_index << 32
 
-            # Save the frame at specified intervals
-            if frame_count % frame_interval == 0:
-
-                # Display the result
-                cv2.imshow('Lucas Kanade Optical Flow', img)
+    def _detect(self, gray):
+        '''Start new tracks at corners found away from the points already tracked'''
+        self.frames_since_detect= 0
+        missing= self.tracks.capacity - len(self.tracks)
+        if missing <= 0:
+            return
 
-                # Save the frame to the output directory
-                output_file= os.path.join(output_dir, f'frame_{saved_frame_count:04d}.png')
-                cv2.imwrite(output_file, img)
-                saved_frame_count += 1
+        # Mask out a disc of radius minDistance around every tracked point
+        mask= np.full(gray.shape, 255, dtype= np.uint8)
+        _, points= self.tracks.current()
+        radius= self.feature_params['minDistance']
+        cv2.polylines(mask, points.astype(np.int32).reshape(-1,1,2), True, 0, 2 * radius + 1)
 
-                # Press 'q' to exit the video display
-                if cv2.waitKey(30) & 0xFF == ord('q'):
-                    break
+        feature_params= dict(self.feature_params, maxCorners= missing)
+        corners= cv2.goodFeaturesToTrack(gray, mask= mask, **feature_params)
+        if corners is not None:
+            self.tracks.add(corners.reshape(-1,2))
 
-            frame_count += 1
+    def process(self, ctx):
+        '''Track the points into this frame and return a TrackResult
 
-            # Update the previous frame and previous points
-            old_gray= frame_gray.copy()
-            p0= good_new.reshape(-1,1,2)
+        Returns None for the first frame of a sequence, which only seeds the tracks.
+        '''
+        frame_gray= ctx.gray
 
-        cap.release()
-        cv2.destroyAllWindows()
+        # Take the first frame and find corners in it
+        if self.old_gray is None:
+            self.old_gray= frame_gray
+            self._detect(frame_gray)
+            return None
+
+        slots= self.tracks.slots()
+        _, p0= self.tracks.current(slots)
+        if len(slots):
+            p0= p0.reshape(-1,1,2)
+
+            # Calculate the optical flow forward, then back from the new positions
+            p1, st, err= cv2.calcOpticalFlowPyrLK(self.old_gray, frame_gray, p0, None, **self.lk_params)
+            p0r, st_back, err= cv2.calcOpticalFlowPyrLK(frame_gray, self.old_gray, p1, None, **self.lk_params)
+
+            # Select good points: found both ways and returning close to where they started
+            fb_error= np.abs(p0 - p0r).reshape(-1,2).max(axis= 1)
+            good= (st.ravel() == 1) & (st_back.ravel() == 1) & (fb_error < self.fb_threshold)
+            self.tracks.advance(slots[good], p1.reshape(-1,2)[good])
+        else:
+            self.tracks.advance(slots, p0)
+
+        # Re-seed periodically, or early when many points were lost
+        self.frames_since_detect += 1
+        if (self.frames_since_detect >= self.redetect_interval
+                or len(self.tracks) < self.reseed_below * self.tracks.capacity):
+            self._detect(frame_gray)
+
+        # Update the previous frame
+        self.old_gray= frame_gray
+
+        ids, points= self.tracks.current()
+        return TrackResult(ids, points, self.tracks.segments())
+
+    def render(self, result, frame):
+        '''Draw a TrackResult on a copy of the frame'''
+        frame= frame.copy()
+
+        # Draw the track histories in one call, each step as a two point polyline
+        cv2.polylines(frame, result.segments.astype(np.int32), False, (0,255,0), 2)
+
+        # Draw all the points in one call. A closed one point polyline of
+        # thickness 9 covers the same pixels as a filled circle of radius 5
+        cv2.polylines(frame, result.points.astype(np.int32).reshape(-1,1,2), True, (0, 0, 255), 9)
+        return frame
+
+    def stream(self, sinks= ()):
+        '''Yield (index, TrackResult) for every frame after the first, writing the drawn tracks to the sinks that want them
+
+        See stream_video.
+        '''
+        return stream_video(self, self.video_path, sinks)
+
+    def detect(self, frame_interval= 500, display= True, output_video= None):
+        '''Perform Lucas Kanade Optical Flow on a video and save frames at an interval
+
+        With output_video, every frame is also drawn and encoded into that video file.
+        '''
+
+        # Display and save the tracks at specified intervals
+        sinks= [ImageSequenceSink('output/lucas_kanade_optical_flow', every= frame_interval, workers= 2)]
+        if display:
+            sinks.append(DisplaySink('Lucas Kanade Optical Flow', delay= 30, every= frame_interval))
+        if output_video is not None:
+            sinks.append(VideoWriterSink(output_video, fps= video_fps(self.video_path)))
+
+        try:
+            for _ in self.stream(sinks):
+                pass
+        except OSError as error:
+            print(f'Error: {error}')
+        finally:
+            for sink in sinks:
+                sink.close()
 
 # Testing the LucasKanadeOpticalFlow class
 if __name__ == '__main__':
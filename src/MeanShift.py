@@ -1,80 +1,145 @@
 # Import necessary libraries and packages
+from collections import namedtuple
 import numpy as np
-import os
 import cv2
+from Metrics import Metrics
+from OutputSinks import DisplaySink, ImageSequenceSink, VideoWriterSink
+from VideoPipeline import stream_video, video_fps
+
+# Per-frame result: window is the (x, y, w, h) window of the target, and lost is
+# True when no pixel under it matches the target histogram
+MeanShiftResult= namedtuple('MeanShiftResult', ['window', 'lost'])
 
 class MeanShift:
-    def __init__(self, video_path):
+    def __init__(self, video_path= None, track_window= (300, 200, 100, 50), roi_local= False, search_margin= 1.0, metrics= None):
         self.video_path= video_path
+        self.initial_window= track_window
 
-    def detect(self):
-        '''Perform MeanShift tracking on a video'''
-
-        # Read the video
-        cap= cv2.VideoCapture(self.video_path)
-        if not cap.isOpened():
-            print('Error: Could not open video.')
-            return
-        
-        # Take the first frame of the video
-        ret, frame= cap.read()
-        if not ret:
-            print('Error: Could not read the first frame.')
-            return
-        
-        # Set up initial location of window
-        x, y, w, h= 300, 200, 100, 50
-        track_window= (x, y, w, h)
-
-        # Set up the Region of Interest (ROI) for tracking
-        roi= frame[y:y+h, x:x+w]
-        hsv_roi= cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
-        roi_hist= cv2.calcHist([hsv_roi], [0], None, [180], [0,180])
-        cv2.normalize(roi_hist, roi_hist, 0, 255, cv2.NORM_MINMAX)
+        # In ROI-local mode only the track window expanded by search_margin times its
+        # size on every side is converted to HSV and back-projected
+        self.roi_local= roi_local
+        self.search_margin= search_margin
 
         # Set up the termination criteria
-        term_crit= (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 1)
-
-        # Define the output directory for saving frames
-        output_dir= 'output/meanshift'
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        frame_count= 0
-        saved_frame_count= 0
-
-        while True:
-            ret, frame= cap.read()
-            if not ret:
-                break
-
-            hsv= cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-            dst= cv2.calcBackProject([hsv], [0], roi_hist, [0,180], 1)
-
-            # Apply MeanShift to get the new location
-            ret, track_window= cv2.meanShift(dst, track_window, term_crit)
-
-            # Draw the tracking result
-            x, y, w, h= track_window
-            img2= cv2.rectangle(frame, (x,y), (x+w, y+h), (0,255,0), 2)
-
-            # Display the result
-            cv2.imshow('MeanShift Tracking', img2)
-
-            # Save the frame at specified intervals
-            if frame_count % 500 == 0:
-                output_file= os.path.join(output_dir, f'frame_{saved_frame_count:04d}.png')
-                cv2.imwrite(output_file, img2)
-                saved_frame_count += 1
-
-            frame_count += 1
-
-            # Press 'q' to exit the video display
-            if cv2.waitKey(30) & 0xFF == ord('q'):
-                break
-
-        cap.release()
-        cv2.destroyAllWindows()
+        self.term_crit= (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 1)
+
+        # Stage timings and frame counters of detect()
+        self.metrics= metrics or Metrics('meanshift')
+
+        self.reset()
+
+    def reset(self):
+        '''Go back to the initial window, the next processed frame sets up the histogram again'''
+        self.track_window= self.initial_window
+        self.roi_hist= None
+        self.lost= False
+        self.reacquire= False
+
+    def handoff(self):
+        '''Return the target histogram for the chunks of ChunkedExecutor'''
+        return {'roi_hist': self.roi_hist}
+
+    def resume(self, state, chunk_index):
+        '''Start a chunk of ChunkedExecutor from the handed-off histogram, reacquiring the target'''
+        self.roi_hist= state['roi_hist']
+        self.reacquire= True
+
+    def _reacquire(self, ctx):
+        '''Move the initial window onto the densest part of the full-frame back projection
+
+        Without any match in the frame, the window is kept and the target stays lost.
+        '''
+        self.reacquire= False
+        dst= cv2.calcBackProject([ctx.hsv], [0], self.roi_hist, [0,180], 1)
+        _, _, w, h= self.initial_window
+        density= cv2.boxFilter(dst, cv2.CV_32F, (w, h))
+        _, peak, _, (cx, cy)= cv2.minMaxLoc(density)
+        if peak <= 0:
+            return
+        height, width= dst.shape
+        self.track_window= (min(max(cx - w // 2, 0), width - w), min(max(cy - h // 2, 0), height - h), w, h)
+        self.lost= False
+
+    def _back_project(self, ctx):
+        '''Back-project the histogram on the search region, returning it and its offset in the frame'''
+        height, width= ctx.frame.shape[:2]
+
+        # Search the full frame when not in ROI-local mode, a lost target is found again by _reacquire
+        if not self.roi_local:
+            return cv2.calcBackProject([ctx.hsv], [0], self.roi_hist, [0,180], 1), (0, 0)
+
+        x, y, w, h= self.track_window
+        margin_x= int(w * self.search_margin) + 1
+        margin_y= int(h * self.search_margin) + 1
+        x0, y0= max(x - margin_x, 0), max(y - margin_y, 0)
+        x1, y1= min(x + w + margin_x, width), min(y + h + margin_y, height)
+
+        hsv= ctx.hsv_region(x0, y0, x1, y1)
+        return cv2.calcBackProject([hsv], [0], self.roi_hist, [0,180], 1), (x0, y0)
+
+    def process(self, ctx):
+        '''Track the window into this frame and return a MeanShiftResult
+
+        The first frame of a sequence only sets up the histogram and returns None.
+        '''
+        if self.roi_hist is None:
+            # Set up the Region of Interest (ROI) for tracking
+            x, y, w, h= self.track_window
+            hsv_roi= ctx.hsv[y:y+h, x:x+w]
+            self.roi_hist= cv2.calcHist([hsv_roi], [0], None, [180], [0,180])
+            cv2.normalize(self.roi_hist, self.roi_hist, 0, 255, cv2.NORM_MINMAX)
+            return None
+
+        if self.reacquire:
+            self._reacquire(ctx)
+
+        dst, (x0, y0)= self._back_project(ctx)
+
+        # Apply MeanShift to get the new location, in search region coordinates
+        x, y, w, h= self.track_window
+        ret, (x, y, w, h)= cv2.meanShift(dst, (x - x0, y - y0, w, h), self.term_crit)
+        self.track_window= (x + x0, y + y0, w, h)
+
+        # No histogram match under the window means the target is lost: meanShift cannot leave
+        # an empty window, so move the window onto the densest match of the next frame
+        self.lost= cv2.countNonZero(dst[y:y+h, x:x+w]) == 0
+        self.reacquire= self.lost
+
+        return MeanShiftResult(self.track_window, self.lost)
+
+    def render(self, result, frame):
+        '''Draw a MeanShiftResult on a copy of the frame'''
+        x, y, w, h= result.window
+        return cv2.rectangle(frame.copy(), (x,y), (x+w, y+h), (0,255,0), 2)
+
+    def stream(self, sinks= ()):
+        '''Yield (index, MeanShiftResult) for every frame after the first, writing the drawn window to the sinks that want them
+
+        See stream_video.
+        '''
+        return stream_video(self, self.video_path, sinks)
+
+    def detect(self, display= True, frame_interval= 500, output_video= None):
+        '''Perform MeanShift tracking on a video
+
+        With output_video, every frame is also drawn and encoded into that video file.
+        '''
+
+        # Display every frame and save frames at specified intervals
+        sinks= [ImageSequenceSink('output/meanshift', every= frame_interval, workers= 2)]
+        if display:
+            sinks.append(DisplaySink('MeanShift Tracking', delay= 1))
+        if output_video is not None:
+            sinks.append(VideoWriterSink(output_video, fps= video_fps(self.video_path)))
+
+        try:
+            for _ in self.stream(sinks):
+                pass
+        except OSError as error:
+            print(f'Error: {error}')
+        finally:
+            for sink in sinks:
+                sink.close()
 
 # Testing the MeanShift class
 if __name__ == '__main__':
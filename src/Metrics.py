@@ -0,0 +1,312 @@
+# Import necessary libraries and packages
+import bisect
+import contextlib
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+# Upper bounds in seconds of the latency buckets, from 0.1 ms to 10 s
+DEFAULT_BUCKETS= (0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05,
+                  0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0)
+
+# Stack of the stages open in each thread, shared by all Metrics objects so that a
+# stage nested in another one is subtracted from it even across objects
+_local= threading.local()
+
+def _open_stages():
+    stack= getattr(_local, 'stack', None)
+    if stack is None:
+        stack= _local.stack= []
+    return stack
+
+def _write_atomic(path, text):
+    '''Write a text file through a temporary file, so readers never see a partial file'''
+    os.makedirs(os.path.dirname(path) or '.', exist_ok= True)
+    temporary_path= f'{path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'w') as file:
+        file.write(text)
+    os.replace(temporary_path, path)
+
+def _escape(value):
+    '''Escape a Prometheus label value'''
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+class LatencyHistogram:
+    '''Fixed-bucket histogram of latencies in seconds, as in Prometheus
+
+    Observing a value costs one binary search and a few additions, however many
+    values are observed. Quantiles are interpolated inside the buckets, so they are
+    estimates with the resolution of the buckets.
+    '''
+
+    def __init__(self, buckets= DEFAULT_BUCKETS):
+        self.buckets= tuple(sorted(buckets))
+
+        # One count per bucket, and a last one for the values above every bound
+        self.counts= [0] * (len(self.buckets) + 1)
+        self.count= 0
+        self.sum= 0.0
+        self.max= 0.0
+
+    def observe(self, seconds):
+        '''Record one latency'''
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max= seconds
+
+    def quantile(self, q):
+        '''Return an estimate of the q quantile, 0 <= q <= 1, or None without observations'''
+        if self.count == 0:
+            return None
+        rank= q * self.count
+        cumulative= 0
+        for index, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower= self.buckets[index - 1] if index > 0 else 0.0
+                upper= self.buckets[index] if index < len(self.buckets) else self.max
+                return min(lower + (upper - lower) * (rank - cumulative) / count, self.max)
+            cumulative += count
+        return self.max
+
+    def snapshot(self):
+        '''Return the statistics and cumulative bucket counts as a dictionary'''
+        cumulative= 0
+        buckets= {}
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            buckets[repr(bound)]= cumulative
+        buckets['+Inf']= self.count
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else None,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'max': self.max,
+            'buckets': buckets
+        }
+
+class _Stage:
+    '''Context manager timing one stage of a Metrics object, see Metrics.stage'''
+
+    __slots__= ('metrics', 'name')
+
+    def __init__(self, metrics, name):
+        self.metrics= metrics
+        self.name= name
+
+    def __enter__(self):
+        # [start, time spent in nested stages]
+        _open_stages().append([time.perf_counter(), 0.0])
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        stack= _open_stages()
+        start, nested= stack.pop()
+        elapsed= time.perf_counter() - start
+        if stack:
+            stack[-1][1] += elapsed
+        self.metrics.observe(self.name, elapsed - nested)
+
+class Metrics:
+    '''Per-stage latency histograms and counters of a pipeline, exported as JSON or Prometheus text
+
+    Stages are timed with `with metrics.stage('compute'):` and record their own
+    time only: time spent in a stage nested inside them, such as a color conversion
+    inside the algorithm, is recorded by the nested stage alone, so the stages add
+    up to the time of the loop. The classes use the stages in STAGES and the
+    counters frames_processed, frames_saved and frames_dropped (frames that were due
+    to be written but could not be). Recording is thread safe.
+
+    With profile or trace_memory, run() also collects a cProfile profile or the
+    tracemalloc peak of the Python allocations, both of which slow the pipeline
+    down. With export_path, tick() writes export_path.json and export_path.prom
+    every export_interval seconds, and run() writes them at the end.
+    '''
+
+    # Stage names used by the classes
+    STAGES= ('decode', 'convert', 'compute', 'draw', 'encode', 'display', 'events')
+
+    def __init__(self, name, buckets= DEFAULT_BUCKETS, profile= False, trace_memory= False,
+                 export_path= None, export_interval= 10.0):
+        self.name= name
+        self.buckets= tuple(buckets)
+        self.profile= profile
+        self.trace_memory= trace_memory
+        self.export_path= export_path
+        self.export_interval= export_interval
+        self._lock= threading.Lock()
+        self.reset()
+
+    def __getstate__(self):
+        # Locks and profiles cannot be pickled, e.g. when an analyzer is sent to a worker
+        state= self.__dict__.copy()
+        del state['_lock']
+        state['_stages']= {}
+        state['_profile_stats']= None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock= threading.Lock()
+
+    def reset(self):
+        '''Forget every recorded value'''
+        self.histograms= {}
+        self.counters= {}
+        self.gauges= {}
+        self.started= time.time()
+        self._stages= {}
+        self._profile_stats= None
+        self._last_export= time.monotonic()
+
+    def stage(self, name):
+        '''Return a context manager timing a stage'''
+        stage= self._stages.get(name)
+        if stage is None:
+            stage= self._stages[name]= _Stage(self, name)
+        return stage
+
+    def observe(self, stage, seconds):
+        '''Record the latency of a stage measured elsewhere'''
+        with self._lock:
+            histogram= self.histograms.get(stage)
+            if histogram is None:
+                histogram= self.histograms[stage]= LatencyHistogram(self.buckets)
+            histogram.observe(seconds)
+
+    def count(self, name, value= 1):
+        '''Add value to a counter'''
+        with self._lock:
+            self.counters[name]= self.counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        '''Set a gauge to its current value'''
+        with self._lock:
+            self.gauges[name]= value
+
+    @contextlib.contextmanager
+    def run(self):
+        '''Wrap a whole run, collecting the optional profile and memory peak and exporting at the end'''
+        profiler= cProfile.Profile() if self.profile else None
+        started_tracing= self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+
+        start= time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield self
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                if self._profile_stats is None:
+                    self._profile_stats= pstats.Stats(profiler)
+                else:
+                    self._profile_stats.add(profiler)
+
+            self.gauge('run_seconds', self.gauges.get('run_seconds', 0.0) + time.perf_counter() - start)
+            if self.trace_memory:
+                _, peak= tracemalloc.get_traced_memory()
+                self.gauge('python_memory_peak_bytes', max(peak, self.gauges.get('python_memory_peak_bytes', 0)))
+                if started_tracing:
+                    tracemalloc.stop()
+
+            if self.export_path is not None:
+                self.export()
+
+    def tick(self):
+        '''Export the metrics if export_path is set and export_interval has passed since the last export'''
+        if self.export_path is not None and time.monotonic() - self._last_export >= self.export_interval:
+            self.export()
+
+    def profile_summary(self, limit= 20):
+        '''Return the functions with the largest cumulative time in the profile, or an empty list'''
+        if self._profile_stats is None:
+            return []
+        entries= []
+        for (file, line, function), (_, calls, total, cumulative, _) in self._profile_stats.stats.items():
+            entries.append({'function': f'{file}:{line}({function})', 'calls': calls,
+                            'total_seconds': total, 'cumulative_seconds': cumulative})
+        entries.sort(key= lambda entry: entry['cumulative_seconds'], reverse= True)
+        return entries[:limit]
+
+    def snapshot(self):
+        '''Return every recorded value as a JSON-serializable dictionary
+
+        The share of a stage is its fraction of the time of all stages, which tells
+        whether a pipeline is decode-bound or compute-bound.
+        '''
+        with self._lock:
+            stages= {name: histogram.snapshot() for name, histogram in self.histograms.items()}
+            counters= dict(self.counters)
+            gauges= dict(self.gauges)
+
+        total= sum(stage['sum'] for stage in stages.values())
+        for stage in stages.values():
+            stage['share']= stage['sum'] / total if total > 0 else None
+
+        return {
+            'name': self.name,
+            'started': self.started,
+            'uptime_seconds': time.time() - self.started,
+            'counters': counters,
+            'gauges': gauges,
+            'stages': stages,
+            'profile': self.profile_summary()
+        }
+
+    def prometheus(self, prefix= 'opencv_pipeline'):
+        '''Return the metrics in the Prometheus text exposition format'''
+        snapshot= self.snapshot()
+        label= f'pipeline="{_escape(self.name)}"'
+        lines= []
+
+        if snapshot['stages']:
+            lines.append(f'# HELP {prefix}_stage_seconds Time spent in each stage, excluding nested stages.')
+            lines.append(f'# TYPE {prefix}_stage_seconds histogram')
+            for stage, values in sorted(snapshot['stages'].items()):
+                labels= f'{label},stage="{_escape(stage)}"'
+                for bound, count in values['buckets'].items():
+                    lines.append(f'{prefix}_stage_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{prefix}_stage_seconds_sum{{{labels}}} {values["sum"]!r}')
+                lines.append(f'{prefix}_stage_seconds_count{{{labels}}} {values["count"]}')
+
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f'# TYPE {prefix}_{name}_total counter')
+            lines.append(f'{prefix}_{name}_total{{{label}}} {value}')
+
+        for name, value in sorted(snapshot['gauges'].items()):
+            lines.append(f'# TYPE {prefix}_{name} gauge')
+            lines.append(f'{prefix}_{name}{{{label}}} {value!r}')
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path):
+        '''Write the snapshot to a JSON file'''
+        _write_atomic(path, json.dumps(self.snapshot(), indent= 2))
+
+    def write_prometheus(self, path):
+        '''Write the metrics to a Prometheus text file, e.g. for the node exporter textfile collector'''
+        _write_atomic(path, self.prometheus())
+
+    def write_profile(self, path):
+        '''Write the cProfile statistics to a file readable by pstats, if a profile was collected'''
+        if self._profile_stats is not None:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok= True)
+            self._profile_stats.dump_stats(path)
+
+    def export(self):
+        '''Write export_path.json and export_path.prom'''
+        self._last_export= time.monotonic()
+        self.write_json(self.export_path + '.json')
+        self.write_prometheus(self.export_path + '.prom')
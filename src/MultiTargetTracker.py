@@ -0,0 +1,206 @@
+# Import necessary libraries and packages
+from collections import namedtuple
+import numpy as np
+import cv2
+from Metrics import Metrics
+from OutputSinks import DisplaySink, ImageSequenceSink, VideoWriterSink
+from VideoPipeline import stream_video, video_fps
+
+# Per-frame result: boxes is (N, 4) int32 of x, y, w, h, rects is (N, 5) float32 of
+# center x, center y, width, height and angle, lost is (N,) bool
+TrackingResult= namedtuple('TrackingResult', ['boxes', 'rects', 'lost'])
+
+class MultiTargetTracker:
+    '''Track many targets with CamShift or MeanShift while sharing the per-frame work
+
+    Each target keeps its own hue histogram, stored as a 256 entry lookup table.
+    The hue plane is computed once per frame and every target back-projects only its
+    search region of it with cv2.LUT, searching the whole plane once it is lost.
+    '''
+
+    METHODS= ('camshift', 'meanshift')
+
+    def __init__(self, video_path= None, windows= (), method= 'camshift', search_margin= 1.0, metrics= None):
+        if method not in self.METHODS:
+            raise ValueError(f'Unknown tracking method {method!r}, expected one of {self.METHODS}.')
+
+        self.video_path= video_path
+        self.initial_windows= [tuple(window) for window in windows]
+        self.method= method
+        self.search_margin= search_margin
+
+        # Set up the termination criteria
+        self.term_crit= (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 1)
+
+        # Stage timings and frame counters of detect()
+        self.metrics= metrics or Metrics('multi_target_tracking')
+
+        self.reset()
+
+    def reset(self):
+        '''Drop every target, the next processed frame sets up the initial windows again'''
+        self.boxes= np.zeros((0, 4), dtype= np.int32)
+        self.rects= np.zeros((0, 5), dtype= np.float32)
+        self.lost= np.zeros(0, dtype= bool)
+        self.luts= np.zeros((0, 256), dtype= np.uint8)
+        self.pending= list(self.initial_windows)
+        self.reacquire= False
+
+    def add_targets(self, ctx, windows):
+        '''Start tracking new targets, e.g. detections, from their windows in this frame'''
+        hue= ctx.hue
+        luts= np.zeros((len(windows), 256), dtype= np.uint8)
+        for i, (x, y, w, h) in enumerate(windows):
+            roi_hist= cv2.calcHist([hue[y:y+h, x:x+w]], [0], None, [180], [0,180])
+            cv2.normalize(roi_hist, roi_hist, 0, 255, cv2.NORM_MINMAX)
+            luts[i, :180]= np.rint(roi_hist.ravel())
+
+        boxes= np.array(windows, dtype= np.int32).reshape(-1, 4)
+        rects= np.zeros((len(windows), 5), dtype= np.float32)
+        rects[:, 0]= boxes[:, 0] + boxes[:, 2] / 2
+        rects[:, 1]= boxes[:, 1] + boxes[:, 3] / 2
+        rects[:, 2:4]= boxes[:, 2:4]
+
+        self.boxes= np.concatenate([self.boxes, boxes])
+        self.rects= np.concatenate([self.rects, rects])
+        self.lost= np.concatenate([self.lost, np.zeros(len(windows), dtype= bool)])
+        self.luts= np.concatenate([self.luts, luts])
+
+    def handoff(self):
+        '''Return the target histograms and initial windows for the chunks of ChunkedExecutor'''
+        return {'luts': self.luts, 'windows': list(self.initial_windows)}
+
+    def resume(self, state, chunk_index):
+        '''Start a chunk of ChunkedExecutor from the handed-off histograms, reacquiring every target'''
+        self.boxes= np.array(state['windows'], dtype= np.int32).reshape(-1, 4)
+        self.rects= np.zeros((len(self.boxes), 5), dtype= np.float32)
+        self.lost= np.zeros(len(self.boxes), dtype= bool)
+        self.luts= state['luts']
+        self.pending= []
+        self.reacquire= True
+
+    def _locate(self, hue, i):
+        '''Move the window of target i onto the densest part of its full-frame back projection
+
+        Returns False, keeping the window, if nothing in the frame matches the target.
+        '''
+        height, width= hue.shape
+        _, _, w, h= (int(v) for v in self.boxes[i])
+        density= cv2.boxFilter(cv2.LUT(hue, self.luts[i]), cv2.CV_32F, (w, h))
+        _, peak, _, (cx, cy)= cv2.minMaxLoc(density)
+        if peak <= 0:
+            return False
+        self.boxes[i]= (min(max(cx - w // 2, 0), width - w), min(max(cy - h // 2, 0), height - h), w, h)
+        return True
+
+    def _reacquire(self, hue):
+        '''Move every window onto the densest part of its target's full-frame back projection'''
+        for i in range(len(self.boxes)):
+            self._locate(hue, i)
+        self.reacquire= False
+
+    def _search_region(self, box, width, height):
+        '''Return the track window expanded by the search margin, clipped to the frame'''
+        x, y, w, h= box
+        margin_x= int(w * self.search_margin) + 1
+        margin_y= int(h * self.search_margin) + 1
+        return (max(x - margin_x, 0), max(y - margin_y, 0),
+                min(x + w + margin_x, width), min(y + h + margin_y, height))
+
+    def process(self, ctx):
+        '''Track every target into this frame and return a TrackingResult
+
+        The first frame of a sequence only sets up the initial windows and returns None.
+        '''
+        if self.pending:
+            self.add_targets(ctx, self.pending)
+            self.pending= []
+            return None
+
+        # Compute the hue plane once for all targets
+        hue= ctx.hue
+        height, width= hue.shape
+        if self.reacquire:
+            self._reacquire(hue)
+
+        for i in range(len(self.boxes)):
+            if self.lost[i] and self.method == 'meanshift':
+                # meanShift cannot leave a window without matches, so move it onto the densest match first
+                self.lost[i]= not self._locate(hue, i)
+
+            if self.lost[i]:
+                x0, y0, x1, y1= 0, 0, width, height
+            else:
+                x0, y0, x1, y1= self._search_region(self.boxes[i], width, height)
+
+            # Back-project the target histogram on its search region
+            dst= cv2.LUT(hue[y0:y1, x0:x1], self.luts[i])
+            x, y, w, h= (int(v) for v in self.boxes[i])
+            window= (x - x0, y - y0, w, h)
+
+            if self.method == 'camshift':
+                ((cx, cy), (rw, rh), angle), (x, y, w, h)= cv2.CamShift(dst, window, self.term_crit)
+                self.lost[i]= rw == 0 or rh == 0
+                if self.lost[i]:
+                    # Restart from a frame-sized window so CamShift can find the target again
+                    self.boxes[i]= (0, 0, width, height)
+                    continue
+                self.rects[i]= (cx + x0, cy + y0, rw, rh, angle)
+            else:
+                _, (x, y, w, h)= cv2.meanShift(dst, window, self.term_crit)
+                self.lost[i]= cv2.countNonZero(dst[y:y+h, x:x+w]) == 0
+                self.rects[i]= (x + x0 + w / 2, y + y0 + h / 2, w, h, 0)
+            self.boxes[i]= (x + x0, y + y0, w, h)
+
+        return TrackingResult(self.boxes.copy(), self.rects.copy(), self.lost.copy())
+
+    def render(self, result, frame):
+        '''Draw a TrackingResult on a copy of the frame'''
+        frame= frame.copy()
+
+        # Draw all the rotated rects of the targets still tracked in one call
+        rects= result.rects[~result.lost]
+        pts= [cv2.boxPoints(((cx, cy), (w, h), angle)) for cx, cy, w, h, angle in rects]
+        return cv2.polylines(frame, np.intp(pts).reshape(-1, 4, 2), True, (0,255,0), 2)
+
+    def stream(self, sinks= ()):
+        '''Yield (index, TrackingResult) for every frame after the first, writing the drawn targets to the sinks that want them
+
+        See stream_video.
+        '''
+        return stream_video(self, self.video_path, sinks)
+
+    def detect(self, frame_interval= 500, display= True, output_video= None):
+        '''Perform multi-target tracking on a video and save frames at intervals
+
+        With output_video, every frame is also drawn and encoded into that video file.
+        '''
+
+        # Display and save the targets at specified intervals
+        sinks= [ImageSequenceSink('output/multi_target_tracking', every= frame_interval, workers= 2)]
+        if display:
+            sinks.append(DisplaySink('Multi-Target Tracking', delay= 1, every= frame_interval))
+        if output_video is not None:
+            sinks.append(VideoWriterSink(output_video, fps= video_fps(self.video_path)))
+
+        try:
+            for _ in self.stream(sinks):
+                pass
+        except OSError as error:
+            print(f'Error: {error}')
+        finally:
+            for sink in sinks:
+                sink.close()
+
+# Testing the MultiTargetTracker class
+if __name__ == '__main__':
+    print('Starting multi-target tracking...')
+
+    # Path to the video file
+    video_path= 'data/videoplayback.mp4'
+
+    # Create an object of MultiTargetTracker with two initial windows
+    tracker= MultiTargetTracker(video_path, windows= [(300, 200, 100, 50), (100, 100, 60, 60)])
+    tracker.detect(frame_interval= 500)
+
+    print('Multi-target tracking completed.')
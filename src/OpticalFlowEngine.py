@@ -0,0 +1,103 @@
+# Import necessary libraries and packages
+import cv2
+
+class FarnebackFlow:
+    '''Dense flow with cv2.calcOpticalFlowFarneback'''
+
+    # Seeding changes the results, so by default they match a plain calcOpticalFlowFarneback call
+    warm_start= False
+
+    def __init__(self, pyr_scale= 0.5, levels= 3, winsize= 15, iterations= 3, poly_n= 5, poly_sigma= 1.2):
+        self.params= (pyr_scale, levels, winsize, iterations, poly_n, poly_sigma)
+
+    def calc(self, prev, next, initial_flow= None):
+        '''Return the flow from prev to next, refining initial_flow when it is given'''
+        flags= 0 if initial_flow is None else cv2.OPTFLOW_USE_INITIAL_FLOW
+        return cv2.calcOpticalFlowFarneback(prev, next, initial_flow, *self.params, flags)
+
+class DISFlow:
+    '''Dense flow with the DIS (Dense Inverse Search) optical flow algorithm'''
+
+    # The previous flow lowers the error of every preset, most of all of ultrafast
+    warm_start= True
+
+    PRESETS= {
+        'ultrafast': cv2.DISOPTICAL_FLOW_PRESET_ULTRAFAST,
+        'fast': cv2.DISOPTICAL_FLOW_PRESET_FAST,
+        'medium': cv2.DISOPTICAL_FLOW_PRESET_MEDIUM
+    }
+
+    def __init__(self, preset= 'fast'):
+        if preset not in self.PRESETS:
+            raise ValueError(f'Unknown DIS preset {preset!r}, expected one of {sorted(self.PRESETS)}.')
+        self.dis= cv2.DISOpticalFlow_create(self.PRESETS[preset])
+
+    def calc(self, prev, next, initial_flow= None):
+        '''Return the flow from prev to next, refining initial_flow when it is given'''
+        return self.dis.calc(prev, next, initial_flow)
+
+# Available engines, keyed by the name accepted by OpticalFlowEngine
+ENGINES= {
+    'farneback': FarnebackFlow,
+    'dis': DISFlow
+}
+
+class OpticalFlowEngine:
+    '''Compute dense flow between consecutive grayscale frames with a selectable engine
+
+    The flow of the previous pair is used as the initial estimate for the next one
+    when warm_start is set. It defaults to the warm_start of the engine: on for
+    DIS, and off for Farneback so that the default flow is the same as a plain
+    cv2.calcOpticalFlowFarneback call. With scale below 1 the flow is estimated on
+    downscaled frames and upsampled back to the input resolution.
+    '''
+
+    def __init__(self, engine= 'farneback', scale= 1.0, warm_start= None, **engine_params):
+        if engine not in ENGINES:
+            raise ValueError(f'Unknown optical flow engine {engine!r}, expected one of {sorted(ENGINES)}.')
+        if not 0 < scale <= 1:
+            raise ValueError('The processing scale must be in (0, 1].')
+
+        self.engine= ENGINES[engine](**engine_params)
+        self.scale= scale
+        self.warm_start= self.engine.warm_start if warm_start is None else warm_start
+        self.reset()
+
+    def reset(self):
+        '''Drop the previous flow and the cached downscaled frame'''
+        self.flow= None
+        self._last_frame= None
+        self._last_small= None
+
+    def _downscale(self, frame):
+        '''Return the frame at the processing scale, reusing the last one when possible'''
+        if self.scale == 1:
+            return frame
+
+        # The next frame of one pair is the previous frame of the following pair
+        if frame is self._last_frame:
+            return self._last_small
+        small= cv2.resize(frame, None, fx= self.scale, fy= self.scale, interpolation= cv2.INTER_AREA)
+        self._last_frame= frame
+        self._last_small= small
+        return small
+
+    def compute(self, prev, next):
+        '''Return the dense flow from prev to next at the input resolution'''
+        prev_small= self._downscale(prev)
+        next_small= self._downscale(next)
+
+        # The engines refine the initial estimate in place, so hand them a copy
+        initial_flow= None
+        if self.warm_start and self.flow is not None and self.flow.shape[:2] == prev_small.shape[:2]:
+            initial_flow= self.flow.copy()
+        self.flow= self.engine.calc(prev_small, next_small, initial_flow)
+
+        if self.scale == 1:
+            return self.flow
+
+        # Upsample the flow and scale the vectors back to full-resolution pixels
+        height, width= prev.shape[:2]
+        flow= cv2.resize(self.flow, (width, height), interpolation= cv2.INTER_LINEAR)
+        flow *= 1 / self.scale
+        return flow
@@ -0,0 +1,341 @@
+# Import necessary libraries and packages
+import json
+import numpy as np
+import os
+import queue
+import threading
+import cv2
+
+# Sentinel telling a writer thread to finish
+_CLOSE= object()
+
+def emit(sinks, index, render, metrics):
+    '''Write the rendered image of a frame to the sinks that want it
+
+    render() is only called when at least one sink wants the frame, so frames that
+    no sink keeps are never drawn. Each write is timed as the stage of its sink, and
+    the images the encoding sinks keep or drop are counted as frames_saved and
+    frames_dropped. Returns False once a sink asked to stop the stream, e.g. when
+    'q' is pressed in a DisplaySink window.
+    '''
+    due= [sink for sink in sinks if sink.wants(index)]
+    if due:
+        with metrics.stage('draw'):
+            image= render()
+        for sink in due:
+            with metrics.stage(sink.stage):
+                kept= sink.write(image, index)
+            if sink.stage == 'encode':
+                metrics.count('frames_saved' if kept else 'frames_dropped')
+    return not any(sink.stopped for sink in sinks)
+
+class Sink:
+    '''Base of the outputs attached to a stream of images
+
+    A sink receives every image whose index is a multiple of every, through
+    write(image, index), which returns True if the image was kept. stage names the
+    Metrics stage its writes are timed as, and stopped asks the stream to end.
+    '''
+
+    stage= 'encode'
+
+    def __init__(self, every= 1):
+        self.every= max(1, int(every))
+        self.stopped= False
+
+    def wants(self, index):
+        '''Return True if the image of this index should be written to the sink'''
+        return self.every == 1 or index % self.every == 0
+
+    def write(self, image, index):
+        '''Write the image of this index, returning True if it was kept
+
+        Set stopped to ask emit() to end the stream. Subclasses must override this.
+        '''
+        raise NotImplementedError
+
+    def close(self):
+        '''Release the resources of the sink'''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class DisplaySink(Sink):
+    '''Show images in a HighGUI window, waiting delay ms for a key after each
+
+    Pressing 'q' stops the stream. delay= 0 waits for a key, as for still images.
+    window_name may contain {index}, e.g. to show several outputs of one image in
+    their own windows.
+    '''
+
+    stage= 'display'
+
+    def __init__(self, window_name= 'Frame', delay= 1, every= 1):
+        super().__init__(every)
+        self.window_name= window_name
+        self.delay= delay
+        self._windows= set()
+
+    def write(self, image, index= 0):
+        window_name= self.window_name.format(index= index)
+        cv2.imshow(window_name, image)
+        self._windows.add(window_name)
+        if cv2.waitKey(self.delay) & 0xFF == ord('q'):
+            self.stopped= True
+        return True
+
+    def close(self):
+        for window_name in self._windows:
+            cv2.destroyWindow(window_name)
+        self._windows.clear()
+
+class QueuedSink(Sink):
+    '''Base of the sinks that write on worker threads behind a bounded queue
+
+    write() only hands the image over to the workers, so a slow disk or encoder
+    does not stall the stream. When the workers fall queue_size images behind,
+    policy 'block' waits for a free slot, so every image is kept, and 'drop'
+    discards the image and returns False, so the stream never waits; dropped images
+    are counted in images_dropped. With workers= 0 there are no threads and write()
+    writes the image itself.
+
+    Subclasses write one item in _write(), returning False if it could not be
+    written. A worker that fails makes the next write() or close() raise.
+    '''
+
+    POLICIES= ('block', 'drop')
+
+    def __init__(self, every= 1, workers= 1, queue_size= 32, policy= 'block'):
+        super().__init__(every)
+        if policy not in self.POLICIES:
+            raise ValueError(f'Unknown queue policy {policy!r}, expected one of {self.POLICIES}.')
+        self.policy= policy
+        self.images_dropped= 0
+
+        self._queue= queue.Queue(maxsize= max(1, queue_size))
+        self._lock= threading.Lock()
+        self._error= None
+        self._threads= [threading.Thread(target= self._work, name= f'{type(self).__name__}-{i}', daemon= True)
+                        for i in range(max(0, workers))]
+        for thread in self._threads:
+            thread.start()
+
+    def _work(self):
+        '''Worker thread: write queued items until closed'''
+        try:
+            while True:
+                item= self._queue.get()
+                if item is _CLOSE:
+                    break
+                if not self._write(item):
+                    raise OSError(f'Could not write to {self.target}.')
+        except Exception as error:
+            # Keep draining the queue so producers never block on a dead worker
+            self._error= error
+            while self._queue.get() is not _CLOSE:
+                pass
+        finally:
+            self._finish()
+
+    def _write(self, item):
+        '''Worker thread: write one queued item, returning False if it could not be written
+
+        A False return or an exception stops the workers, and the error is raised
+        on the next submit or close. Subclasses must override this.
+        '''
+        raise NotImplementedError
+
+    def _finish(self):
+        '''Release the resources of a worker thread as it exits'''
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise RuntimeError(f'Error: Could not write {self.target}.') from self._error
+
+    def _submit(self, item):
+        '''Queue an item following the policy, returning False if it was dropped'''
+        self._raise_error()
+        if not self._threads:
+            return self._write(item)
+        if self.policy == 'block':
+            self._queue.put(item)
+            return True
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.images_dropped += 1
+            return False
+
+    def close(self):
+        '''Write the queued items, then stop the workers'''
+        if self._threads:
+            for _ in self._threads:
+                self._queue.put(_CLOSE)
+            for thread in self._threads:
+                thread.join()
+            self._threads= []
+        self._raise_error()
+
+# cv2.imwrite parameter of the compression level of every image format
+COMPRESSION_PARAMS= {
+    '.png': cv2.IMWRITE_PNG_COMPRESSION,
+    '.jpg': cv2.IMWRITE_JPEG_QUALITY,
+    '.jpeg': cv2.IMWRITE_JPEG_QUALITY,
+    '.webp': cv2.IMWRITE_WEBP_QUALITY
+}
+
+class ImageSequenceSink(QueuedSink):
+    '''Write images to numbered files in a directory, optionally on a pool of writer threads
+
+    File names follow pattern, formatted with the index of the image and count, the
+    number of images handed to the sink before it. The default pattern numbers the
+    files frame_0000.png, frame_0001.png, ... A fixed name such as
+    'depth_map.png' suits a single still image. format replaces the extension of
+    pattern, e.g. 'jpg', and compression sets the PNG compression level (0 to 9,
+    lower is faster) or the JPEG or WebP quality (0 to 100). params are passed to
+    cv2.imwrite as they are.
+
+    With workers= 0, write() encodes the image itself and returns the result of
+    cv2.imwrite. Otherwise images are encoded by that many threads, cv2.imwrite
+    releasing the GIL, as described in QueuedSink, and an image must not be
+    modified after it has been written.
+    '''
+
+    def __init__(self, output_dir, pattern= 'frame_{count:04d}.png', every= 1, params= None, format= None,
+                 compression= None, workers= 0, queue_size= 32, policy= 'block'):
+        if format is not None:
+            pattern= os.path.splitext(pattern)[0] + '.' + format.lstrip('.')
+        self.output_dir= output_dir
+        self.target= output_dir
+        self.pattern= pattern
+        self.params= list(params or [])
+        if compression is not None:
+            extension= os.path.splitext(pattern)[1].lower()
+            if extension not in COMPRESSION_PARAMS:
+                raise ValueError(f'No compression level for {extension!r} images, expected one of {tuple(COMPRESSION_PARAMS)}.')
+            self.params += [COMPRESSION_PARAMS[extension], int(compression)]
+        self.images_written= 0
+        self.last_path= None
+        self._count= 0
+        os.makedirs(output_dir, exist_ok= True)
+
+        super().__init__(every, workers, queue_size, policy)
+
+    def write(self, image, index= 0):
+        path= os.path.join(self.output_dir, self.pattern.format(index= index, count= self._count))
+        kept= self._submit((path, image))
+        if kept:
+            self._count += 1
+        return kept
+
+    def _write(self, item):
+        path, image= item
+        if not cv2.imwrite(path, image, self.params):
+            return False
+        with self._lock:
+            self.images_written += 1
+            self.last_path= path
+        return True
+
+class VideoWriterSink(QueuedSink):
+    '''Encode frames into a video file with cv2.VideoWriter on a background thread
+
+    Frames are handed over through a bounded queue, as described in QueuedSink, so
+    with policy 'block' write() only blocks when the encoder falls more than
+    queue_size frames behind. The writer is opened on the first frame, whose size
+    and channel count define the video. A frame must not be modified after it has
+    been written.
+    '''
+
+    def __init__(self, output_path, fps= 30.0, fourcc= 'mp4v', queue_size= 32, every= 1, policy= 'block'):
+        self.output_path= output_path
+        self.target= output_path
+        self.fps= fps
+        self.fourcc= fourcc
+        self.frames_written= 0
+        self._writer= None
+
+        # A single encoder thread keeps the frames in order
+        super().__init__(every, 1, queue_size, policy)
+
+    def _write(self, frame):
+        '''Open the video on the first frame, then encode the frame'''
+        if self._writer is None:
+            height, width= frame.shape[:2]
+            os.makedirs(os.path.dirname(self.output_path) or '.', exist_ok= True)
+            self._writer= cv2.VideoWriter(self.output_path, cv2.VideoWriter_fourcc(*self.fourcc),
+                                          self.fps, (width, height), frame.ndim == 3)
+            if not self._writer.isOpened():
+                raise RuntimeError(f'Error: Could not open video writer for {self.output_path}.')
+
+        self._writer.write(frame)
+        self.frames_written += 1
+        return True
+
+    def _finish(self):
+        if self._writer is not None:
+            self._writer.release()
+            self._writer= None
+
+    def write(self, frame, index= None):
+        '''Queue a frame for encoding, returning False if the policy dropped it'''
+        return self._submit(frame)
+
+class RecordSink:
+    '''Append structured NumPy records, such as motion events, to a JSONL or .npy file
+
+    The format follows the extension of output_path. A .jsonl file gets one JSON
+    object per record. A .npy record file is streamed to a temporary raw file and
+    converted into a regular .npy array on close, so the records never have to be
+    held in memory.
+    '''
+
+    FORMATS= ('.jsonl', '.npy')
+
+    def __init__(self, output_path, dtype):
+        self.output_path= output_path
+        self.format= os.path.splitext(output_path)[1].lower()
+        if self.format not in self.FORMATS:
+            raise ValueError(f'Unknown record format {self.format!r}, expected one of {self.FORMATS}.')
+
+        self.dtype= np.dtype(dtype)
+        self.records_written= 0
+
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok= True)
+        self._path= output_path if self.format == '.jsonl' else output_path + '.tmp'
+        self._file= open(self._path, 'w' if self.format == '.jsonl' else 'wb')
+
+    def write(self, records):
+        '''Append a structured array of records'''
+        records= np.asarray(records, dtype= self.dtype)
+        if self.format == '.jsonl':
+            names= self.dtype.names
+            for record in records.tolist():
+                self._file.write(json.dumps(dict(zip(names, record))) + '\n')
+        else:
+            self._file.write(records.tobytes())
+        self.records_written += len(records)
+
+    def close(self):
+        '''Flush the records, converting the raw records into an .npy file'''
+        if self._file is None:
+            return
+        self._file.close()
+        self._file= None
+
+        if self.format == '.npy':
+            # Copy through a memory map, the records are never loaded at once
+            records= np.memmap(self._path, dtype= self.dtype, mode= 'r') if self.records_written else np.empty(0, self.dtype)
+            np.save(self.output_path, records)
+            del records
+            os.remove(self._path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,261 @@
+# Import necessary libraries and packages
+from concurrent.futures import ThreadPoolExecutor
+import math
+import numpy as np
+import os
+import cv2
+from FrameSource import FrameSource
+
+class StereoEngine:
+    '''Reusable stereo matcher with optional cached rectification
+
+    The matcher and, when a calibration is given, the rectification maps from
+    cv2.initUndistortRectifyMap are built once and reused for every pair, which
+    matters for stereo video. compute() returns float32 disparities in pixels and
+    depth() turns them into metric depth.
+    '''
+
+    MATCHERS= ('bm', 'sgbm', 'sgbm_3way')
+
+    def __init__(self, matcher= 'bm', num_disparities= 16, block_size= None, min_disparity= 0,
+                 calibration= None, focal_length= None, baseline= None):
+        if matcher not in self.MATCHERS:
+            raise ValueError(f'Unknown stereo matcher {matcher!r}, expected one of {self.MATCHERS}.')
+
+        self.matcher_name= matcher
+        self.num_disparities= num_disparities
+        self.block_size= block_size or (15 if matcher == 'bm' else 5)
+        self.min_disparity= min_disparity
+        self.matcher= self.create_matcher(min_disparity, num_disparities)
+
+        # Rectification maps and reprojection matrix, built once from the calibration
+        self.maps= None
+        self.Q= None
+        if calibration is not None:
+            self.set_calibration(**calibration)
+
+        # Used by depth() for already rectified input without a calibration
+        self.focal_length= focal_length
+        self.baseline= baseline
+
+    def create_matcher(self, min_disparity, num_disparities):
+        '''Create a matcher of the configured kind for a disparity range'''
+        if self.matcher_name == 'bm':
+            matcher= cv2.StereoBM_create(numDisparities= num_disparities, blockSize= self.block_size)
+            matcher.setMinDisparity(min_disparity)
+            return matcher
+
+        # Smoothness penalties recommended for single channel input
+        area= self.block_size * self.block_size
+        mode= cv2.STEREO_SGBM_MODE_SGBM_3WAY if self.matcher_name == 'sgbm_3way' else cv2.STEREO_SGBM_MODE_SGBM
+        return cv2.StereoSGBM_create(
+            minDisparity= min_disparity,
+            numDisparities= num_disparities,
+            blockSize= self.block_size,
+            P1= 8 * area,
+            P2= 32 * area,
+            uniquenessRatio= 10,
+            speckleWindowSize= 100,
+            speckleRange= 2,
+            mode= mode
+        )
+
+    def set_calibration(self, K1, D1, K2, D2, R, T, image_size):
+        '''Precompute the rectification maps for a calibrated stereo rig'''
+        R1, R2, P1, P2, Q, roi1, roi2= cv2.stereoRectify(K1, D1, K2, D2, tuple(image_size), R, T, alpha= 0)
+        self.maps= (
+            cv2.initUndistortRectifyMap(K1, D1, R1, P1, tuple(image_size), cv2.CV_16SC2),
+            cv2.initUndistortRectifyMap(K2, D2, R2, P2, tuple(image_size), cv2.CV_16SC2)
+        )
+        self.Q= Q
+
+    @classmethod
+    def from_calibration_file(cls, path, **kwargs):
+        '''Create an engine from an .npz file holding K1, D1, K2, D2, R, T and image_size'''
+        with np.load(path) as data:
+            calibration= {key: data[key] for key in ('K1', 'D1', 'K2', 'D2', 'R', 'T', 'image_size')}
+        calibration['image_size']= tuple(int(v) for v in calibration['image_size'])
+        return cls(calibration= calibration, **kwargs)
+
+    def rectify(self, left, right):
+        '''Remap a raw pair with the cached rectification maps, if any'''
+        if self.maps is None:
+            return left, right
+        (left_x, left_y), (right_x, right_y)= self.maps
+        return (cv2.remap(left, left_x, left_y, cv2.INTER_LINEAR),
+                cv2.remap(right, right_x, right_y, cv2.INTER_LINEAR))
+
+    @staticmethod
+    def _gray(image):
+        if image.ndim == 3:
+            return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return image
+
+    def compute(self, left, right, matcher= None):
+        '''Return the float32 disparity of a pair, in pixels
+
+        Pixels without a valid match hold min_disparity - 1, as in OpenCV.
+        '''
+        left, right= self.rectify(self._gray(left), self._gray(right))
+
+        # The matchers return fixed-point disparities with 4 fractional bits
+        disparity= (matcher or self.matcher).compute(left, right)
+        return disparity.astype(np.float32) * (1 / 16)
+
+    def estimate_disparity_range(self, left, right, margin= 8, max_features= 4000):
+        '''Estimate (min_disparity, num_disparities) of a pair from sparse ORB matches
+
+        Matches must pass a ratio test and lie on the same row, as they do on a
+        rectified pair. Outlying disparities are then dropped with an interquartile
+        fence and the range of the rest, plus a margin, is rounded to the multiple
+        of 16 the matchers need. Returns None when too few matches are found.
+        '''
+        left, right= self.rectify(self._gray(left), self._gray(right))
+        orb= cv2.ORB_create(nfeatures= max_features)
+        keypoints_left, descriptors_left= orb.detectAndCompute(left, None)
+        keypoints_right, descriptors_right= orb.detectAndCompute(right, None)
+        if descriptors_left is None or descriptors_right is None or len(descriptors_right) < 2:
+            return None
+
+        matches= cv2.BFMatcher(cv2.NORM_HAMMING).knnMatch(descriptors_left, descriptors_right, k= 2)
+        matches= [m[0] for m in matches if len(m) == 2 and m[0].distance < 0.75 * m[1].distance]
+        if len(matches) < 10:
+            return None
+        points_left= np.float32([keypoints_left[m.queryIdx].pt for m in matches])
+        points_right= np.float32([keypoints_right[m.trainIdx].pt for m in matches])
+        same_row= np.abs(points_left[:, 1] - points_right[:, 1]) <= 2
+        disparities= points_left[same_row, 0] - points_right[same_row, 0]
+        if len(disparities) < 10:
+            return None
+
+        q1, q3= np.percentile(disparities, [25, 75])
+        fence= 3 * max(q3 - q1, 1.0)
+        disparities= disparities[(disparities >= q1 - fence) & (disparities <= q3 + fence)]
+        return self._disparity_range(disparities.min() - margin, disparities.max() + margin)
+
+    @staticmethod
+    def _disparity_range(low, high):
+        '''Return (min_disparity, num_disparities) covering [low, high], num a multiple of 16'''
+        min_disparity= int(math.floor(low))
+        num_disparities= max(16, int(math.ceil((high - min_disparity + 1) / 16)) * 16)
+        return min_disparity, num_disparities
+
+    def auto_range(self, left, right):
+        '''Set the matcher disparity range from sparse matches on a representative pair'''
+        disparity_range= self.estimate_disparity_range(left, right)
+        if disparity_range is None:
+            print('Warning: Too few matches to estimate the disparity range, keeping the current one.')
+            return
+        self.min_disparity, self.num_disparities= disparity_range
+        self.matcher= self.create_matcher(self.min_disparity, self.num_disparities)
+
+    def compute_coarse_to_fine(self, left, right, scale= 0.25, strips= None, margin= 4, workers= None):
+        '''Return the float32 disparity of a pair, searching only the likely range per strip
+
+        The disparity is first estimated over the full range on the pair downscaled
+        by scale. The full-resolution pair is then split into horizontal strips,
+        each matched on a thread with the disparity range found for it at the
+        coarse level, plus margin pixels on either side. This cuts the search
+        cost, which grows with width x height x num_disparities, on large pairs.
+        '''
+        left, right= self.rectify(self._gray(left), self._gray(right))
+        height, width= left.shape
+        workers= workers or os.cpu_count() or 1
+        # Every strip, without its context rows, is at least one block high, or StereoBM fails
+        strips= max(1, min(strips or 2 * workers, height // self.block_size))
+        invalid= self.min_disparity - 1
+
+        # Coarse disparity over the full range, in full-resolution pixels
+        coarse_range= self._disparity_range(self.min_disparity * scale, (self.min_disparity + self.num_disparities) * scale)
+        coarse_matcher= self.create_matcher(*coarse_range)
+        small_left= cv2.resize(left, None, fx= scale, fy= scale, interpolation= cv2.INTER_AREA)
+        small_right= cv2.resize(right, None, fx= scale, fy= scale, interpolation= cv2.INTER_AREA)
+        coarse= coarse_matcher.compute(small_left, small_right).astype(np.float32) * (1 / 16)
+        coarse_valid= coarse >= coarse_range[0]
+        coarse= cv2.resize(coarse / scale, (width, height), interpolation= cv2.INTER_NEAREST)
+        coarse_valid= cv2.resize(coarse_valid.astype(np.uint8), (width, height), interpolation= cv2.INTER_NEAREST) > 0
+
+        disparity= np.full((height, width), invalid, dtype= np.float32)
+        context= self.block_size // 2 + 1
+
+        def refine(top, bottom):
+            # Disparity range of the strip at the coarse level
+            values= coarse[top:bottom][coarse_valid[top:bottom]]
+            if len(values) == 0:
+                min_disparity, num_disparities= self.min_disparity, self.num_disparities
+            else:
+                low, high= np.percentile(values, [1, 99])
+                low= max(low - margin - 1 / scale, self.min_disparity)
+                high= min(high + margin + 1 / scale, self.min_disparity + self.num_disparities - 1)
+                min_disparity, num_disparities= self._disparity_range(low, high)
+
+            # Match the strip with enough rows of context for the block size
+            context_top, context_bottom= max(top - context, 0), min(bottom + context, height)
+            matcher= self.create_matcher(min_disparity, num_disparities)
+            strip= matcher.compute(left[context_top:context_bottom], right[context_top:context_bottom])
+            strip= strip[top - context_top:bottom - context_top].astype(np.float32) * (1 / 16)
+            strip[strip < min_disparity]= invalid
+            disparity[top:bottom]= strip
+
+        bounds= np.linspace(0, height, strips + 1).astype(int)
+        with ThreadPoolExecutor(max_workers= workers) as pool:
+            for future in [pool.submit(refine, top, bottom) for top, bottom in zip(bounds[:-1], bounds[1:]) if bottom > top]:
+                future.result()
+        return disparity
+
+    def depth(self, disparity):
+        '''Convert a disparity map to metric depth, 0 where the disparity is invalid
+
+        Uses the reprojection matrix of the calibration, or focal_length (pixels)
+        and baseline (in the unit wanted for depth) for already rectified input.
+        '''
+        if self.Q is not None:
+            # Z = Q[2,3] / (Q[3,2] * d + Q[3,3]) from cv2.reprojectImageTo3D
+            numerator, scale, offset= self.Q[2, 3], self.Q[3, 2], self.Q[3, 3]
+        elif self.focal_length is not None and self.baseline is not None:
+            numerator, scale, offset= self.focal_length * self.baseline, 1.0, 0.0
+        else:
+            raise ValueError('Depth needs a calibration or a focal length and a baseline.')
+
+        denominator= scale * disparity + offset
+        valid= (disparity >= self.min_disparity) & (denominator != 0)
+        depth= np.zeros(disparity.shape, dtype= np.float32)
+        np.divide(numerator, denominator, out= depth, where= valid)
+        return np.abs(depth)
+
+    def process_pairs(self, pairs, output= 'disparity'):
+        '''Yield the disparity (or depth with output='depth') of every (left, right) pair'''
+        for left, right in pairs:
+            disparity= self.compute(left, right)
+            yield self.depth(disparity) if output == 'depth' else disparity
+
+    def process_video(self, left_path, right_path= None, output= 'disparity'):
+        '''Yield the disparity or depth of every frame of a stereo video
+
+        The pair comes from two synchronized videos, or from one side-by-side video
+        when right_path is None.
+        '''
+        left_cap= FrameSource(left_path)
+        right_cap= FrameSource(right_path) if right_path is not None else None
+        try:
+            if not left_cap.isOpened() or (right_cap is not None and not right_cap.isOpened()):
+                print('Error: Could not open video.')
+                return
+
+            while True:
+                ret, left= left_cap.read()
+                if not ret:
+                    break
+                if right_cap is None:
+                    # Split the side-by-side frame in two halves
+                    half= left.shape[1] // 2
+                    left, right= left[:, :half], left[:, half:2 * half]
+                else:
+                    ret, right= right_cap.read()
+                    if not ret:
+                        break
+                yield from self.process_pairs([(left, right)], output)
+        finally:
+            left_cap.release()
+            if right_cap is not None:
+                right_cap.release()
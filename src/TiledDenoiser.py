@@ -0,0 +1,66 @@
+# Import necessary libraries and packages
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import os
+import cv2
+
+class TiledDenoiser:
+    '''Non-local means denoising of large images in overlapping tiles on a thread pool
+
+    Every output pixel of non-local means only depends on the pixels within
+    searchWindowSize // 2 + templateWindowSize // 2 of it. Each tile is therefore
+    denoised together with a margin of that width and only its core is written back,
+    which makes the result identical to denoising the whole image at once, with no
+    seams. OpenCV releases the GIL, so the tiles run in parallel on threads, and the
+    working memory is bounded by the tile size times the number of workers.
+    '''
+
+    def __init__(self, h= 10, h_color= 10, template_window= 7, search_window= 21, tile_size= 512, workers= None):
+        self.h= h
+        self.h_color= h_color
+        self.template_window= template_window
+        self.search_window= search_window
+        self.tile_size= tile_size
+        self.workers= workers or os.cpu_count() or 1
+
+        # Width of the context needed around a tile for exact results
+        self.margin= search_window // 2 + template_window // 2
+
+    def _denoise_colored(self, tile):
+        return cv2.fastNlMeansDenoisingColored(tile, None, self.h, self.h_color, self.template_window, self.search_window)
+
+    def _denoise_gray(self, tile):
+        return cv2.fastNlMeansDenoising(tile, None, self.h, self.template_window, self.search_window)
+
+    def _run(self, image, denoise_tile):
+        '''Apply denoise_tile to every tile of the image and assemble the result'''
+        height, width= image.shape[:2]
+        output= np.empty_like(image)
+        margin= self.margin
+
+        def denoise_at(y, x):
+            # Cut the tile together with its margin, clipped to the image
+            y1, x1= min(y + self.tile_size, height), min(x + self.tile_size, width)
+            top, left= max(y - margin, 0), max(x - margin, 0)
+            bottom, right= min(y1 + margin, height), min(x1 + margin, width)
+            denoised= denoise_tile(np.ascontiguousarray(image[top:bottom, left:right]))
+
+            # Keep only the core of the tile
+            output[y:y1, x:x1]= denoised[y - top:y1 - top, x - left:x1 - left]
+
+        origins= [(y, x) for y in range(0, height, self.tile_size) for x in range(0, width, self.tile_size)]
+        if len(origins) == 1:
+            return denoise_tile(image)
+
+        with ThreadPoolExecutor(max_workers= self.workers) as pool:
+            for future in [pool.submit(denoise_at, y, x) for y, x in origins]:
+                future.result()
+        return output
+
+    def denoise_colored(self, image):
+        '''Denoise a BGR image with fastNlMeansDenoisingColored'''
+        return self._run(image, self._denoise_colored)
+
+    def denoise_gray(self, image):
+        '''Denoise a grayscale image with fastNlMeansDenoising'''
+        return self._run(image, self._denoise_gray)
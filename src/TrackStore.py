@@ -0,0 +1,78 @@
+# Import necessary libraries and packages
+import numpy as np
+
+class TrackStore:
+    '''Fixed-capacity store of point tracks backed by preallocated arrays
+
+    Every track occupies one slot and keeps its last `history` positions in a ring
+    shared by all slots: column `head` holds the positions of the current frame.
+    Tracks get increasing integer IDs. Memory use is fixed at construction, however
+    long the video is.
+    '''
+
+    def __init__(self, capacity= 1000, history= 32):
+        self.capacity= capacity
+        self.history= history
+        self.positions= np.zeros((capacity, history, 2), dtype= np.float32)
+        self.ids= np.full(capacity, -1, dtype= np.int64)
+        self.lengths= np.zeros(capacity, dtype= np.int32)
+        self.active= np.zeros(capacity, dtype= bool)
+        self.head= 0
+        self.next_id= 0
+
+    def __len__(self):
+        return int(np.count_nonzero(self.active))
+
+    def slots(self):
+        '''Return the slots of the active tracks'''
+        return np.flatnonzero(self.active)
+
+    def current(self, slots= None):
+        '''Return the IDs and latest positions of the given (default: all active) tracks'''
+        if slots is None:
+            slots= self.slots()
+        return self.ids[slots], self.positions[slots, self.head]
+
+    def advance(self, slots, points):
+        '''Move to the next frame, extending the given tracks and ending all others'''
+        self.active[:]= False
+        self.active[slots]= True
+        self.lengths[~self.active]= 0
+
+        self.head= (self.head + 1) % self.history
+        self.positions[slots, self.head]= points
+        self.lengths[slots]= np.minimum(self.lengths[slots] + 1, self.history)
+
+    def add(self, points):
+        '''Start new tracks at the given positions in the current frame and return their slots
+
+        Points that do not fit in the remaining capacity are dropped.
+        '''
+        slots= np.flatnonzero(~self.active)[:len(points)]
+        count= len(slots)
+        self.positions[slots, self.head]= points[:count]
+        self.ids[slots]= np.arange(self.next_id, self.next_id + count)
+        self.lengths[slots]= 1
+        self.active[slots]= True
+        self.next_id += count
+        return slots
+
+    def segments(self):
+        '''Return every consecutive pair of stored positions of the active tracks
+
+        The result has shape (N, 2, 2), newest point first, ready to be drawn with a
+        single cv2.polylines call.
+        '''
+        slots= self.slots()
+        lengths= self.lengths[slots]
+        segments= []
+        for age in range(1, self.history):
+            alive= slots[lengths > age]
+            if len(alive) == 0:
+                break
+            newer= self.positions[alive, (self.head - age + 1) % self.history]
+            older= self.positions[alive, (self.head - age) % self.history]
+            segments.append(np.stack([newer, older], axis= 1))
+        if not segments:
+            return np.zeros((0, 2, 2), dtype= np.float32)
+        return np.concatenate(segments)
@@ -0,0 +1,141 @@
+# Import necessary libraries and packages
+import numpy as np
+import cv2
+from FrameSource import FrameSource
+from Metrics import Metrics
+from OutputSinks import VideoWriterSink, emit
+from VideoPipeline import video_fps
+
+class VideoDenoising:
+    def __init__(self, video_path, temporal_window= 5, h= 10, h_color= 10, template_window= 7, search_window= 21, metrics= None):
+        self.video_path= video_path
+
+        # Number of frames, centered on the denoised one, fed to fastNlMeansDenoisingMulti
+        if temporal_window < 1 or temporal_window % 2 == 0:
+            raise ValueError('The temporal window must be a positive odd number of frames.')
+        self.temporal_window= temporal_window
+
+        self.h= h
+        self.h_color= h_color
+        self.template_window= template_window
+        self.search_window= search_window
+
+        # Stage timings and frame counters of denoise_video()
+        self.metrics= metrics or Metrics('video_denoising')
+
+    def _denoise(self, ring, index, radius):
+        '''Denoise frame index of the stream using the radius frames on either side of it
+
+        ring holds frame i of the stream at position i % len(ring).
+        '''
+        size= len(ring)
+        frame= ring[index % size]
+        color= frame.ndim == 3
+        with self.metrics.stage('compute'):
+            if radius == 0:
+                if color:
+                    return cv2.fastNlMeansDenoisingColored(frame, None, self.h, self.h_color,
+                                                           self.template_window, self.search_window)
+                return cv2.fastNlMeansDenoising(frame, None, self.h, self.template_window, self.search_window)
+
+            window= [ring[(index + offset) % size] for offset in range(-radius, radius + 1)]
+            if color:
+                return cv2.fastNlMeansDenoisingColoredMulti(window, radius, 2 * radius + 1, None, self.h, self.h_color,
+                                                            self.template_window, self.search_window)
+            return cv2.fastNlMeansDenoisingMulti(window, radius, 2 * radius + 1, None, self.h,
+                                                 self.template_window, self.search_window)
+
+    def denoise_stream(self, frames):
+        '''Denoise an iterable of frames over a sliding temporal window, yielding them in order
+
+        The last temporal_window frames are copied into a ring of buffers allocated
+        with the first frames, as frame sources may reuse theirs, so every frame is
+        read once and no frame is allocated after the first window. The window
+        shrinks symmetrically at the start and end of the stream.
+        '''
+        half= self.temporal_window // 2
+        ring= [None] * self.temporal_window
+        next_out= 0
+        last= -1
+
+        for last, frame in enumerate(frames):
+            slot= last % len(ring)
+            if ring[slot] is None or ring[slot].shape != frame.shape:
+                ring[slot]= frame.copy()
+            else:
+                np.copyto(ring[slot], frame)
+
+            # Emit every frame whose window is now complete
+            while True:
+                radius= min(half, next_out)
+                if next_out + radius > last:
+                    break
+                yield self._denoise(ring, next_out, radius)
+                next_out += 1
+
+        # Emit the frames at the end of the stream with shrinking windows
+        while next_out <= last:
+            radius= min(half, next_out, last - next_out)
+            yield self._denoise(ring, next_out, radius)
+            next_out += 1
+
+    def _timed_frames(self, cap):
+        '''Yield the frames of a capture, timing the reads as the decode stage'''
+        while True:
+            with self.metrics.stage('decode'):
+                ret, frame= cap.read()
+            if not ret:
+                return
+            yield frame
+
+    def stream(self, sinks= ()):
+        '''Yield (index, denoised frame) for every frame of the video, writing the denoised frames to the sinks that want them
+
+        Frames come out temporal_window // 2 frames after they are read. Raises
+        OSError if the video cannot be opened.
+        '''
+        # Read the video, decoding frames ahead on a background thread
+        cap= FrameSource(self.video_path)
+        if not cap.isOpened():
+            raise OSError(f'Could not open video {self.video_path}.')
+
+        metrics= self.metrics
+        try:
+            with metrics.run():
+                for index, denoised_frame in enumerate(self.denoise_stream(self._timed_frames(cap))):
+                    metrics.count('frames_processed')
+                    running= not sinks or emit(sinks, index, lambda: denoised_frame, metrics)
+                    yield index, denoised_frame
+                    if not running:
+                        break
+                    metrics.tick()
+        finally:
+            cap.release()
+
+    def denoise_video(self, output_path= 'output/video_denoising/denoised.mp4', fourcc= 'mp4v'):
+        '''Denoise the video frame by frame and encode the result on a background thread'''
+
+        frame_count= 0
+        try:
+            fps= video_fps(self.video_path)
+            with VideoWriterSink(output_path, fps= fps, fourcc= fourcc) as sink:
+                for _ in self.stream([sink]):
+                    frame_count += 1
+        except OSError as error:
+            print(f'Error: {error}')
+            return
+
+        print(f'Denoised {frame_count} frames saved at {output_path}')
+
+# Testing the VideoDenoising class
+if __name__ == '__main__':
+    print('Starting video denoising...')
+
+    # Path to the video file
+    video_path= 'data/videoplayback.mp4'
+
+    # Create an object of VideoDenoising
+    video_denoising= VideoDenoising(video_path, temporal_window= 5)
+    video_denoising.denoise_video()
+
+    print('Video denoising completed.')
@@ -0,0 +1,178 @@
+# Import necessary libraries and packages
+import os
+import cv2
+from FrameContext import FrameContext
+from FrameSource import FrameSource
+from Metrics import Metrics
+from OutputSinks import ImageSequenceSink, emit
+
+def video_fps(video_path):
+    '''Return the frame rate of a video, 30 if it is unknown, e.g. for a VideoWriterSink of its frames'''
+    cap= cv2.VideoCapture(video_path)
+    fps= cap.get(cv2.CAP_PROP_FPS) if cap.isOpened() else 0
+    cap.release()
+    return fps or 30.0
+
+def stream_video(analyzer, video_path, sinks= (), reset= True, buffer_size= 8):
+    '''Run an analyzer over a video, yielding (index, result) for every frame with a result
+
+    This is the headless frame loop of the video classes: nothing is drawn, shown or
+    written unless sinks are attached (see OutputSinks). A sink receives the image
+    of analyzer.render(result, frame), or the result itself for analyzers without
+    render(), only for the frames it wants. Frames for which process() returns
+    None, such as the first frame of a sequence, are skipped. The stages and
+    counters are recorded in analyzer.metrics. The stream ends early when a sink
+    asks to stop, and the sinks are left open for the caller to close.
+    '''
+    cap= FrameSource(video_path, buffer_size= buffer_size)
+    if not cap.isOpened():
+        raise OSError(f'Could not open video {video_path}.')
+
+    # Start from a clean state, unless the analyzer was prepared, e.g. warm-started
+    if reset and hasattr(analyzer, 'reset'):
+        analyzer.reset()
+    metrics= analyzer.metrics
+    render= getattr(analyzer, 'render', None)
+
+    try:
+        with metrics.run():
+            index= 0
+            while True:
+                with metrics.stage('decode'):
+                    ret, frame= cap.read()
+                if not ret:
+                    break
+
+                with metrics.stage('compute'):
+                    result= analyzer.process(FrameContext(frame, index, metrics))
+                metrics.count('frames_processed')
+
+                if result is not None:
+                    # Draw the result only for the frames a sink keeps, while the frame buffer is valid
+                    running= not sinks or emit(sinks, index, lambda: result if render is None else render(result, frame), metrics)
+                    yield index, result
+                    if not running:
+                        break
+
+                index += 1
+                metrics.tick()
+    finally:
+        cap.release()
+
+class VideoPipeline:
+    '''Decode a video once and fan every frame out to a set of registered analyzers
+
+    An analyzer is any object with a process(ctx) method taking a FrameContext and
+    returning a result for that frame (or None). If it also has a render(result, frame)
+    method, that is used to turn a result into an image when it is saved.
+    BackgroundSubtraction, DenseOpticalFlow, LucasKanadeOpticalFlow, CamShift,
+    MeanShift and MultiTargetTracker all qualify.
+
+    The time of every analyzer is recorded in metrics as a compute.<name> stage.
+    Drawing done by an analyzer itself is recorded in the analyzer's own metrics.
+    '''
+
+    def __init__(self, video_path, buffer_size= 8, metrics= None):
+        self.video_path= video_path
+        self.buffer_size= buffer_size
+        self.analyzers= {}
+
+        # Stage timings and frame counters of run()
+        self.metrics= metrics or Metrics('pipeline')
+
+    def add(self, name, analyzer):
+        '''Register an analyzer under a name and return the pipeline for chaining'''
+        self.analyzers[name]= analyzer
+        return self
+
+    def run(self, frame_interval= 500, output_dir= 'output/pipeline', callback= None):
+        '''Run every analyzer over the video in a single decoding pass
+
+        Image results are saved every frame_interval frames to output_dir/<name>,
+        encoded on writer threads so the analysis does not wait for the disk.
+        If given, callback(index, results) is called for each frame with a dict
+        of results keyed by analyzer name. Returns the number of frames processed.
+        '''
+
+        # Read the video, decoding frames ahead on a background thread
+        cap= FrameSource(self.video_path, buffer_size= self.buffer_size)
+        if not cap.isOpened():
+            print('Error: Could not open video.')
+            return 0
+
+        # Start every analyzer from a clean state
+        for analyzer in self.analyzers.values():
+            if hasattr(analyzer, 'reset'):
+                analyzer.reset()
+
+        # One image sequence per analyzer for saving frames
+        sinks= {}
+        if frame_interval:
+            sinks= {name: ImageSequenceSink(os.path.join(output_dir, name), every= frame_interval, workers= 2)
+                    for name in self.analyzers}
+
+        frame_count= 0
+        metrics= self.metrics
+        stages= {name: metrics.stage(f'compute.{name}') for name in self.analyzers}
+
+        try:
+            with metrics.run():
+                while True:
+                    with metrics.stage('decode'):
+                        ret, frame= cap.read()
+                    if not ret:
+                        break
+
+                    # Shared per-frame intermediates are computed lazily by the context
+                    ctx= FrameContext(frame, frame_count, metrics)
+                    results= {}
+                    for name, analyzer in self.analyzers.items():
+                        with stages[name]:
+                            results[name]= analyzer.process(ctx)
+                    metrics.count('frames_processed')
+
+                    if callback is not None:
+                        callback(frame_count, results)
+
+                    # Save the image results at specified intervals
+                    for name, sink in sinks.items():
+                        result= results[name]
+                        if result is None:
+                            continue
+
+                        # Analyzers returning raw data render it only when it is emitted
+                        render= getattr(self.analyzers[name], 'render', None)
+                        emit([sink], frame_count, lambda: result if render is None else render(result, frame), metrics)
+
+                    frame_count += 1
+                    metrics.tick()
+        finally:
+            cap.release()
+            for sink in sinks.values():
+                sink.close()
+
+        return frame_count
+
+# Testing the VideoPipeline class
+if __name__ == '__main__':
+    from BackgroundSubtraction import BackgroundSubtraction
+    from CamShift import CamShift
+    from DenseOpticalFlow import DenseOpticalFlow
+    from LucasKanadeOpticalFlow import LucasKanadeOpticalFlow
+    from MeanShift import MeanShift
+
+    print('Starting video pipeline...')
+
+    # Path to the video file
+    video_path= 'data/videoplayback.mp4'
+
+    # Register every analyzer on one pipeline so the video is decoded only once
+    pipeline= VideoPipeline(video_path)
+    pipeline.add('background_subtraction', BackgroundSubtraction())
+    pipeline.add('dense_optical_flow', DenseOpticalFlow())
+    pipeline.add('lucas_kanade_optical_flow', LucasKanadeOpticalFlow())
+    pipeline.add('camshift', CamShift())
+    pipeline.add('meanshift', MeanShift())
+    frame_count= pipeline.run(frame_interval= 5000)
+
+    print(f'Video pipeline completed after {frame_count} frames.')
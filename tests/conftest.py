@@ -0,0 +1,8 @@
+# Import necessary libraries and packages
+import os
+import sys
+
+# The modules are run as scripts from src/, and the test data comes from benchmarks/synthetic.py
+ROOT= os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
@@ -0,0 +1,54 @@
+# Import necessary libraries and packages
+import numpy as np
+import pytest
+
+from BackgroundSubtraction import BackgroundSubtraction
+from FrameContext import FrameContext
+from synthetic import moving_objects
+
+def frames(count):
+    return [frame for frame, _ in moving_objects(160, 120, count, seed= 4)]
+
+def object_mask(boxes, shape):
+    inside= np.zeros(shape, dtype= bool)
+    for x, y, w, h in boxes:
+        inside[y:y + h, x:x + w]= True
+    return inside
+
+@pytest.mark.parametrize('saved_scale, scale', [(1.0, 0.5), (0.5, 1.0), (0.5, 0.5)])
+def test_checkpoint_warm_start_round_trip(tmp_path, saved_scale, scale):
+    clip= list(moving_objects(160, 120, 61, seed= 4))
+    video= [frame for frame, _ in clip]
+    model= BackgroundSubtraction(scale= saved_scale)
+    for index, frame in enumerate(video[:60]):
+        model.process(FrameContext(frame, index))
+    model.save_checkpoint('camera', str(tmp_path))
+
+    background, metadata= BackgroundSubtraction.load_checkpoint('camera', str(tmp_path), scale)
+    assert metadata['frame_width'] == 160 and metadata['frame_height'] == 120
+    assert background.shape == (round(120 * scale), round(160 * scale), 3)
+
+    # A model warm-started from the checkpoint flags the moving objects on the first
+    # frame and little else, where a model that started over would flag nothing
+    warm= BackgroundSubtraction(scale= scale)
+    warm.warm_start(background)
+    mask= warm.process(FrameContext(video[60], 60))
+    inside= object_mask(clip[60][1], mask.shape)
+    assert np.mean(mask[inside] == 255) > 0.5
+    assert np.mean(mask[~inside] == 255) < 0.1
+
+def test_warm_start_rejects_background_of_another_shape(capsys):
+    video= frames(5)
+    model= BackgroundSubtraction()
+    model.warm_start(np.zeros((100, 100, 3), dtype= np.uint8), video)
+    assert 'Error' in capsys.readouterr().out
+
+    # The median of the frames is learned instead
+    assert model.learning_rate > 0
+
+def test_warm_start_reports_background_of_another_size(capsys):
+    video= frames(1)
+    model= BackgroundSubtraction(scale= 0.5)
+    model.warm_start(np.zeros((120, 160, 3), dtype= np.uint8))
+    model.process(FrameContext(video[0], 0))
+    assert 'Error' in capsys.readouterr().out
@@ -0,0 +1,71 @@
+# Import necessary libraries and packages
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+from BackgroundSubtraction import BLOB_DTYPE, BackgroundSubtraction, extract_blobs
+from OutputSinks import RecordSink
+
+def full_mask():
+    '''Return a 320x240 mask with two foreground boxes and a shadow'''
+    mask= np.zeros((240, 320), dtype= np.uint8)
+    mask[40:80, 60:140]= 255
+    mask[160:200, 200:220]= 255
+    mask[100:140, 20:60]= 127
+    return mask
+
+def boxes(blobs):
+    return sorted(zip(blobs['x'].tolist(), blobs['y'].tolist(), blobs['width'].tolist(), blobs['height'].tolist()))
+
+def test_blobs_ignore_shadows():
+    blobs= extract_blobs(full_mask(), frame_index= 7)
+    assert blobs.dtype == BLOB_DTYPE
+    assert boxes(blobs) == [(60, 40, 80, 40), (200, 160, 20, 40)]
+    assert blobs['frame'].tolist() == [7, 7]
+
+@pytest.mark.parametrize('scale', [0.5, 0.25])
+def test_downscaled_blobs_are_in_full_resolution_pixels(scale):
+    mask= full_mask()
+    small= cv2.resize(mask, None, fx= scale, fy= scale, interpolation= cv2.INTER_NEAREST)
+    expected, blobs= extract_blobs(mask), extract_blobs(small, scale= scale)
+
+    assert boxes(blobs) == boxes(expected)
+    order, expected_order= np.argsort(blobs['x']), np.argsort(expected['x'])
+    assert np.allclose(blobs['area'][order], expected['area'][expected_order], rtol= 0.05)
+    assert np.allclose(blobs['cx'][order], expected['cx'][expected_order], atol= 1.0)
+    assert np.allclose(blobs['cy'][order], expected['cy'][expected_order], atol= 1.0)
+
+    # min_area is in full-resolution pixels: only the 80x40 box is larger than 1000
+    assert boxes(extract_blobs(small, min_area= 1000, scale= scale)) == [(60, 40, 80, 40)]
+
+def test_model_blobs_follow_the_frame_width():
+    model= BackgroundSubtraction(scale= 0.5, upsample= False)
+    small= cv2.resize(full_mask(), None, fx= 0.5, fy= 0.5, interpolation= cv2.INTER_NEAREST)
+    assert boxes(model.blobs(small, 0, 320)) == boxes(extract_blobs(full_mask()))
+
+def test_record_sink_writes_loadable_npy(tmp_path):
+    path= str(tmp_path / 'events' / 'blobs.npy')
+    first, second= extract_blobs(full_mask(), 0), extract_blobs(full_mask(), 1)
+    with RecordSink(path, BLOB_DTYPE) as sink:
+        sink.write(first)
+        sink.write(extract_blobs(np.zeros((8, 8), dtype= np.uint8), 2))
+        sink.write(second)
+    assert sink.records_written == 4
+
+    records= np.load(path)
+    assert records.dtype == BLOB_DTYPE
+    assert np.array_equal(records, np.concatenate([first, second]))
+    assert not (tmp_path / 'events' / 'blobs.npy.tmp').exists()
+
+def test_record_sink_writes_empty_npy_and_jsonl(tmp_path):
+    with RecordSink(str(tmp_path / 'empty.npy'), BLOB_DTYPE):
+        pass
+    empty= np.load(tmp_path / 'empty.npy')
+    assert empty.dtype == BLOB_DTYPE and len(empty) == 0
+
+    with RecordSink(str(tmp_path / 'blobs.jsonl'), BLOB_DTYPE) as sink:
+        sink.write(extract_blobs(full_mask(), 3))
+    lines= [json.loads(line) for line in (tmp_path / 'blobs.jsonl').read_text().splitlines()]
+    assert [(line['frame'], line['x'], line['width']) for line in lines] == [(3, 60, 80), (3, 200, 20)]
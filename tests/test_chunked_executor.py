@@ -0,0 +1,88 @@
+# Import necessary libraries and packages
+import functools
+import cv2
+import numpy as np
+import pytest
+
+from ChunkedExecutor import ChunkedExecutor
+from DenseOpticalFlow import DenseOpticalFlow
+from FrameContext import FrameContext
+from FrameSource import FrameSource
+from MultiTargetTracker import MultiTargetTracker
+from OutputSinks import Sink
+from synthetic import moving_objects, write_video
+
+@pytest.fixture(scope= 'module')
+def video_path(tmp_path_factory):
+    path= str(tmp_path_factory.mktemp('video') / 'moving_objects.avi')
+    return write_video(path, moving_objects(160, 120, 24, seed= 2))
+
+def test_chunks_cover_the_video(video_path):
+    chunks= ChunkedExecutor(video_path, DenseOpticalFlow, workers= 2, chunk_size= 7).chunks()
+    assert chunks == [(0, 7), (7, 14), (14, 21), (21, None)]
+
+def test_chunked_flow_matches_sequential_run(video_path):
+    analyzer= DenseOpticalFlow()
+    with FrameSource(video_path) as source:
+        expected= [analyzer.process(FrameContext(frame, index)) for index, frame in enumerate(source)]
+
+    results= list(ChunkedExecutor(video_path, DenseOpticalFlow, workers= 2, chunk_size= 7).run())
+    assert [index for index, _ in results] == list(range(len(expected)))
+    assert results[0][1] is None and expected[0] is None
+    for (_, flow), reference in zip(results[1:], expected[1:]):
+        assert np.array_equal(flow, reference)
+
+class RecordingSink(Sink):
+    '''Keep the index of every image written to the sink'''
+
+    def __init__(self, every= 1):
+        super().__init__(every)
+        self.indices= []
+
+    def write(self, image, index):
+        self.indices.append(index)
+        return True
+
+def moving_target(frames= 24):
+    '''Yield (frame, center) of an orange box moving right and down by two pixels a frame'''
+    hsv= np.dstack([np.full((30, 40), 15, np.uint8), np.full((30, 40), 230, np.uint8), np.full((30, 40), 200, np.uint8)])
+    target= cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+    for index in range(frames):
+        frame= np.full((240, 320, 3), 100, dtype= np.uint8)
+        x, y= 20 + 2 * index, 20 + index
+        frame[y:y + 30, x:x + 40]= target
+        yield frame, (x + 20, y + 15)
+
+@pytest.fixture(scope= 'module')
+def target_video(tmp_path_factory):
+    path= str(tmp_path_factory.mktemp('video') / 'moving_target.avi')
+    return write_video(path, moving_target())
+
+def test_stream_yields_chunked_tracking_in_order_and_feeds_sinks_once(target_video):
+    centers= [center for _, center in moving_target()]
+    factory= functools.partial(MultiTargetTracker, windows= [(20, 20, 40, 30)], method= 'meanshift')
+    executor= ChunkedExecutor(target_video, factory, workers= 2, chunk_size= 7)
+    assert len(executor.chunks()) > 2
+
+    sink, sparse_sink= RecordingSink(), RecordingSink(every= 5)
+    results= list(executor.stream([sink, sparse_sink]))
+
+    # The first frame only sets up the window, every later frame follows across the chunk boundaries
+    assert [index for index, _ in results] == list(range(1, len(centers)))
+    assert sink.indices == list(range(1, len(centers)))
+    assert sparse_sink.indices == [5, 10, 15, 20]
+    assert executor.metrics.counters['frames_processed'] == len(centers)
+    assert executor.metrics.counters['frames_saved'] == len(sink.indices) + len(sparse_sink.indices)
+    for index, result in results:
+        x, y, w, h= result.boxes[0]
+        assert not result.lost[0]
+        assert abs(x + w / 2 - centers[index][0]) <= 4 and abs(y + h / 2 - centers[index][1]) <= 4
+
+    # The chunked run matches the sequential stream of the tracker
+    sequential_sink= RecordingSink()
+    tracker= MultiTargetTracker(target_video, windows= [(20, 20, 40, 30)], method= 'meanshift')
+    sequential= list(tracker.stream([sequential_sink]))
+    assert [index for index, _ in sequential] == [index for index, _ in results]
+    assert sequential_sink.indices == sink.indices
+    for (_, expected), (_, result) in zip(sequential, results):
+        assert np.abs(expected.boxes.astype(int) - result.boxes.astype(int)).max() <= 2
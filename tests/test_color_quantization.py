@@ -0,0 +1,40 @@
+# Import necessary libraries and packages
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from ColorQuantization import apply_palette, fit_palette, sample_pixels
+from ColorQuantizationBatch import quantize_directory, quantize_file
+from synthetic import noisy_image
+
+@pytest.mark.parametrize('method', ['kmeans', 'minibatch'])
+def test_fit_palette_clamps_k_to_pixel_count(method):
+    pixels= np.array([[0, 0, 255], [255, 0, 0]], dtype= np.uint8)
+    centers= fit_palette(pixels, 8, method, rng= 0)
+    assert len(centers) == 2
+    assert np.array_equal(apply_palette(pixels.reshape(1, 2, 3), centers), pixels.reshape(1, 2, 3))
+
+def test_sample_pixels_keeps_small_images_uint8():
+    image= noisy_image(20, 10)
+    assert sample_pixels(image, 1000).dtype == np.uint8
+    assert sample_pixels(image, 50, rng= 0).shape == (50, 3)
+
+def test_quantize_file_returns_errors(tmp_path):
+    path= str(tmp_path / 'image.png')
+    cv2.imwrite(path, noisy_image(32, 24))
+    assert quantize_file(str(tmp_path / 'missing.png'), str(tmp_path / 'out.png'))[1] is not None
+    assert quantize_file(path, str(tmp_path / 'out.png'), method= 'unknown')[1] is not None
+
+def test_quantize_directory_reports_bad_images(tmp_path):
+    input_dir, output_dir= tmp_path / 'input', tmp_path / 'output'
+    os.makedirs(input_dir / 'nested')
+    cv2.imwrite(str(input_dir / 'large.png'), noisy_image(64, 48))
+    cv2.imwrite(str(input_dir / 'nested' / 'tiny.png'), noisy_image(2, 2))
+    (input_dir / 'broken.jpg').write_bytes(b'not an image')
+
+    written, errors= quantize_directory(str(input_dir), str(output_dir), k= 8, workers= 2)
+    assert written == 2
+    assert [os.path.basename(path) for path, _ in errors] == ['broken.jpg']
+    assert os.path.exists(output_dir / 'nested' / 'tiny.png')
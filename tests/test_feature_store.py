@@ -0,0 +1,56 @@
+# Import necessary libraries and packages
+import cv2
+import numpy as np
+import pytest
+
+from EpipolarGeometry import EpipolarGeometry
+from FeatureStore import FeatureStore
+from ImageFiles import find_images
+from synthetic import noisy_image, stereo_pair
+
+@pytest.mark.parametrize('detector, dtype', [('orb', np.uint8), ('sift', np.float32)])
+def test_empty_descriptors_match_detector_dtype(tmp_path, detector, dtype):
+    store= FeatureStore(str(tmp_path), detector)
+    keypoints, descriptors= store.features(np.full((64, 64), 128, dtype= np.uint8))
+    assert len(keypoints) == 0
+    assert descriptors.dtype == dtype and descriptors.shape == (0, store.detector.descriptorSize())
+
+def test_features_are_cached(tmp_path):
+    store= FeatureStore(str(tmp_path), 'orb')
+    image= noisy_image(200, 150, seed= 3)
+    keypoints, descriptors= store.features(image)
+    assert len(keypoints) > 0 and descriptors.dtype == np.uint8
+
+    cached_keypoints, cached_descriptors= FeatureStore(str(tmp_path), 'orb').load(store.key(image))
+    assert np.array_equal(cached_keypoints, keypoints) and np.array_equal(cached_descriptors, descriptors)
+
+def test_find_images_lists_images_in_sorted_order(tmp_path):
+    (tmp_path / 'b').mkdir()
+    for name in ('b/2.JPG', 'a.png', 'notes.txt', 'b/1.tif'):
+        (tmp_path / name).write_bytes(b'')
+    assert list(find_images(str(tmp_path))) == ['a.png', 'b/1.tif', 'b/2.JPG']
+
+def test_epipolar_geometry_decodes_each_image_once_with_a_store(tmp_path, monkeypatch):
+    left, right, _= stereo_pair(320, 240, seed= 4)
+    paths= [str(tmp_path / 'left.png'), str(tmp_path / 'right.png')]
+    for path, image in zip(paths, (left, right)):
+        cv2.imwrite(path, image)
+
+    reads= []
+    imread= cv2.imread
+    def counting_imread(*args, **kwargs):
+        reads.append(args[0])
+        return imread(*args, **kwargs)
+    monkeypatch.setattr(cv2, 'imread', counting_imread)
+
+    store= FeatureStore(str(tmp_path / 'store'), 'sift')
+    result= EpipolarGeometry(*paths, store= store).detect()
+    assert sorted(reads) == sorted(paths)
+    assert len(result.query_idx) > 0
+
+    # The features are cached under the keys of the files, shared with match_pairs
+    assert all(store.load(store.key(path)) is not None for path in paths)
+    reads.clear()
+    cached= EpipolarGeometry(*paths, store= store).detect()
+    assert sorted(reads) == sorted(paths)
+    assert abs(len(cached.query_idx) - len(result.query_idx)) < 0.05 * len(result.query_idx)
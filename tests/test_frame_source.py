@@ -0,0 +1,98 @@
+# Import necessary libraries and packages
+import cv2
+import numpy as np
+import pytest
+
+import FrameSource as frame_source
+from FrameSource import FrameSource
+from synthetic import write_video
+
+@pytest.fixture(scope= 'module')
+def video_path(tmp_path_factory):
+    # Flat frames of increasing brightness, so every frame is told apart by its value
+    frames= [np.full((48, 64, 3), 10 * index, dtype= np.uint8) for index in range(12)]
+    return write_video(str(tmp_path_factory.mktemp('video') / 'clip.avi'), frames)
+
+def decode_all(video_path):
+    '''Return every frame decoded by a plain cv2.VideoCapture'''
+    cap= cv2.VideoCapture(video_path)
+    frames= []
+    while True:
+        ret, frame= cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+def test_reads_every_frame_then_reports_end_of_stream(video_path):
+    expected= decode_all(video_path)
+    with FrameSource(video_path) as source:
+        frames= [frame.copy() for frame in source]
+        assert source.read() == (False, None)
+    assert len(frames) == len(expected) == 12
+    assert all(np.array_equal(frame, reference) for frame, reference in zip(frames, expected))
+
+def test_start_and_stop_select_a_frame_range(video_path):
+    expected= decode_all(video_path)
+    with FrameSource(video_path, start= 4, stop= 9) as source:
+        frames= [frame.copy() for frame in source]
+    assert len(frames) == 5
+    assert all(np.array_equal(frame, reference) for frame, reference in zip(frames, expected[4:9]))
+
+    with FrameSource(video_path, start= 5, stop= 5) as source:
+        assert source.read() == (False, None)
+
+def test_minimum_ring_reuses_two_buffers(video_path):
+    expected= decode_all(video_path)
+    with FrameSource(video_path, buffer_size= 1) as source:
+        assert source.buffer_size == 2
+        frames= list(source)
+        buffers= {id(buffer) for buffer in source._buffers}
+
+    # Every frame is decoded in place into one of the two ring buffers, in turn
+    assert {id(frame) for frame in frames} == buffers and len(buffers) == 2
+    assert all(frame is not following for frame, following in zip(frames, frames[1:]))
+    assert np.array_equal(frames[-1], expected[-1])
+
+def test_decoder_errors_are_raised_in_the_consumer(monkeypatch, video_path):
+    class FailingCapture:
+        '''Capture whose second read fails, as a broken decoder would'''
+
+        def __init__(self, path):
+            self.reads= 0
+
+        def isOpened(self):
+            return True
+
+        def read(self, image= None):
+            self.reads += 1
+            if self.reads > 1:
+                raise cv2.error('decoder failed')
+            return True, np.zeros((4, 4, 3), dtype= np.uint8)
+
+        def release(self):
+            pass
+
+    monkeypatch.setattr(frame_source.cv2, 'VideoCapture', FailingCapture)
+    with FrameSource(video_path) as source:
+        assert source.read()[0]
+        with pytest.raises(RuntimeError):
+            source.read()
+        assert source.read() == (False, None)
+
+def test_release_joins_the_blocked_decoder(video_path):
+    source= FrameSource(video_path, buffer_size= 2)
+    assert source.read()[0]
+    thread= source._thread
+
+    # The decoder is blocked waiting for the buffer the consumer still holds
+    source.release()
+    assert not thread.is_alive()
+    assert not source.isOpened() and source.read() == (False, None)
+
+def test_unopened_video_yields_no_frame(tmp_path):
+    source= FrameSource(str(tmp_path / 'missing.avi'))
+    assert not source.isOpened()
+    assert source.read() == (False, None)
+    source.release()
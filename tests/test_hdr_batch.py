@@ -0,0 +1,67 @@
+# Import necessary libraries and packages
+from concurrent.futures import ThreadPoolExecutor
+import os
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import HDRBatch as hdr_batch
+from HDRBatch import estimate_bracket_memory, merge_tiled, process_brackets
+from HDRPipeline import HDRPipeline, read_bracket
+from synthetic import exposure_bracket, write_bracket
+
+@pytest.fixture(scope= 'module')
+def bracket(tmp_path_factory):
+    images, exposure_times, _= exposure_bracket(640, 480, seed= 1)
+    return write_bracket(str(tmp_path_factory.mktemp('brackets') / 'scene'), images, exposure_times)
+
+@pytest.mark.parametrize('align', [True, False])
+@pytest.mark.parametrize('tile_rows', [64, 100])
+def test_tiled_merge_matches_in_memory_merge(bracket, align, tile_rows):
+    pipeline= HDRPipeline(align= align)
+    expected= pipeline.process_directory(bracket)
+    image_files, exposure_times= read_bracket(bracket)
+    merged= merge_tiled(image_files, exposure_times, pipeline, tile_rows= tile_rows)
+
+    difference= np.abs(merged.astype(np.int16) - expected.astype(np.int16))
+    assert merged.shape == expected.shape and merged.dtype == np.uint8
+    assert difference.max() <= 2 and difference.mean() < 0.01
+
+def test_tiled_merge_stays_within_its_memory_estimate(bracket):
+    image_files, exposure_times= read_bracket(bracket)
+    tracemalloc.start()
+    try:
+        merge_tiled(image_files, exposure_times, HDRPipeline(), tile_rows= 64)
+        _, peak= tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # The exposures and the radiance map live in memory-mapped scratch files
+    assert peak < estimate_bracket_memory(bracket, tiled= True, tile_rows= 64)
+    assert peak < estimate_bracket_memory(bracket) / 3
+
+def test_memory_cap_limits_the_workers(monkeypatch, tmp_path, bracket):
+    pools= []
+
+    class RecordingPool(ThreadPoolExecutor):
+        def __init__(self, max_workers= None):
+            super().__init__(max_workers)
+            pools.append(max_workers)
+
+    # Two brackets, with room for only one merge at a time
+    root= tmp_path / 'root'
+    for name in ('a', 'b'):
+        images, exposure_times, _= exposure_bracket(160, 120, seed= len(name))
+        write_bracket(str(root / name), images, exposure_times)
+    per_bracket= estimate_bracket_memory(str(root / 'a'), tiled= True, tile_rows= 32)
+
+    monkeypatch.setattr(hdr_batch, 'ProcessPoolExecutor', RecordingPool)
+    written, errors= process_brackets(str(root), str(tmp_path / 'output'), workers= 4, max_memory= int(per_bracket * 1.5),
+                                      tiled= True, tile_rows= 32)
+    assert (written, errors) == (2, [])
+    assert pools == [1]
+    assert sorted(os.listdir(tmp_path / 'output')) == ['a.png', 'b.png']
+
+    process_brackets(str(root), str(tmp_path / 'output'), workers= 4, max_memory= per_bracket * 3, tiled= True, tile_rows= 32)
+    assert pools == [1, 3]
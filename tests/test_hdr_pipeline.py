@@ -0,0 +1,26 @@
+# Import necessary libraries and packages
+import cv2
+import pytest
+
+from HDRPipeline import HDRPipeline
+from synthetic import exposure_bracket
+
+def expected_shifts(shifts, reference):
+    '''Return the shifts aligning every exposure of exposure_bracket to the reference'''
+    return [(shifts[reference][0] - dx, shifts[reference][1] - dy) for dx, dy in shifts]
+
+def estimate(width, height, seed, align_scale):
+    images, _, shifts= exposure_bracket(width, height, max_shift= 2, seed= seed)
+    estimated= HDRPipeline(align_scale= align_scale).estimate_shifts([cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) for image in images])
+    return estimated, expected_shifts(shifts, estimated.index((0, 0)))
+
+@pytest.mark.parametrize('align_scale', [1.0, 0.5, 0.25])
+def test_estimate_shifts_recovers_known_shifts(align_scale):
+    estimated, expected= estimate(1024, 768, 3, align_scale)
+    assert estimated == expected
+
+@pytest.mark.parametrize('seed', range(8))
+def test_estimate_shifts_stays_close_at_default_scale(seed):
+    # MTB itself misses some exposures by a pixel or two, but not by several
+    estimated, expected= estimate(1024, 768, seed, 0.25)
+    assert all(abs(a[0] - b[0]) <= 2 and abs(a[1] - b[1]) <= 2 for a, b in zip(estimated, expected))
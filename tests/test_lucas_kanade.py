@@ -0,0 +1,75 @@
+# Import necessary libraries and packages
+import numpy as np
+import pytest
+
+from FrameContext import FrameContext
+from LucasKanadeOpticalFlow import LucasKanadeOpticalFlow
+from synthetic import texture
+
+@pytest.fixture(scope= 'module')
+def frames():
+    '''Return a texture and the texture moved by (2, 1), by (4, 2) with its left half replaced, and by (4, 2)'''
+    rng= np.random.default_rng(0)
+    base= texture(240, 320, rng, scale= 3)
+    other= texture(240, 320, rng, scale= 3)
+    occluded= np.roll(base, (2, 4), axis= (0, 1))
+    occluded[:, :160]= other[:, :160]
+    return base, np.roll(base, (1, 2), axis= (0, 1)), occluded, np.roll(base, (2, 4), axis= (0, 1))
+
+def track(frames, **kwargs):
+    '''Run a tracker that only re-seeds when points are lost, returning its results'''
+    tracker= LucasKanadeOpticalFlow(max_corners= 100, redetect_interval= 1000, **kwargs)
+    return tracker, [tracker.process(FrameContext(frame, index)) for index, frame in enumerate(frames)]
+
+def moves(before, after):
+    '''Return the displacement of every track present in both results, by id'''
+    previous= dict(zip(before.ids.tolist(), before.points))
+    return {i: point - previous[i] for i, point in zip(after.ids.tolist(), after.points) if i in previous}
+
+def test_translated_points_are_tracked_without_reseeding(frames):
+    base, moved, _, moved_twice= frames
+    _, (first, once, twice)= track([base, moved, moved_twice])
+    assert first is None
+
+    # Every point follows the texture, so no track is lost and none is added
+    assert len(once.ids) == len(twice.ids) == 100 and twice.ids.max() == 99
+    steps= moves(once, twice)
+    assert len(steps) == 100 and all(np.abs(step - (2, 1)).max() < 0.5 for step in steps.values())
+
+def test_forward_backward_check_rejects_lost_points(frames):
+    def wrong_tracks(results):
+        return sum(np.abs(step - (2, 1)).max() > 1 for step in moves(results[1], results[2]).values())
+
+    _, checked= track(frames[:3])
+    _, unchecked= track(frames[:3], fb_threshold= np.inf)
+    _, strict= track(frames[:3], fb_threshold= 0)
+
+    # Points on the replaced half jump to wrong matches unless the check drops them
+    assert wrong_tracks(checked) < wrong_tracks(unchecked) / 2
+    assert len(moves(checked[1], checked[2])) >= 0.9 * (len(moves(unchecked[1], unchecked[2])) - wrong_tracks(unchecked))
+    assert len(moves(strict[1], strict[2])) == 0
+
+def test_lost_points_are_reseeded_away_from_live_points(frames):
+    tracker, (_, _, occluded)= track(frames[:3])
+
+    # Fewer than 0.8 * max_corners points survived the occlusion, so new corners were found
+    survivors= occluded.ids < 100
+    assert survivors.sum() < 80
+    assert (~survivors).sum() > 0 and len(occluded.ids) > 80
+
+    # New corners keep minDistance from the points already tracked
+    radius= tracker.feature_params['minDistance']
+    new, old= occluded.points[~survivors], occluded.points[survivors]
+    distances= np.sqrt(((new[:, None] - old[None]) ** 2).sum(axis= 2))
+    assert distances.min() >= radius
+
+def test_resume_gives_every_chunk_its_own_ids(frames):
+    ids= []
+    for chunk_index in (1, 2):
+        tracker= LucasKanadeOpticalFlow(max_corners= 50)
+        tracker.resume(None, chunk_index)
+        tracker.process(FrameContext(frames[0], 0))
+        result= tracker.process(FrameContext(frames[1], 1))
+        assert np.all((result.ids >= chunk_index << 32) & (result.ids < (chunk_index + 1) << 32))
+        ids.append(set(result.ids.tolist()))
+    assert not ids[0] & ids[1]
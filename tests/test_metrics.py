@@ -0,0 +1,80 @@
+# Import necessary libraries and packages
+import json
+import re
+import time
+
+from Metrics import Metrics
+
+# One sample of the Prometheus text format: name{labels} value
+SAMPLE= re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)\{((?:[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*",?)*)\} (\S+)$')
+
+def test_nested_stages_record_exclusive_time():
+    metrics= Metrics('test')
+    inner_metrics= Metrics('inner')
+    for _ in range(2):
+        with metrics.stage('compute'):
+            time.sleep(0.01)
+            with metrics.stage('convert'):
+                time.sleep(0.03)
+            # A stage of another Metrics object is subtracted as well
+            with inner_metrics.stage('decode'):
+                time.sleep(0.03)
+
+    compute= metrics.histograms['compute']
+    convert= metrics.histograms['convert']
+    assert compute.count == convert.count == 2
+    assert 0.02 <= compute.sum < 0.06
+    assert 0.06 <= convert.sum < 0.1
+    assert 0.06 <= inner_metrics.histograms['decode'].sum < 0.1
+
+def test_export_writes_well_formed_prometheus_text(tmp_path):
+    metrics= Metrics('pipe "a"', export_path= str(tmp_path / 'metrics' / 'run'))
+    with metrics.run():
+        for seconds in (0.00005, 0.003, 0.003, 20.0):
+            metrics.observe('compute', seconds)
+        metrics.observe('decode', 0.001)
+        metrics.count('frames_processed', 4)
+        metrics.gauge('queue_depth', 2)
+
+    assert json.loads((tmp_path / 'metrics' / 'run.json').read_text())['counters'] == {'frames_processed': 4}
+    lines= (tmp_path / 'metrics' / 'run.prom').read_text().splitlines()
+
+    # Every sample belongs to a family declared by a TYPE line before it
+    types= {}
+    buckets= {}
+    counts= {}
+    for line in lines:
+        if line.startswith('# TYPE '):
+            _, _, family, kind= line.split(' ')
+            assert kind in ('histogram', 'counter', 'gauge')
+            types[family]= kind
+            continue
+        if line.startswith('# HELP '):
+            continue
+        match= SAMPLE.match(line)
+        assert match, line
+        name, labels, value= match.groups()
+        float(value)
+        family= name if name in types else re.sub(r'_(bucket|sum|count)$', '', name)
+        assert family in types, line
+        assert 'pipeline="pipe \\"a\\""' in labels
+
+        stage= re.search(r'stage="(\w+)"', labels)
+        if name.endswith('_bucket'):
+            bound= re.search(r'le="([^"]+)"', labels).group(1)
+            buckets.setdefault(stage.group(1), []).append((float(bound), int(value)))
+        elif name.endswith('_stage_seconds_count'):
+            counts[stage.group(1)]= int(value)
+
+    assert types['opencv_pipeline_stage_seconds'] == 'histogram'
+    assert types['opencv_pipeline_frames_processed_total'] == 'counter'
+    assert types['opencv_pipeline_queue_depth'] == 'gauge'
+
+    # Cumulative buckets, ending with +Inf at the count
+    assert counts == {'compute': 4, 'decode': 1}
+    for stage, values in buckets.items():
+        bounds= [bound for bound, _ in values]
+        assert bounds == sorted(bounds) and bounds[-1] == float('inf')
+        assert [count for _, count in values] == sorted(count for _, count in values)
+        assert values[-1][1] == counts[stage]
+    assert dict(buckets['compute'])[0.0001] == 1 and dict(buckets['compute'])[10.0] == 3
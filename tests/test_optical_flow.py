@@ -0,0 +1,55 @@
+# Import necessary libraries and packages
+import cv2
+import numpy as np
+
+from DenseOpticalFlow import flow_to_color
+from OpticalFlowEngine import OpticalFlowEngine
+from synthetic import moving_objects, texture
+
+def gray_frames(count):
+    return [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame, _ in moving_objects(160, 120, count, seed= 1)]
+
+def test_default_engine_matches_farneback():
+    frames= gray_frames(4)
+    engine= OpticalFlowEngine()
+    for prev, next in zip(frames, frames[1:]):
+        expected= cv2.calcOpticalFlowFarneback(prev, next, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+        assert np.array_equal(engine.compute(prev, next), expected)
+
+def test_flow_to_color_shows_direction_and_magnitude():
+    flow= np.zeros((2, 3, 2), dtype= np.float32)
+    flow[0, 1]= (4, 0)
+    flow[0, 2]= (-4, 0)
+    flow[1, 0]= (2, 0)
+    color= flow_to_color(flow)
+
+    assert color.shape == (2, 3, 3) and color.dtype == np.uint8
+    assert not color[1, 1].any()
+    hsv= cv2.cvtColor(color, cv2.COLOR_BGR2HSV).astype(int)
+    assert abs(hsv[0, 1, 2] - 255) <= 2 and abs(hsv[1, 0, 2] - 128) <= 3
+    assert abs(abs(hsv[0, 1, 0] - hsv[0, 2, 0]) - 90) <= 2
+
+def test_flow_to_color_tells_horizontal_from_vertical_flow():
+    flow= np.zeros((1, 4, 2), dtype= np.float32)
+    flow[0, 0]= (4, 0)
+    flow[0, 1]= (0, 4)
+    flow[0, 2]= (-4, 0)
+    flow[0, 3]= (0, -4)
+    hue= cv2.cvtColor(flow_to_color(flow), cv2.COLOR_BGR2HSV)[0, :, 0].astype(int)
+
+    # Hue is half the direction in degrees, with y pointing down
+    for actual, expected in zip(hue, (0, 45, 90, 135)):
+        assert min(abs(actual - expected), 180 - abs(actual - expected)) <= 2
+
+def test_dis_warm_start_is_on_by_default_and_lowers_the_error():
+    # A texture panned by (3, 2) pixels a frame, so the flow is (-3, -2) everywhere
+    scene= texture(400, 520, np.random.default_rng(0), scale= 3, channels= 1).reshape(400, 520)
+    frames= [scene[2 * i:2 * i + 240, 3 * i:3 * i + 320].copy() for i in range(12)]
+
+    assert OpticalFlowEngine('dis').warm_start and not OpticalFlowEngine().warm_start
+    errors= {}
+    for warm_start in (False, True):
+        engine= OpticalFlowEngine('dis', warm_start= warm_start, preset= 'ultrafast')
+        flows= [engine.compute(prev, next) for prev, next in zip(frames, frames[1:])]
+        errors[warm_start]= np.mean([np.linalg.norm(flow[40:-40, 40:-40] + (3, 2), axis= 2).mean() for flow in flows[1:]])
+    assert errors[True] < errors[False]
@@ -0,0 +1,91 @@
+# Import necessary libraries and packages
+import os
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from Metrics import Metrics
+from OutputSinks import ImageSequenceSink, QueuedSink, VideoWriterSink, emit
+
+class GatedSink(QueuedSink):
+    '''Sink whose worker waits for the gate before writing, so the queue fills up'''
+
+    target= 'gated'
+
+    def __init__(self, **kwargs):
+        self.gate= threading.Event()
+        self.started= threading.Event()
+        self.written= []
+        super().__init__(**kwargs)
+
+    def write(self, image, index= 0):
+        return self._submit(index)
+
+    def _write(self, item):
+        self.started.set()
+        self.gate.wait()
+        self.written.append(item)
+        return True
+
+def image(index):
+    return np.full((16, 24, 3), index, dtype= np.uint8)
+
+def test_drop_policy_counts_dropped_images():
+    sink= GatedSink(workers= 1, queue_size= 2, policy= 'drop')
+    metrics= Metrics('test')
+
+    # The worker takes the first image and waits, two more fill the queue and the rest are dropped
+    for index in range(6):
+        emit([sink], index, lambda: image(index), metrics)
+        if index == 0:
+            sink.started.wait()
+    sink.gate.set()
+    sink.close()
+
+    assert sink.written == [0, 1, 2]
+    assert sink.images_dropped == 3
+    assert metrics.counters == {'frames_saved': 3, 'frames_dropped': 3}
+
+def test_block_policy_keeps_every_image():
+    sink= GatedSink(workers= 1, queue_size= 1, policy= 'block')
+    threading.Timer(0.05, sink.gate.set).start()
+    assert all(sink.write(image(index), index) for index in range(5))
+    sink.close()
+    assert sink.written == list(range(5)) and sink.images_dropped == 0
+
+def test_failed_write_raises_on_close():
+    class FailingSink(GatedSink):
+        def _write(self, item):
+            return False
+
+    sink= FailingSink(workers= 1)
+    sink.write(image(0))
+    with pytest.raises(RuntimeError):
+        sink.close()
+
+@pytest.mark.parametrize('workers', [0, 3])
+def test_image_sequence_sink_writes_every_kept_image(tmp_path, workers):
+    sink= ImageSequenceSink(str(tmp_path), every= 2, workers= workers)
+    metrics= Metrics('test')
+    for index in range(10):
+        emit([sink], index, lambda: image(index), metrics)
+    sink.close()
+
+    assert sink.images_written == 5
+    assert sorted(os.listdir(tmp_path)) == [f'frame_{count:04d}.png' for count in range(5)]
+    assert np.array_equal(cv2.imread(str(tmp_path / 'frame_0004.png')), image(8))
+    assert metrics.counters == {'frames_saved': 5}
+
+def test_video_writer_sink_encodes_every_frame(tmp_path):
+    path= str(tmp_path / 'video' / 'out.avi')
+    sink= VideoWriterSink(path, fourcc= 'MJPG', queue_size= 2)
+    for index in range(12):
+        assert sink.write(image(index * 20))
+    sink.close()
+
+    assert sink.frames_written == 12
+    capture= cv2.VideoCapture(path)
+    assert int(capture.get(cv2.CAP_PROP_FRAME_COUNT)) == 12
+    capture.release()
@@ -0,0 +1,31 @@
+# Import necessary libraries and packages
+import numpy as np
+import pytest
+
+from StereoEngine import StereoEngine
+from synthetic import stereo_pair
+
+def bad_pixels(disparity, truth):
+    '''Return the fraction of valid pixels more than one pixel off, away from the borders'''
+    valid= disparity >= 0
+    valid[:20]= valid[-20:]= False
+    valid[:, :40]= valid[:, -20:]= False
+    return np.mean(np.abs(disparity[valid] - truth[valid]) > 1)
+
+@pytest.mark.parametrize('matcher', ['bm', 'sgbm'])
+def test_coarse_to_fine_matches_full_search(matcher):
+    left, right, truth= stereo_pair(640, 480, seed= 1)
+    engine= StereoEngine(matcher, num_disparities= 32)
+    full= engine.compute(left, right)
+    coarse_to_fine= engine.compute_coarse_to_fine(left, right, workers= 4)
+
+    assert bad_pixels(coarse_to_fine, truth) < 0.01
+    assert abs(np.mean(coarse_to_fine >= 0) - np.mean(full >= 0)) < 0.01
+    both= (full >= 0) & (coarse_to_fine >= 0)
+    assert np.mean(np.abs(full[both] - coarse_to_fine[both]) <= 1) > 0.999
+
+def test_coarse_to_fine_clamps_strips_to_block_size():
+    # 40 strips of 3 rows are thinner than the 15 pixel blocks of StereoBM
+    left, right, _= stereo_pair(160, 120, seed= 0)
+    disparity= StereoEngine('bm', num_disparities= 16).compute_coarse_to_fine(left, right, strips= 40, workers= 2)
+    assert disparity.shape == (120, 160)
@@ -0,0 +1,18 @@
+# Import necessary libraries and packages
+import cv2
+import numpy as np
+
+from synthetic import noisy_image
+from TiledDenoiser import TiledDenoiser
+
+def test_tiled_colored_matches_whole_image():
+    image= noisy_image(300, 200, seed= 1)
+    denoiser= TiledDenoiser(tile_size= 64, workers= 4)
+    expected= cv2.fastNlMeansDenoisingColored(image, None, 10, 10, 7, 21)
+    assert np.array_equal(denoiser.denoise_colored(image), expected)
+
+def test_tiled_gray_matches_whole_image():
+    image= cv2.cvtColor(noisy_image(250, 170, seed= 2), cv2.COLOR_BGR2GRAY)
+    denoiser= TiledDenoiser(h= 12, template_window= 5, search_window= 15, tile_size= 48, workers= 3)
+    expected= cv2.fastNlMeansDenoising(image, None, 12, 5, 15)
+    assert np.array_equal(denoiser.denoise_gray(image), expected)
@@ -0,0 +1,41 @@
+# Import necessary libraries and packages
+import cv2
+import numpy as np
+import pytest
+
+from FrameContext import FrameContext
+from MeanShift import MeanShift
+from MultiTargetTracker import MultiTargetTracker
+
+def reappearing_target():
+    '''Yield (frame, position) of an orange box that moves, leaves the frame for five frames and reappears elsewhere'''
+    background= np.full((240, 320, 3), 100, dtype= np.uint8)
+    hsv= np.dstack([np.full((30, 40), 15, np.uint8), np.full((30, 40), 230, np.uint8), np.full((30, 40), 200, np.uint8)])
+    target= cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+    for index in range(30):
+        frame= background.copy()
+        position= (20 + index, 20) if index < 10 else None if index < 15 else (240, 180)
+        if position is not None:
+            x, y= position
+            frame[y:y + 30, x:x + 40]= target
+        yield frame, position
+
+@pytest.mark.parametrize('roi_local', [False, True])
+def test_meanshift_reacquires_lost_target(roi_local):
+    tracker= MeanShift(track_window= (20, 20, 40, 30), roi_local= roi_local)
+    results= [tracker.process(FrameContext(frame, index)) for index, (frame, _) in enumerate(reappearing_target())]
+
+    assert not any(result.lost for result in results[1:10])
+    assert all(result.lost for result in results[10:15])
+    assert not results[-1].lost
+    assert results[-1].window[:2] == (240, 180)
+
+@pytest.mark.parametrize('method', ['meanshift', 'camshift'])
+def test_multi_target_tracker_reacquires_lost_target(method):
+    tracker= MultiTargetTracker(windows= [(20, 20, 40, 30)], method= method)
+    results= [tracker.process(FrameContext(frame, index)) for index, (frame, _) in enumerate(reappearing_target())]
+
+    assert all(result.lost[0] for result in results[10:15])
+    assert not results[-1].lost[0]
+    x, y, w, h= results[-1].boxes[0]
+    assert abs(x + w / 2 - 260) <= 2 and abs(y + h / 2 - 195) <= 2
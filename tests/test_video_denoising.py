@@ -0,0 +1,52 @@
+# Import necessary libraries and packages
+import cv2
+import numpy as np
+import pytest
+
+from synthetic import noisy_image
+from VideoDenoising import VideoDenoising
+
+def clip(count, gray= False):
+    frames= [noisy_image(48, 32, seed= index) for index in range(count)]
+    return [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in frames] if gray else frames
+
+def expected(frames, index, radius, gray):
+    '''Denoise frame index directly with the window of radius frames on either side'''
+    if radius == 0:
+        if gray:
+            return cv2.fastNlMeansDenoising(frames[index], None, 10, 7, 11)
+        return cv2.fastNlMeansDenoisingColored(frames[index], None, 10, 10, 7, 11)
+    window= frames[index - radius:index + radius + 1]
+    if gray:
+        return cv2.fastNlMeansDenoisingMulti(window, radius, 2 * radius + 1, None, 10, 7, 11)
+    return cv2.fastNlMeansDenoisingColoredMulti(window, radius, 2 * radius + 1, None, 10, 10, 7, 11)
+
+@pytest.mark.parametrize('count, temporal_window', [(9, 5), (7, 3), (3, 5), (1, 5), (6, 1)])
+@pytest.mark.parametrize('gray', [False, True])
+def test_stream_shrinks_the_window_at_both_ends(count, temporal_window, gray):
+    frames= clip(count, gray)
+    denoising= VideoDenoising(None, temporal_window= temporal_window, search_window= 11)
+    denoised= list(denoising.denoise_stream(frames))
+
+    half= temporal_window // 2
+    assert len(denoised) == count
+    for index, frame in enumerate(denoised):
+        radius= min(half, index, count - 1 - index)
+        assert np.array_equal(frame, expected(frames, index, radius, gray)), index
+
+def test_stream_copies_reused_frame_buffers():
+    frames= clip(7)
+
+    def reused():
+        # One buffer overwritten for every frame, as in the ring of a FrameSource
+        buffer= np.empty_like(frames[0])
+        for frame in frames:
+            buffer[:]= frame
+            yield buffer
+
+    denoising= VideoDenoising(None, temporal_window= 5, search_window= 11)
+    assert all(np.array_equal(a, b) for a, b in zip(denoising.denoise_stream(reused()), denoising.denoise_stream(frames)))
+
+def test_even_window_is_rejected():
+    with pytest.raises(ValueError):
+        VideoDenoising(None, temporal_window= 4)
@@ -0,0 +1,55 @@
+# Import necessary libraries and packages
+import pytest
+
+from Metrics import Metrics
+import VideoPipeline as video_pipeline
+from synthetic import moving_objects, write_video
+from VideoPipeline import VideoPipeline, stream_video
+
+class RecordingAnalyzer:
+    '''Analyzer recording the contexts it is given and the planes it reads from them'''
+
+    def __init__(self):
+        self.contexts= []
+        self.planes= []
+        self.metrics= Metrics('recording')
+
+    def process(self, ctx):
+        self.contexts.append(ctx)
+        self.planes.append((ctx.gray, ctx.hsv))
+        return None
+
+@pytest.fixture(scope= 'module')
+def video_path(tmp_path_factory):
+    return write_video(str(tmp_path_factory.mktemp('video') / 'clip.avi'), moving_objects(96, 64, 10, seed= 5))
+
+def test_pipeline_decodes_once_and_shares_the_context(monkeypatch, video_path):
+    sources= []
+
+    class CountingSource(video_pipeline.FrameSource):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            sources.append(self)
+
+    monkeypatch.setattr(video_pipeline, 'FrameSource', CountingSource)
+    first, second= RecordingAnalyzer(), RecordingAnalyzer()
+    pipeline= VideoPipeline(video_path).add('first', first).add('second', second)
+    assert pipeline.run(frame_interval= 0) == 10
+
+    # One decoding pass, and both analyzers see the same context of every frame
+    assert len(sources) == 1
+    assert [ctx.index for ctx in first.contexts] == list(range(10))
+    assert all(a is b for a, b in zip(first.contexts, second.contexts))
+    assert all(a[0] is b[0] and a[1] is b[1] for a, b in zip(first.planes, second.planes))
+
+    # The gray and HSV conversions run once per frame, not once per analyzer
+    assert pipeline.metrics.histograms['convert'].count == 2 * 10
+    assert pipeline.metrics.counters['frames_processed'] == 10
+
+def test_unopened_video_is_reported(tmp_path, capsys):
+    path= str(tmp_path / 'missing.avi')
+    assert VideoPipeline(path).add('first', RecordingAnalyzer()).run() == 0
+    assert 'Error' in capsys.readouterr().out
+
+    with pytest.raises(OSError):
+        next(stream_video(RecordingAnalyzer(), path))